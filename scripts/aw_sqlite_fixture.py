@@ -0,0 +1,95 @@
+# Genera una base SQLite con el esquema de aw-server-rust para probar aw_backend="sqlite"
+# sin ActivityWatch instalado.
+#   python scripts/aw_sqlite_fixture.py --out sqlite.db --events 50000
+#   python scripts/aw_sqlite_fixture.py --out sqlite.db --export aw-buckets-export.json
+# Luego en config/settings.json: "aw_backend": "sqlite", "aw_sqlite_path": "<ruta a sqlite.db>"
+from __future__ import annotations
+import sys
+import json
+import socket
+import sqlite3
+import argparse
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from awcollector.aw_sqlite import RUST_SCHEMA, epoch_ns  # noqa: E402
+from awcollector.export import iter_export  # noqa: E402
+
+# Tipo de bucket de cada tipo de evento sintético (bench.synthetic_day)
+TYPES = {"afk": ("aw-watcher-afk", "afkstatus"),
+         "window": ("aw-watcher-window", "currentwindow"),
+         "web": ("aw-watcher-web-chrome", "web.tab.current")}
+
+
+def _ts(value: str) -> datetime:
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def write_database(path: Path, buckets: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Escribe buckets con forma de export ({id: {type, hostname, created, events: [...]}}) en
+    una base nueva. Devuelve el número de eventos insertados.
+    """
+    path.unlink(missing_ok=True)
+    conn = sqlite3.connect(str(path))
+    n = 0
+    try:
+        conn.executescript(RUST_SCHEMA)
+        for bid, meta in buckets.items():
+            cur = conn.execute(
+                "INSERT INTO buckets (name, type, client, hostname, created) VALUES (?, ?, ?, ?, ?)",
+                (bid, meta.get("type", ""), meta.get("client", "fixture"), meta.get("hostname", ""),
+                 meta.get("created") or datetime.now(timezone.utc).isoformat()))
+            row = cur.lastrowid
+            rows = []
+            for ev in meta.get("events", []):
+                ts = _ts(ev["timestamp"])
+                te = ts + timedelta(seconds=float(ev.get("duration") or 0.0))
+                rows.append((row, epoch_ns(ts), epoch_ns(te), json.dumps(ev.get("data") or {}, ensure_ascii=False)))
+            conn.executemany("INSERT INTO events (bucketrow, starttime, endtime, data) VALUES (?, ?, ?, ?)", rows)
+            n += len(rows)
+        conn.commit()
+    finally:
+        conn.close()
+    return n
+
+
+def buckets_from_export(path: Path) -> Dict[str, Dict[str, Any]]:
+    out: Dict[str, Dict[str, Any]] = {}
+    for what, bid, data in iter_export(path):
+        if what == "begin":
+            out[bid] = {**data, "events": []}
+        elif what == "events":
+            out[bid]["events"].extend(data)
+        else:
+            out[bid].update({k: v for k, v in data.items() if k != "events"})
+    return out
+
+
+def synthetic_buckets(n: int) -> Dict[str, Dict[str, Any]]:
+    from bench import synthetic_day
+    host = socket.gethostname()
+    out: Dict[str, Dict[str, Any]] = {}
+    for kind, events in synthetic_day(n).items():
+        prefix, typ = TYPES[kind]
+        out[f"{prefix}_{host}"] = {"type": typ, "hostname": host, "events": events}
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", type=Path, default=Path("sqlite.db"))
+    ap.add_argument("--events", type=int, default=50_000, help="eventos sintéticos (sin --export)")
+    ap.add_argument("--export", type=Path, default=None, help="export JSON de ActivityWatch a convertir")
+    args = ap.parse_args()
+    buckets = buckets_from_export(args.export) if args.export else synthetic_buckets(args.events)
+    n = write_database(args.out, buckets)
+    print(f"{args.out}: {len(buckets)} buckets, {n} eventos")
+
+
+if __name__ == "__main__":
+    main()
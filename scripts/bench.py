@@ -0,0 +1,234 @@
+# Benchmark local del agregado con un día sintético (no requiere ActivityWatch).
+#   python scripts/bench.py --events 200000
+from __future__ import annotations
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from awcollector.config import DEFAULTS  # noqa: E402
+from awcollector.aggregate import US, RangeSummary, SummaryOptions, summary_to_payload  # noqa: E402
+from awcollector.normalize import apply_byte_budget  # noqa: E402
+from awcollector.categories import CategoryEngine, categorize  # noqa: E402
+from awcollector.payload_v2 import decode_v2, downgrade_v1  # noqa: E402
+from awcollector.events import decode_events, msgspec  # noqa: E402
+
+APPS = ["chrome.exe", "code.exe", "excel.exe", "teams.exe", "explorer.exe", "outlook.exe"]
+SITES = ["mail.google.com", "github.com", "app.appfastway.com", "docs.google.com", "x.com"]
+
+
+def synthetic_day(n: int, seed: int = 7):
+    """Eventos window/web/afk con títulos y URLs de alta cardinalidad (contadores, IDs, query)."""
+    rnd = random.Random(seed)
+    t = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    window, web, afk = [], [], []
+    for i in range(n):
+        d = rnd.expovariate(1 / 8.0)
+        app = rnd.choice(APPS)
+        title = rnd.choice([
+            f"({rnd.randint(1, 99)}) Bandeja de entrada - {app}",
+            f"Factura {rnd.randint(1000, 999999)} - Excel",
+            f"{'*' if rnd.random() < 0.3 else ''}informe_{rnd.randint(1, 40)}.docx - Word",
+            f"Reunión {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d} - Teams",
+        ])
+        ts = t.isoformat()
+        window.append({"id": i, "timestamp": ts, "duration": d, "data": {"app": app, "title": title}})
+        if app == "chrome.exe":
+            url = (f"https://{rnd.choice(SITES)}/pedido/{rnd.randint(1, 10**6)}"
+                   f"?utm_source=x&page={rnd.randint(1, 50)}#sec{rnd.randint(1, 9)}")
+            web.append({"id": i, "timestamp": ts, "duration": d, "data": {"url": url, "title": title}})
+        if i % 50 == 0:
+            afk.append({"id": i, "timestamp": ts, "duration": d * 50,
+                        "data": {"status": rnd.choice(["afk", "not-afk", "not-afk"])}})
+        t += timedelta(seconds=d)
+    return {"afk": afk, "window": window, "web": web}
+
+
+def _fold(events, settings, start=None):
+    s = SummaryOptions(settings).new_summary(start or datetime.now(timezone.utc))
+    s.fold_afk(events["afk"])
+    if s.focus is not None:
+        s.focus.clip_to = s.focus.not_afk  # como collect_summary: ventanas recortadas a no-AFK
+    s.fold_window(events["window"])
+    s.fold_web(events["web"])
+    return s
+
+
+def _keys(s: RangeSummary) -> int:
+    return sum(len(c) for c in s.app_titles.values()) + sum(len(c) for c in s.domain_urls.values())
+
+
+def _size(payload) -> int:
+    return len(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def bench_normalize(events, budget: int) -> None:
+    print("== normalización (títulos/URLs) ==")
+    now = datetime.now(timezone.utc)
+    for label, extra in (("crudo", {"normalize_enabled": False}), ("normalizado", {"normalize_enabled": True})):
+        settings = {**DEFAULTS, **extra}
+        t0 = time.perf_counter()
+        s = _fold(events, settings)
+        t1 = time.perf_counter()
+        payload = summary_to_payload(settings, s, now, now, date="bench")
+        print(f"{label:12s} plegado {t1 - t0:7.3f}s  claves {_keys(s):8d}  payload {_size(payload):10d} B")
+    if budget:
+        settings = {**DEFAULTS, "normalize_enabled": False}
+        payload = summary_to_payload(settings, _fold(events, settings), now, now, date="bench")
+        t0 = time.perf_counter()
+        apply_byte_budget(payload, budget)
+        print(f"presupuesto {budget} B → {_size(payload)} B en {time.perf_counter() - t0:.3f}s "
+              f"({payload['meta'].get('trimmed')})")
+
+
+def bench_categories(events) -> None:
+    print("== categorías ==")
+    for label, extra in (("crudo", {"normalize_enabled": False}), ("normalizado", {"normalize_enabled": True})):
+        settings = {**DEFAULTS, **extra}
+        s = _fold(events, settings)
+        engine = CategoryEngine(settings["category_rules"])  # sin memo previo
+        t0 = time.perf_counter()
+        cats = categorize(engine, s.app_titles, s.domain_totals, unit=US)
+        dt = time.perf_counter() - t0
+        print(f"{label:12s} {_keys(s):8d} claves → {len(cats['apps'])} categorías en {dt:.3f}s "
+              f"({len(events['window'])} eventos de ventana)")
+
+
+def bench_timeline(events) -> None:
+    print("== línea de tiempo ==")
+    start = datetime.fromisoformat(events["window"][0]["timestamp"])
+    for label, extra in (("sin timeline", {"timeline_bin_min": 0}), ("por hora", {}),
+                         ("cada 5 min", {"timeline_bin_min": 5})):
+        settings = {**DEFAULTS, **extra}
+        t0 = time.perf_counter()
+        s = _fold(events, settings, start)
+        dt = time.perf_counter() - t0
+        binned = float(s.timeline.active.sum() + s.timeline.afk.sum()) / US if s.timeline else 0.0
+        print(f"{label:12s} plegado {dt:7.3f}s  afk+activo en bins {binned:10.0f}s "
+              f"(totales {s.active_sec + s.afk_sec:10.0f}s)")
+
+
+def bench_focus(events) -> None:
+    print("== sesiones de foco ==")
+    start = datetime.fromisoformat(events["window"][0]["timestamp"])
+    for label, extra in (("sin foco", {"focus_enabled": False}), ("con foco", {})):
+        settings = {**DEFAULTS, **extra}
+        t0 = time.perf_counter()
+        s = _fold(events, settings, start)
+        dt = time.perf_counter() - t0
+        info = ""
+        if s.focus is not None:
+            f = s.focus.to_payload(s.active_sec)
+            info = f"  sesiones {f['sessions']}  cambios/h {f['switches_per_hour']}"
+        print(f"{label:12s} plegado {dt:7.3f}s{info}")
+
+
+def bench_payload_v2(events) -> None:
+    print("== payload v1 vs v2 (columnas + tabla de strings) ==")
+    start = datetime.fromisoformat(events["window"][0]["timestamp"])
+    for label, extra in (("crudo", {"normalize_enabled": False}), ("normalizado", {"normalize_enabled": True})):
+        settings = {**DEFAULTS, **extra}
+        s = _fold(events, settings, start)
+        v1 = summary_to_payload({**settings, "payload_version": "v1"}, s, start, start, date="bench")
+        t0 = time.perf_counter()
+        v2 = summary_to_payload({**settings, "payload_version": "v2"}, s, start, start, date="bench")
+        dt = time.perf_counter() - t0
+        with_sec = decode_v2(v2)  # v1 con segundos por título/URL: lo que v2 reemplaza
+        ok = downgrade_v1(v2)["apps"] == v1["apps"] and downgrade_v1(v2)["web"] == v1["web"]
+        for name, p in (("v1", v1), ("v1+seg", with_sec), ("v2", v2)):
+            body = json.dumps(p, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            print(f"{label:12s} {name:7s} {len(body):10d} B  gzip {len(gzip.compress(body)):9d} B")
+        print(f"{label:12s} v2 armado {dt:.3f}s  {len(v2['strings'])} strings  ida y vuelta: {ok}")
+
+
+def _retained_mb(fn) -> float:
+    tracemalloc.start()
+    out = fn()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del out
+    return size / 1e6
+
+
+def bench_decode(events) -> None:
+    print("== decodificación de /events (por 100k eventos) ==")
+    start = datetime.fromisoformat(events["window"][0]["timestamp"])
+    bodies = {k: json.dumps(v).encode("utf-8") for k, v in events.items()}
+    k = 100_000 / sum(len(v) for v in events.values())
+    paths = [("json (dicts)", lambda kind, body: json.loads(body))]
+    if msgspec is not None:
+        paths.append(("msgspec (structs)", decode_events))
+    else:
+        print("msgspec no instalado: decode_events usa json")
+    _fold(events, DEFAULTS, start)  # cachés de dominios y normalización calientes para ambos
+    results = []
+    for label, decode in paths:
+        t0 = time.perf_counter()
+        decoded = {kind: decode(kind, body) for kind, body in bodies.items()}
+        dt_dec = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        s = _fold(decoded, DEFAULTS, start)
+        dt_fold = time.perf_counter() - t0
+        del decoded
+        mem = _retained_mb(lambda: {kind: decode(kind, body) for kind, body in bodies.items()})
+        results.append(s.to_dict())
+        print(f"{label:17s} decodificar {dt_dec * k:6.3f}s  plegar {dt_fold * k:6.3f}s  "
+              f"en memoria {mem * k:6.1f} MB")
+    print(f"mismo resumen: {all(r == results[0] for r in results)}")
+
+
+def bench_shards(events, workers: int) -> None:
+    print("== plegado repartido en procesos ==")
+    start = datetime.fromisoformat(events["window"][0]["timestamp"])
+    results = {}
+    for label, extra in (("1 proceso", {"shard_min_events": 0}),
+                         (f"{workers} procesos", {"shard_min_events": 1, "shard_workers": workers})):
+        settings = {**DEFAULTS, **extra}
+        options = SummaryOptions(settings)
+        if workers > 1 and extra["shard_min_events"]:
+            options.fold_events(options.new_summary(start), "window", events["window"][:1000])  # arranque del pool
+        t0 = time.perf_counter()
+        s = options.new_summary(start)
+        for kind in ("afk", "window", "web"):
+            if kind == "window" and s.focus is not None:
+                s.focus.clip_to = s.focus.not_afk
+            options.fold_events(s, kind, events[kind])
+        dt = time.perf_counter() - t0
+        payload = summary_to_payload(settings, s, start, start, date="bench")
+        payload["meta"].pop("generated_at")
+        results[label] = payload
+        print(f"{label:12s} plegado {dt:7.3f}s")
+    a, b = results.values()
+    # el foco depende de que los tramos de afk lleven sus intervalos no-AFK al recorte
+    print(f"idéntico: {a == b}  foco idéntico: {a.get('focus') == b.get('focus')}"
+          f"  (cambios {a.get('focus', {}).get('switches')} / {b.get('focus', {}).get('switches')})")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=200_000)
+    ap.add_argument("--budget", type=int, default=256 * 1024, help="bytes (0 = omitir)")
+    ap.add_argument("--workers", type=int, default=4, help="procesos para el plegado repartido")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    events = synthetic_day(args.events)
+    print(f"día sintético: {args.events} eventos ({time.perf_counter() - t0:.2f}s)")
+    bench_normalize(events, args.budget)
+    bench_categories(events)
+    bench_timeline(events)
+    bench_focus(events)
+    bench_payload_v2(events)
+    bench_decode(events)
+    bench_shards(events, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,7 +20,8 @@ $Args = @(
   "--windowed",
   "--name=ColectorAW",
   "--paths=""$SrcDir""",
-  "--hidden-import=PIL._tkinter_finder"
+  "--hidden-import=PIL._tkinter_finder",
+  "--collect-data=cv2"  # Haar cascades para el control de rostro (photo_quality.py)
 )
 
 # Icono si existe
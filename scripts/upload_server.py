@@ -0,0 +1,97 @@
+# Servidor local de reemplazo para probar la subida por partes (upload.py) sin el servidor real.
+#   python scripts/upload_server.py --port 8765 --drop-every 3
+# Luego en config/settings.json: "server_url": "http://127.0.0.1:8765", "photo_api_url": "http://127.0.0.1:8765"
+# --drop-every N corta la conexión en cada N-ésima parte para ejercitar la reanudación.
+from __future__ import annotations
+import json
+import uuid
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SESSIONS: dict = {}
+LOCK = threading.Lock()
+STATE = {"puts": 0, "drop_every": 0}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _json(self, code: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _session(self):
+        parts = self.path.rstrip("/").split("/")
+        i = parts.index("uploads")
+        sid = parts[i + 1] if len(parts) > i + 1 else None
+        return sid, SESSIONS.get(sid), parts[i + 2:] if sid else []
+
+    def do_GET(self):
+        if "/uploads/" not in self.path:
+            return self._json(404, {"detail": "not found"})
+        sid, sess, _ = self._session()
+        if sess is None:
+            return self._json(404, {"detail": "upload desconocido"})
+        self._json(200, {"offset": len(sess["data"])})
+
+    def do_PUT(self):
+        sid, sess, _ = self._session()
+        chunk = self._body()
+        if sess is None:
+            return self._json(404, {"detail": "upload desconocido"})
+        with LOCK:
+            STATE["puts"] += 1
+            if STATE["drop_every"] and STATE["puts"] % STATE["drop_every"] == 0:
+                # Simula una VPN que se cae: se guarda la parte pero no llega el acuse
+                sess["data"] += chunk
+                self.close_connection = True
+                self.connection.close()
+                return
+        rng = self.headers.get("Content-Range", "")
+        start = int(rng.split(" ")[1].split("-")[0])
+        if start != len(sess["data"]):
+            return self._json(409, {"offset": len(sess["data"])})
+        sess["data"] += chunk
+        self._json(200, {"offset": len(sess["data"])})
+
+    def do_POST(self):
+        if self.path.rstrip("/").endswith("/uploads"):
+            meta = json.loads(self._body() or b"{}")
+            sid = uuid.uuid4().hex
+            SESSIONS[sid] = {"meta": meta, "data": b""}
+            return self._json(201, {"upload_id": sid, "offset": 0})
+        if "/uploads/" in self.path and self.path.rstrip("/").endswith("/complete"):
+            sid, sess, _ = self._session()
+            if sess is None:
+                return self._json(404, {"detail": "upload desconocido"})
+            ok = hashlib.sha256(sess["data"]).hexdigest() == sess["meta"].get("sha256")
+            size = len(sess["data"])
+            del SESSIONS[sid]
+            print(f"upload {sid}: {size} bytes, sha256 {'OK' if ok else 'MAL'}")
+            return self._json(200 if ok else 422, {"ok": ok, "bytes": size, "match": ok})
+        # Subida de una sola petición (reportes pequeños / multipart de foto)
+        size = len(self._body())
+        print(f"POST {self.path}: {size} bytes")
+        self._json(200, {"ok": True, "bytes": size, "match": True})
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--drop-every", type=int, default=0)
+    args = ap.parse_args()
+    STATE["drop_every"] = args.drop_every
+    srv = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Escuchando en http://127.0.0.1:{args.port}")
+    srv.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,17 +3,43 @@ import os
 import json
 import socket
 import getpass
-from datetime import datetime, time, timedelta
-from typing import Dict, Any, List, Tuple, DefaultDict, Optional
+import hashlib
+import math
+import threading
+import sqlite3
+from datetime import date as Date, datetime, time, timedelta
+from typing import Dict, Any, List, Tuple, DefaultDict, Optional, Callable, TYPE_CHECKING
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from functools import lru_cache
 from pathlib import Path
 
 import httpx
+import numpy as np
 import tldextract
 from tzlocal import get_localzone
 
-from .config import load_settings, PENDING_DIR, LOGS_DIR
-from .aw_api import list_buckets, get_events
+from .config import load_settings, PENDING_DIR, LOGS_DIR, CACHE_DIR
+from .aw_api import get_events_body
+from .events import decode_events, rows
+from .buckets import BucketRegistry, kind_of
+from .export import iter_export, clip_events
+from .aw_sqlite import open_datastore
+from .normalize import Normalizer, get_normalizer, apply_byte_budget
+from .categories import get_engine, categorize
+from .timeline import Timeline, epoch_seconds
+from .focus import FocusStats, clip_union
+from .daystore import save_day, load_day, prune_days
+from .reportcache import report_key, get_report, put_report, refresh_report
+from .payload_v2 import (payload_version, encode_v2, downgrade_v1, is_v2, remember_versions,
+                         VERSION_HEADER, VERSIONS_HEADER)
+from .upload import should_chunk, chunked_upload, UploadUnsupported
+from .metrics import AW_FETCH_SECONDS, SEND_SECONDS, SEND_TOTAL
+from .breaker import get_breaker
+
+if TYPE_CHECKING:
+    from .aw_sqlite import AwDatabase
 
 
 def _today_range_local() -> Tuple[datetime, datetime]:
@@ -37,15 +63,21 @@ def _yesterday_range_local() -> Tuple[datetime, datetime]:
 # =====================================
 
 
-def _duration(ev: Dict[str, Any]) -> float:
-    # ActivityWatch suele incluir "duration" en segundos
-    d = ev.get("duration")
-    if isinstance(d, (int, float)):
-        return float(d)
-    # fallback seguro
-    return 0.0
+# Los totales se acumulan en microsegundos enteros: la suma es exacta y no depende del
+# orden, así que fusionar partes (rodante, días, shards) da lo mismo que un solo plegado.
+US = 1_000_000
+
+
+def _us(sec: float) -> int:
+    return round(sec * US)
 
 
+def _timestamp(ev: Dict[str, Any]) -> datetime:
+    # "timestamp" viene en ISO-8601 con zona (UTC) desde aw-server
+    return datetime.fromisoformat(str(ev.get("timestamp")).replace("Z", "+00:00"))
+
+
+@lru_cache(maxsize=65536)
 def _domain(url: str) -> str:
     try:
         ext = tldextract.extract(url)
@@ -61,114 +93,518 @@ def _pick_app(data: Dict[str, Any]) -> str:
     return exe
 
 
-def _most_common_all(counter: Counter, n: int) -> List[str]:
+def _most_common_all(counter: Counter, n: int, with_sec: bool = False) -> List[Any]:
     """
     Devuelve los n más comunes si n>0; si n<=0 devuelve TODOS los items
     según el orden interno de Counter.most_common().
+    with_sec=True: pares [clave, segundos] (payload v2; el Counter va en µs).
     """
-    if n and n > 0:
-        return [k for k, _ in counter.most_common(n)]
-    # n<=0 → sin límite
-    return [k for k, _ in counter.most_common()]
+    items = counter.most_common(n) if n and n > 0 else counter.most_common()  # n<=0 → sin límite
+    if with_sec:
+        return [[k, round(v / US, 2)] for k, v in items]
+    return [k for k, _ in items]
 
 
-def build_daily_payload(settings: Dict[str, Any], meta_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+# ====== Resumen parcial fusionable ======
+class RangeSummary:
     """
-    Consulta ActivityWatch y devuelve el payload de resumen diario (00:00 → ahora, hora local).
-    Si quieres recortar por horario laboral, hazlo desde UI/flow (aquí va “todo el día”).
+    Acumulador del resumen de un rango. Se puede llenar por partes (varios sub-rangos
+    consecutivos) y fusionar con merge(): así el resumen rodante del día (rolling.py)
+    solo pide a ActivityWatch los minutos nuevos.
     """
-    aw_base = settings["aw_base_url"]
-    timeout = settings["request_timeout_sec"]
-    top_titles_n = int(settings.get("top_titles_limit", 0))   # 0 → sin límite
-    top_urls_n = int(settings.get("top_urls_limit", 0))       # 0 → sin límite
 
-    start, end = _today_range_local()
+    def __init__(self, normalizer: Optional[Normalizer] = None, timeline: Optional[Timeline] = None,
+                 focus: Optional[FocusStats] = None) -> None:
+        # Reglas de reducción de cardinalidad (normalize.py); None = claves crudas
+        self._norm = normalizer
+        # Línea de tiempo por bins (timeline.py); None = desactivada
+        self.timeline = timeline
+        # Sesiones de foco y cambios de app (focus.py); None = desactivado
+        self.focus = focus
+        # Duraciones en µs enteros (ver US); active_sec/afk_sec las dan en segundos
+        self.active_us = 0
+        self.afk_us = 0
+        self.keys_count = 0.0
+        self.mouse_dist = 0.0
+        self.app_totals: DefaultDict[str, int] = defaultdict(int)
+        self.app_titles: DefaultDict[str, Counter] = defaultdict(Counter)
+        self.domain_totals: DefaultDict[str, int] = defaultdict(int)
+        self.domain_urls: DefaultDict[str, Counter] = defaultdict(Counter)
+
+    @property
+    def active_sec(self) -> float:
+        return self.active_us / US
+
+    @property
+    def afk_sec(self) -> float:
+        return self.afk_us / US
+
+    # --- plegado de eventos por tipo de bucket ---
+    # Reciben structs de events.decode_events o dicts; se leen con events.rows
+    def fold_afk(self, events: List[Any]) -> None:
+        tl = self.timeline
+        spans = tl is not None or self.focus is not None
+        ts: List[str] = []
+        durs: List[float] = []
+        flags: List[int] = []
+        for stamp, dur, status in rows("afk", events):
+            dur = dur or 0.0
+            active = (status or "").lower() == "not-afk"
+            if active:
+                self.active_us += _us(dur)
+            else:
+                self.afk_us += _us(dur)
+            if spans:
+                ts.append(stamp)
+                durs.append(dur)
+                flags.append(1 if active else 0)
+        if spans:
+            self._fold_spans("afk", ts, durs, flags)
+
+    def fold_window(self, events: List[Any]) -> None:
+        norm = self._norm
+        spans = self.timeline is not None or self.focus is not None
+        ts: List[str] = []
+        durs: List[float] = []
+        names: List[str] = []
+        for stamp, dur, app, exe, title in rows("window", events):
+            dur = dur or 0.0
+            app = (exe or app or "unknown").lower()
+            title = (title or "").strip() or "(sin título)"
+            if norm is not None:
+                title = norm.title(title)
+            us = _us(dur)
+            self.app_totals[app] += us
+            if title:
+                self.app_titles[app][title] += us
+            if spans:
+                ts.append(stamp)
+                durs.append(dur)
+                names.append(app)
+        if spans:
+            self._fold_spans("window", ts, durs, names)
+
+    def fold_web(self, events: List[Any]) -> None:
+        norm = self._norm
+        tl = self.timeline
+        ts: List[str] = []
+        durs: List[float] = []
+        names: List[str] = []
+        for stamp, dur, url in rows("web", events):
+            dur = dur or 0.0
+            url = (url or "").strip()
+            if not url:
+                continue
+            if norm is not None:
+                url = norm.url(url)
+            dom = _domain(url)
+            us = _us(dur)
+            self.domain_totals[dom] += us
+            self.domain_urls[dom][url] += us
+            if tl is not None:
+                ts.append(stamp)
+                durs.append(dur)
+                names.append(dom)
+        if tl is not None:
+            tl.add_domains(ts, durs, names)
+
+    def _fold_spans(self, kind: str, ts: List[str], durs: List[float], keys: List[Any]) -> None:
+        """Línea de tiempo y foco desde la misma conversión de timestamps a epoch."""
+        starts = epoch_seconds(ts)
+        self.fold_intervals(kind, starts, starts + np.asarray(durs, dtype=np.float64), keys)
+
+    def fold_input(self, events: List[Dict[str, Any]], skip_before: Optional[datetime] = None) -> None:
+        for ev in events:
+            # Los conteos no se recortan como las duraciones: en plegados incrementales se
+            # omite el evento que cruza el borde inferior (ya se contó en el tramo anterior).
+            if skip_before is not None and _timestamp(ev) <= skip_before:
+                continue
+            data = (ev.get("data") or {})
+            # distintos watchers pueden usar nombres distintos; soportamos varios
+            for key_name in ("keys", "keycount", "keypresses", "keystrokes"):
+                if isinstance(data.get(key_name), (int, float)):
+                    self.keys_count += float(data[key_name])
+                    break
+            for mouse_name in ("mouse_distance", "mouse", "mouse_move_distance"):
+                if isinstance(data.get(mouse_name), (int, float)):
+                    self.mouse_dist += float(data[mouse_name])
+                    break
+
+    def fold(self, kind: str, events: List[Dict[str, Any]], skip_before: Optional[datetime] = None) -> None:
+        """Pliega eventos de un bucket de la clase `kind` (afk/window/web/input)."""
+        if kind == "afk":
+            self.fold_afk(events)
+        elif kind == "window":
+            self.fold_window(events)
+        elif kind == "web":
+            self.fold_web(events)
+        else:
+            self.fold_input(events, skip_before=skip_before)
+
+    def fold_intervals(self, kind: str, starts, ends, datas: List[Any]) -> None:
+        """
+        Solo línea de tiempo y foco, desde intervalos epoch ya recortados. `datas` son los
+        data de cada evento (backend SQLite) o ya la clave: 0/1 no-AFK en afk, app en window.
+        """
+        tl, focus = self.timeline, self.focus
+        if kind == "input" or (tl is None and (focus is None or kind == "web")):
+            return
+        if kind == "afk":
+            flags = [d if isinstance(d, int) else
+                     1 if str(d.get("status") or "").lower() == "not-afk" else 0 for d in datas]
+            if tl is not None:
+                tl.add_afk_epoch(starts, ends, flags)
+            if focus is not None:
+                focus.add_active(starts, ends, flags)
+        elif kind == "window":
+            apps = [d if isinstance(d, str) else _pick_app(d) for d in datas]
+            if tl is not None:
+                tl.add_apps_epoch(starts, ends, apps)
+            if focus is not None:
+                focus.add_windows(starts, ends, apps)
+        else:
+            norm = self._norm
+            keep = [i for i, d in enumerate(datas) if (d.get("url") or "").strip()]
+            names = []
+            for i in keep:
+                url = datas[i]["url"].strip()
+                names.append(_domain(norm.url(url) if norm is not None else url))
+            tl.add_domains_epoch(starts[keep], ends[keep], names)
+
+    # --- fusión y (de)serialización ---
+    def merge(self, other: "RangeSummary") -> "RangeSummary":
+        self.active_us += other.active_us
+        self.afk_us += other.afk_us
+        self.keys_count += other.keys_count
+        self.mouse_dist += other.mouse_dist
+        for app, total in other.app_totals.items():
+            self.app_totals[app] += total
+        for app, titles in other.app_titles.items():
+            self.app_titles[app].update(titles)
+        for dom, total in other.domain_totals.items():
+            self.domain_totals[dom] += total
+        for dom, urls in other.domain_urls.items():
+            self.domain_urls[dom].update(urls)
+        if other.timeline is not None:
+            if self.timeline is None:
+                self.timeline = other.timeline.empty_like()
+            self.timeline.merge(other.timeline)
+        if other.focus is not None:
+            if self.focus is None:
+                self.focus = other.focus.empty_like()
+            self.focus.merge(other.focus)
+        return self
+
+    def copy(self) -> "RangeSummary":
+        tl = self.timeline.empty_like() if self.timeline is not None else None
+        focus = self.focus.empty_like() if self.focus is not None else None
+        return RangeSummary(self._norm, tl, focus).merge(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        # En segundos (formato de los archivos ya guardados); from_dict vuelve a µs exactos
+        return {
+            "active_sec": self.active_sec,
+            "afk_sec": self.afk_sec,
+            "keys_count": self.keys_count,
+            "mouse_dist": self.mouse_dist,
+            "app_totals": {k: v / US for k, v in self.app_totals.items()},
+            "app_titles": {k: {t: v / US for t, v in c.items()} for k, c in self.app_titles.items()},
+            "domain_totals": {k: v / US for k, v in self.domain_totals.items()},
+            "domain_urls": {k: {u: v / US for u, v in c.items()} for k, c in self.domain_urls.items()},
+            "timeline": self.timeline.to_dict() if self.timeline is not None else None,
+            "focus": self.focus.to_dict() if self.focus is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RangeSummary":
+        s = cls()
+        s.active_us = _us(float(data.get("active_sec", 0.0)))
+        s.afk_us = _us(float(data.get("afk_sec", 0.0)))
+        s.keys_count = float(data.get("keys_count", 0.0))
+        s.mouse_dist = float(data.get("mouse_dist", 0.0))
+        s.app_totals.update({k: _us(v) for k, v in (data.get("app_totals") or {}).items()})
+        for app, titles in (data.get("app_titles") or {}).items():
+            s.app_titles[app].update({t: _us(v) for t, v in titles.items()})
+        s.domain_totals.update({k: _us(v) for k, v in (data.get("domain_totals") or {}).items()})
+        for dom, urls in (data.get("domain_urls") or {}).items():
+            s.domain_urls[dom].update({u: _us(v) for u, v in urls.items()})
+        if data.get("timeline"):
+            s.timeline = Timeline.from_dict(data["timeline"])
+        if data.get("focus"):
+            s.focus = FocusStats.from_dict(data["focus"])
+        return s
+
+
+class SummaryOptions:
+    """
+    Ajustes que cambian el contenido del resumen (reglas de normalización y resolución
+    de la línea de tiempo). Su firma forma parte de las claves de los cachés.
+    """
+
+    def __init__(self, settings: Dict[str, Any]) -> None:
+        self.normalizer = get_normalizer(settings)
+        # Firma de las reglas de normalización sola (los resúmenes por día no llevan timeline)
+        self.rules = self.normalizer.signature if self.normalizer else ""
+        try:
+            self.bin_sec = max(0, int(float(settings.get("timeline_bin_min", 60)) * 60))
+        except Exception:
+            self.bin_sec = 3600
+        # Umbrales de sesión de foco (None = sin foco)
+        self.focus: Optional[Tuple[float, float]] = None
+        if settings.get("focus_enabled", True):
+            self.focus = (float(settings.get("focus_gap_sec", 60)), float(settings.get("focus_short_sec", 60)))
+        # "us": timeline en µs enteros; los cachés con el formato anterior quedan inválidos
+        self.signature = json.dumps([self.rules, self.bin_sec, "us", self.focus])
+        # Plegado repartido en procesos (no cambia el resultado; fuera de la firma)
+        self.settings = settings
+        self.shard_min_events = int(settings.get("shard_min_events", 0) or 0)
+        self.shard_workers = int(settings.get("shard_workers", 0) or 0) or \
+            min(4, max(1, (os.cpu_count() or 1) - 1))
+
+    def new_summary(self, start: datetime) -> RangeSummary:
+        """Resumen vacío; la línea de tiempo arranca a las 00:00 del día de `start`."""
+        timeline = None
+        if self.bin_sec > 0:
+            origin = datetime.combine(start.date(), time(0, 0, 0), start.tzinfo)
+            next_day = datetime.combine(start.date() + timedelta(days=1), time(0, 0, 0), start.tzinfo)
+            n_bins = math.ceil((next_day.timestamp() - origin.timestamp()) / self.bin_sec)
+            timeline = Timeline(origin.timestamp(), self.bin_sec, n_bins)
+        return RangeSummary(self.normalizer, timeline, self.new_focus())
+
+    def new_focus(self) -> Optional[FocusStats]:
+        return FocusStats(*self.focus) if self.focus is not None else None
+
+    def fold_events(self, part: RangeSummary, kind: str, events: List[Dict[str, Any]],
+                    skip_before: Optional[datetime] = None) -> None:
+        """
+        Pliega `events` en `part`. Con shard_min_events eventos o más (window/web/afk) los
+        reparte en tramos consecutivos entre procesos y fusiona los parciales en orden:
+        con totales en µs enteros el resultado es idéntico al de un solo proceso.
+        """
+        if (kind == "input" or self.shard_min_events <= 0 or len(events) < self.shard_min_events
+                or self.shard_workers < 2):
+            part.fold(kind, events, skip_before=skip_before)
+            return
+        size = math.ceil(len(events) / self.shard_workers)
+        tl = part.timeline
+        spec = (tl.origin, tl.bin_sec, tl.n_bins) if tl is not None else None
+        clip = part.focus.clip_to if part.focus is not None else None
+        try:
+            pool = _shard_pool(self.shard_workers)
+            futs = [pool.submit(_fold_shard, self.settings, kind, spec, clip, events[i:i + size])
+                    for i in range(0, len(events), size)]
+            shards = [f.result() for f in futs]
+        except Exception:
+            # pool roto / sin procesos disponibles: se pliega aquí
+            part.fold(kind, events, skip_before=skip_before)
+            return
+        for data, not_afk in shards:
+            part.merge(RangeSummary.from_dict(data))
+            if part.focus is not None and kind == "afk":
+                # contexto para recortar las ventanas: to_dict no lo lleva
+                part.focus.not_afk = clip_union(part.focus.not_afk, not_afk)
+
+
+# ====== Plegado en varios procesos (días muy grandes) ======
+_POOL: Optional[Tuple[ProcessPoolExecutor, int]] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _shard_pool(workers: int) -> ProcessPoolExecutor:
+    """Pool compartido; se crea al primer día grande y se reutiliza (arrancar procesos cuesta)."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL[1] != workers:
+            if _POOL is not None:
+                _POOL[0].shutdown(wait=False)
+            _POOL = (ProcessPoolExecutor(max_workers=workers), workers)
+        return _POOL[0]
+
+
+def _fold_shard(settings: Dict[str, Any], kind: str, spec: Optional[Tuple[float, int, int]],
+                clip: Optional[List[List[float]]],
+                events: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Optional[List[List[float]]]]:
+    """
+    Proceso hijo: pliega un tramo y lo devuelve serializado (to_dict es exacto en µs),
+    junto con sus intervalos no-AFK (solo afk; no son parte de to_dict).
+    `clip`: intervalos no-AFK del rango para recortar las sesiones de foco.
+    """
+    part = RangeSummary(get_normalizer(settings), Timeline(*spec) if spec is not None else None,
+                        SummaryOptions(settings).new_focus())
+    if part.focus is not None:
+        part.focus.clip_to = clip
+    part.fold(kind, events)
+    return part.to_dict(), part.focus.not_afk if part.focus is not None else None
+
 
-    active_sec = 0.0
-    afk_sec = 0.0
-
-    app_totals: DefaultDict[str, float] = defaultdict(float)
-    app_titles: DefaultDict[str, Counter] = defaultdict(Counter)
-
-    domain_totals: DefaultDict[str, float] = defaultdict(float)
-    domain_urls: DefaultDict[str, Counter] = defaultdict(Counter)
-
-    keys_count = 0.0
-    mouse_dist = 0.0
-
-    # Cliente HTTP
-    with httpx.Client(timeout=timeout, follow_redirects=True) as client:
-        # listar buckets
-        buckets = list_buckets(client, aw_base)
-
-        # identificar buckets relevantes
-        bucket_ids = [b["id"] if isinstance(b, dict) else b for b in buckets]  # tolerante
-        afk_buckets = [b for b in bucket_ids if "aw-watcher-afk" in b]
-        window_buckets = [b for b in bucket_ids if "aw-watcher-window" in b]
-        web_buckets = [b for b in bucket_ids if "aw-watcher-web" in b]
-        input_buckets = [b for b in bucket_ids if "aw-watcher-input" in b]
-
-        # AFK: activo vs inactivo
-        for bid in afk_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                dur = _duration(ev)
-                status = (ev.get("data") or {}).get("status", "").lower()
-                if status == "not-afk":
-                    active_sec += dur
-                else:
-                    afk_sec += dur
-
-        # WINDOW: apps + títulos
-        for bid in window_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                dur = _duration(ev)
-                data = ev.get("data") or {}
-                app = _pick_app(data)
-                title = (data.get("title") or "").strip() or "(sin título)"
-                app_totals[app] += dur
-                if title:
-                    app_titles[app][title] += dur
-
-        # WEB: dominios + urls
-        for bid in web_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                dur = _duration(ev)
-                data = ev.get("data") or {}
-                url = (data.get("url") or "").strip()
-                if not url:
+def collect_summary(
+    client: httpx.Client,
+    aw_base: str,
+    start: datetime,
+    end: datetime,
+    registry: BucketRegistry,
+    options: SummaryOptions,
+    incremental: bool = False,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    db: Optional[AwDatabase] = None,
+) -> RangeSummary:
+    """
+    Pide a ActivityWatch los eventos de [start, end) y los pliega en un RangeSummary.
+    aw-server recorta las duraciones al rango consultado, así que los resúmenes de
+    sub-rangos consecutivos suman lo mismo que una sola consulta del rango completo.
+    - registry: buckets del equipo (buckets.py); los que no tienen nada desde `start`
+      se omiten y los que no cambiaron desde la última consulta salen del caché.
+    - options: normalización y línea de tiempo (SummaryOptions).
+    - incremental=True: el rango continúa uno ya plegado (ver fold_input).
+    - progress: recibe un evento por bucket ({"phase", "bucket", "events", "done",
+      "total", "cached"}); si lanza una excepción (p.ej. cancelación) se corta ahí.
+    - db: datastore SQLite abierto (aw_sqlite.py); los eventos llegan ya sumados por
+      clave en lugar de pedirse por HTTP (client puede ser None).
+    """
+    rules = options.signature
+    summary = options.new_summary(start)
+    pending = [(kind, bid) for kind, ids in registry.select().items()
+               for bid in ids if not registry.is_stale(bid, start)]
+    # afk primero: las sesiones de foco de window se recortan al tiempo no-AFK ya plegado
+    pending.sort(key=lambda kb: kb[0] != "afk")
+    cached = {} if incremental else {bid: registry.cached_partial(bid, start, end, rules)
+                                     for _, bid in pending}
+    # El parcial guardado de un afk no trae sus tramos no-AFK (son contexto, no estado):
+    # si hay que plegar alguna ventana, el afk se pliega de nuevo para recortarla
+    if summary.focus is not None and any(k == "window" and cached.get(b) is None for k, b in pending):
+        for k, b in pending:
+            if k == "afk":
+                cached[b] = None
+    clip: Optional[List[List[float]]] = None
+    for done, (kind, bid) in enumerate(pending, 1):
+        hit = cached.pop(bid, None)
+        if hit is not None:
+            summary.merge(RangeSummary.from_dict(hit))
+            if progress is not None:
+                progress({"phase": "resumen", "bucket": bid, "events": 0, "cached": True,
+                          "done": done, "total": len(pending)})
+            continue
+        part = options.new_summary(start)
+        if part.focus is not None:
+            part.focus.clip_to = clip
+        t0 = perf_counter()
+        if db is not None:
+            # Totales ya sumados por clave en SQLite; la línea de tiempo, desde intervalos
+            events = db.grouped_events(kind, bid, start, end, skip_before=start if incremental else None)
+            grouped = RangeSummary(options.normalizer)
+            grouped.fold(kind, events)
+            part.merge(grouped)
+            wants_spans = part.timeline is not None or (part.focus is not None and kind != "web")
+            if wants_spans and kind != "input":
+                part.fold_intervals(kind, *db.intervals(kind, bid, start, end))
+        else:
+            events = decode_events(kind, get_events_body(client, aw_base, bid, start, end))
+            options.fold_events(part, kind, events, skip_before=start if incremental else None)
+        AW_FETCH_SECONDS.observe(perf_counter() - t0, "sqlite" if db is not None else "http")
+        if part.focus is not None and kind == "afk":
+            clip = clip_union(clip, part.focus.not_afk)
+        if not incremental:
+            registry.store_partial(bid, start, end, rules, part.to_dict())
+        summary.merge(part)
+        if progress is not None:
+            progress({"phase": "resumen", "bucket": bid, "events": len(events), "cached": False,
+                      "done": done, "total": len(pending)})
+    return summary
+
+
+def collect_from_export(
+    path: Path,
+    ranges: List[Tuple[datetime, datetime]],
+    options: SummaryOptions,
+    hostname: Optional[str] = None,
+    any_host: bool = False,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Tuple[List[RangeSummary], str]:
+    """
+    Igual que collect_summary, pero leyendo un export JSON de ActivityWatch en vez del
+    servidor, y para varios rangos en una sola pasada. El archivo se recorre bucket a
+    bucket (export.py); cada lote de eventos se recorta a cada rango como lo haría
+    aw-server y se pliega enseguida, sin guardar eventos. El export trae los eventos en
+    el mismo orden que la API (más recientes primero), así el resultado coincide.
+    - hostname: equipo a resumir; por defecto, el más frecuente en el export.
+    Devuelve un resumen por rango y el hostname usado.
+    """
+    parts: List[Dict[str, RangeSummary]] = [{} for _ in ranges]
+    metas: Dict[str, Dict[str, Any]] = {}
+    kind: Optional[str] = None
+    for tag, bid, data in iter_export(path):
+        if tag == "begin":
+            kind = kind_of(bid, data)
+            if kind is not None:
+                for r, (start, _) in enumerate(ranges):
+                    parts[r][bid] = options.new_summary(start)
+                    if kind == "window" and parts[r][bid].focus is not None:
+                        # el afk del equipo puede venir después en el archivo
+                        parts[r][bid].focus.defer = True
+        elif tag == "events" and kind is not None:
+            for r, events in enumerate(clip_events(data, ranges)):
+                parts[r][bid].fold(kind, events)
+            if progress is not None:
+                progress({"phase": "export", "bucket": bid, "events": len(data)})
+        elif tag == "end":
+            metas[bid] = data
+            kind = None
+
+    host = hostname or BucketRegistry.main_hostname(metas) or socket.gethostname()
+    registry = BucketRegistry(metas, hostname=host, any_host=any_host)
+    summaries: List[RangeSummary] = []
+    for r, (start, _) in enumerate(ranges):
+        summary = options.new_summary(start)
+        selected = registry.select()
+        clip: Optional[List[List[float]]] = None
+        # afk primero, como en collect_summary: con él se resuelven las ventanas diferidas
+        for k, ids in sorted(selected.items(), key=lambda kv: kv[0] != "afk"):
+            for bid in ids:
+                if bid not in parts[r]:
                     continue
-                dom = _domain(url)
-                domain_totals[dom] += dur
-                domain_urls[dom][url] += dur
-
-        # INPUT: teclas y distancia mouse (si el watcher lo provee)
-        for bid in input_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                data = (ev.get("data") or {})
-                # distintos watchers pueden usar nombres distintos; soportamos varios
-                for key_name in ("keys", "keycount", "keypresses", "keystrokes"):
-                    if isinstance(data.get(key_name), (int, float)):
-                        keys_count += float(data[key_name])
-                        break
-                for mouse_name in ("mouse_distance", "mouse", "mouse_move_distance"):
-                    if isinstance(data.get(mouse_name), (int, float)):
-                        mouse_dist += float(data[mouse_name])
-                        break
+                part = parts[r][bid]
+                if part.focus is not None:
+                    if k == "afk":
+                        clip = clip_union(clip, part.focus.not_afk)
+                    elif k == "window":
+                        part.focus.resolve(clip)
+                summary.merge(part)
+        summaries.append(summary)
+    return summaries, host
+
+
+def summary_to_payload(
+    settings: Dict[str, Any],
+    summary: RangeSummary,
+    start: datetime,
+    end: datetime,
+    date: str,
+    meta_extra: Optional[Dict[str, Any]] = None,
+    key_end: Optional[datetime] = None,
+    hostname: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Arma el payload v1 a partir de un resumen ya plegado.
+    - key_end: fin nominal del rango para la clave de idempotencia; el informe de
+      "hoy hasta ahora" usa el fin del día para que cada clic reemplace al anterior.
+    - hostname: equipo del informe (por defecto, este; otro al auditar un export).
+    """
+    top_titles_n = int(settings.get("top_titles_limit", 0))   # 0 → sin límite
+    top_urls_n = int(settings.get("top_urls_limit", 0))       # 0 → sin límite
+    # v2 (payload_v2.py): tabla de strings y segundos por título/URL; v1 hasta que el
+    # servidor lo negocie
+    v2 = payload_version(settings) == "v2"
 
     # top títulos por app y top urls por dominio (sin límite si n<=0)
     apps_list = []
-    for app, total in sorted(app_totals.items(), key=lambda x: x[1], reverse=True):
-        top_titles = _most_common_all(app_titles[app], top_titles_n)
-        apps_list.append({"app": app, "total_sec": round(total, 2), "top_titles": top_titles})
+    for app, total in sorted(summary.app_totals.items(), key=lambda x: x[1], reverse=True):
+        top_titles = _most_common_all(summary.app_titles[app], top_titles_n, with_sec=v2)
+        apps_list.append({"app": app, "total_sec": round(total / US, 2), "top_titles": top_titles})
 
     web_list = []
-    for dom, total in sorted(domain_totals.items(), key=lambda x: x[1], reverse=True):
-        top_urls = _most_common_all(domain_urls[dom], top_urls_n)
-        web_list.append({"domain": dom, "total_sec": round(total, 2), "top_urls": top_urls})
+    for dom, total in sorted(summary.domain_totals.items(), key=lambda x: x[1], reverse=True):
+        top_urls = _most_common_all(summary.domain_urls[dom], top_urls_n, with_sec=v2)
+        web_list.append({"domain": dom, "total_sec": round(total / US, 2), "top_urls": top_urls})
 
     # Meta + rango explícito para auditoría
     meta = {
@@ -186,141 +622,225 @@ def build_daily_payload(settings: Dict[str, Any], meta_extra: Optional[Dict[str,
             # en caso de valores no serializables
             meta["meta_extra_error"] = "meta_extra no fusionable; se omitieron algunos campos"
 
+    hostname = hostname or socket.gethostname()
+    user = getpass.getuser()
+    meta["idempotency_key"] = _idempotency_key(hostname, user, date, start, key_end or end)
+
     payload = {
-        "date": datetime.now().date().isoformat(),
-        "hostname": socket.gethostname(),
-        "user": getpass.getuser(),
+        "date": date,
+        "hostname": hostname,
+        "user": user,
         "totals": {
-            "active_sec": round(active_sec, 2),
-            "afk_sec": round(afk_sec, 2),
-            "keys": round(keys_count, 2),
-            "mouse_dist": round(mouse_dist, 2),
+            "active_sec": round(summary.active_sec, 2),
+            "afk_sec": round(summary.afk_sec, 2),
+            "keys": round(summary.keys_count, 2),
+            "mouse_dist": round(summary.mouse_dist, 2),
         },
         "apps": apps_list,
         "web": web_list,
         "meta": meta,
     }
-    return payload
+    # Línea de tiempo por bins (activo/AFK, top app y top dominio por bin)
+    if summary.timeline is not None:
+        origin = datetime.fromtimestamp(summary.timeline.origin, start.tzinfo)
+        payload["timeline"] = summary.timeline.to_payload(start_iso=origin.isoformat())
+    # Fragmentación: cambios de app por hora activa y duración de sesiones de foco
+    if summary.focus is not None:
+        payload["focus"] = summary.focus.to_payload(summary.active_sec)
+    # Totales por categoría (se clasifican las claves distintas, no los eventos)
+    engine = get_engine(settings)
+    if engine is not None:
+        payload["categories"] = categorize(engine, summary.app_titles, summary.domain_totals, unit=US)
+    # Presupuesto de bytes: recorta la cola de los top si el payload excede el máximo.
+    # En v2 se mide antes de codificar (con los textos completos): el v2 queda por debajo
+    payload = apply_byte_budget(payload, int(settings.get("payload_max_bytes", 0) or 0))
+    return encode_v2(payload) if v2 else payload
 
 
-# ====== (NUEVO) Informe de AYER ======
-def build_yesterday_payload(settings: Dict[str, Any], meta_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+class _AwSource:
     """
-    Igual que build_daily_payload, pero para el día COMPLETO de AYER (00:00 → 00:00 del día siguiente).
+    Origen de eventos de ActivityWatch para collect_summary: el datastore SQLite si
+    aw_backend="sqlite" y se puede abrir; si no (o si falla una consulta), la API HTTP.
+    Se abre al primer uso para que los días ya guardados no toquen AW.
     """
-    aw_base = settings["aw_base_url"]
-    timeout = settings["request_timeout_sec"]
-    top_titles_n = int(settings.get("top_titles_limit", 0))   # 0 → sin límite
-    top_urls_n = int(settings.get("top_urls_limit", 0))       # 0 → sin límite
 
-    start, end = _yesterday_range_local()
+    def __init__(self, settings: Dict[str, Any]) -> None:
+        self.settings = settings
+        self.aw_base = settings["aw_base_url"]
+        self.db = None
+        self.client: Optional[httpx.Client] = None
+        self.registry: Optional[BucketRegistry] = None
 
-    active_sec = 0.0
-    afk_sec = 0.0
-
-    app_totals: DefaultDict[str, float] = defaultdict(float)
-    app_titles: DefaultDict[str, Counter] = defaultdict(Counter)
-
-    domain_totals: DefaultDict[str, float] = defaultdict(float)
-    domain_urls: DefaultDict[str, Counter] = defaultdict(Counter)
-
-    keys_count = 0.0
-    mouse_dist = 0.0
-
-    with httpx.Client(timeout=timeout, follow_redirects=True) as client:
-        buckets = list_buckets(client, aw_base)
-
-        bucket_ids = [b["id"] if isinstance(b, dict) else b for b in buckets]
-        afk_buckets = [b for b in bucket_ids if "aw-watcher-afk" in b]
-        window_buckets = [b for b in bucket_ids if "aw-watcher-window" in b]
-        web_buckets = [b for b in bucket_ids if "aw-watcher-web" in b]
-        input_buckets = [b for b in bucket_ids if "aw-watcher-input" in b]
-
-        for bid in afk_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                dur = _duration(ev)
-                status = (ev.get("data") or {}).get("status", "").lower()
-                if status == "not-afk":
-                    active_sec += dur
-                else:
-                    afk_sec += dur
-
-        for bid in window_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                dur = _duration(ev)
-                data = ev.get("data") or {}
-                app = _pick_app(data)
-                title = (data.get("title") or "").strip() or "(sin título)"
-                app_totals[app] += dur
-                if title:
-                    app_titles[app][title] += dur
-
-        for bid in web_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                dur = _duration(ev)
-                data = ev.get("data") or {}
-                url = (data.get("url") or "").strip()
-                if not url:
-                    continue
-                dom = _domain(url)
-                domain_totals[dom] += dur
-                domain_urls[dom][url] += dur
-
-        for bid in input_buckets:
-            events = get_events(client, aw_base, bid, start, end)
-            for ev in events:
-                data = (ev.get("data") or {})
-                for key_name in ("keys", "keycount", "keypresses", "keystrokes"):
-                    if isinstance(data.get(key_name), (int, float)):
-                        keys_count += float(data[key_name])
-                        break
-                for mouse_name in ("mouse_distance", "mouse", "mouse_move_distance"):
-                    if isinstance(data.get(mouse_name), (int, float)):
-                        mouse_dist += float(data[mouse_name])
-                        break
+    def _open_http(self) -> None:
+        self.client = httpx.Client(timeout=self.settings["request_timeout_sec"], follow_redirects=True)
+        self.registry = BucketRegistry.from_server(self.client, self.aw_base, self.settings)
 
-    apps_list = []
-    for app, total in sorted(app_totals.items(), key=lambda x: x[1], reverse=True):
-        top_titles = _most_common_all(app_titles[app], top_titles_n)
-        apps_list.append({"app": app, "total_sec": round(total, 2), "top_titles": top_titles})
+    def _open(self) -> None:
+        self.db = open_datastore(self.settings)
+        if self.db is not None:
+            try:
+                self.registry = BucketRegistry(
+                    self.db.list_buckets(),
+                    hostname=self.settings.get("bucket_hostname") or None,
+                    any_host=bool(self.settings.get("bucket_any_host", False)),
+                )
+                return
+            except sqlite3.Error:
+                self._close_db()
+        self._open_http()
 
-    web_list = []
-    for dom, total in sorted(domain_totals.items(), key=lambda x: x[1], reverse=True):
-        top_urls = _most_common_all(domain_urls[dom], top_urls_n)
-        web_list.append({"domain": dom, "total_sec": round(total, 2), "top_urls": top_urls})
+    def _close_db(self) -> None:
+        if self.db is not None:
+            self.db.close()
+            self.db = None
 
-    meta = {
-        "version": "v1",
-        "source": "activitywatch",
-        "generated_at": datetime.now().isoformat(),
-        "range_start": start.isoformat(),
-        "range_end": end.isoformat(),
-    }
-    if meta_extra and isinstance(meta_extra, dict):
+    def summary(self, start: datetime, end: datetime, options: SummaryOptions,
+                progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> RangeSummary:
+        if self.registry is None:
+            self._open()
+        if self.db is not None:
+            try:
+                return collect_summary(None, self.aw_base, start, end, self.registry, options,
+                                       progress=progress, db=self.db)
+            except sqlite3.Error:
+                # base bloqueada/corrupta a mitad de consulta: se repite por HTTP
+                self._close_db()
+                self._open_http()
+        return collect_summary(self.client, self.aw_base, start, end, self.registry, options,
+                               progress=progress)
+
+    def report_key(self, kind: str, start: datetime, end: datetime, options: SummaryOptions) -> Optional[str]:
+        """
+        Clave del caché de informes (reportcache.py) para un rango ya cerrado; None si no
+        se puede saber si los buckets cambiaron (sin last_updated) o si AW no responde.
+        """
         try:
-            meta.update(meta_extra)
+            if self.registry is None:
+                self._open()
+            ids = [bid for group in self.registry.select().values() for bid in group]
+            margin = timedelta(minutes=float(self.settings.get("rolling_margin_min", 5)))
+            fp = self.registry.fingerprint(ids, settled_after=end + margin)
         except Exception:
-            meta["meta_extra_error"] = "meta_extra no fusionable; se omitieron algunos campos"
+            return None
+        if fp is None:
+            return None
+        return report_key(kind, start, end, self.settings, options.signature, fp)
 
-    payload = {
-        # Para AYER usamos la fecha del inicio del rango
-        "date": start.date().isoformat(),
-        "hostname": socket.gethostname(),
-        "user": getpass.getuser(),
-        "totals": {
-            "active_sec": round(active_sec, 2),
-            "afk_sec": round(afk_sec, 2),
-            "keys": round(keys_count, 2),
-            "mouse_dist": round(mouse_dist, 2),
-        },
-        "apps": apps_list,
-        "web": web_list,
-        "meta": meta,
-    }
-    return payload
+    def close(self) -> None:
+        self._close_db()
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+    def __enter__(self) -> "_AwSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def build_daily_payload(
+    settings: Dict[str, Any],
+    meta_extra: Optional[Dict[str, Any]] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    source: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """
+    Consulta ActivityWatch y devuelve el payload de resumen diario (00:00 → ahora, hora local).
+    Si quieres recortar por horario laboral, hazlo desde UI/flow (aquí va “todo el día”).
+    Con el resumen rodante activo, la UI usa RollingSummary.build_payload (rolling.py).
+    - source: export JSON de ActivityWatch a usar en lugar del servidor.
+    """
+    start, end = _today_range_local()
+
+    if source is not None:
+        summary = _summary_from_export(settings, source, start, end, progress)
+        return summary_to_payload(settings, summary, start, end,
+                                  date=datetime.now().date().isoformat(), meta_extra=meta_extra,
+                                  key_end=start + timedelta(days=1))
+
+    # SQLite local (aw_backend="sqlite") o API HTTP
+    with _AwSource(settings) as src:
+        summary = src.summary(start, end, SummaryOptions(settings), progress=progress)
+
+    return summary_to_payload(settings, summary, start, end,
+                              date=datetime.now().date().isoformat(), meta_extra=meta_extra,
+                              key_end=start + timedelta(days=1))
+
+
+# ====== (NUEVO) Informe de AYER ======
+def build_yesterday_payload(
+    settings: Dict[str, Any],
+    meta_extra: Optional[Dict[str, Any]] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    source: Optional[Path] = None,
+) -> Dict[str, Any]:
+    """
+    Igual que build_daily_payload, pero para el día COMPLETO de AYER (00:00 → 00:00 del día siguiente).
+    """
+    start, end = _yesterday_range_local()
+    options = SummaryOptions(settings)
+
+    if source is not None:
+        summary = _summary_from_export(settings, source, start, end, progress)
+        return summary_to_payload(settings, summary, start, end,
+                                  date=start.date().isoformat(), meta_extra=meta_extra)
+
+    with _AwSource(settings) as src:
+        # Ayer ya no cambia: si los buckets no se tocaron desde el último cálculo se
+        # devuelve el payload guardado (solo se renuevan generated_at y meta_extra)
+        key = src.report_key("yesterday", start, end, options)
+        cached = get_report(key, settings) if key is not None else None
+        if cached is not None:
+            return refresh_report(cached, meta_extra)
+        summary = src.summary(start, end, options, progress=progress)
+    # Queda guardado para los acumulados semanales/mensuales
+    save_day(start.date(), summary.to_dict(), _day_closed(settings, end), options.rules)
+
+    # Para AYER usamos la fecha del inicio del rango
+    payload = summary_to_payload(settings, summary, start, end, date=start.date().isoformat())
+    if key is not None:
+        put_report(key, payload, settings)
+    return refresh_report(payload, meta_extra)
+
+
+def _summary_from_export(settings: Dict[str, Any], source: Path, start: datetime, end: datetime,
+                         progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> RangeSummary:
+    # Mismo equipo que usaría el servidor (bucket_hostname o este)
+    (summary,), _ = collect_from_export(
+        Path(source), [(start, end)], SummaryOptions(settings),
+        hostname=settings.get("bucket_hostname") or socket.gethostname(),
+        any_host=bool(settings.get("bucket_any_host", False)),
+        progress=progress,
+    )
+    return summary
+
+
+def build_export_payloads(
+    settings: Dict[str, Any],
+    source: Path,
+    days: List[Date],
+    hostname: Optional[str] = None,
+    meta_extra: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Payloads de días completos (00:00 → 00:00, hora local) a partir de un export de
+    ActivityWatch, todos en una sola lectura del archivo. Sirve para auditar otro equipo
+    (hostname por defecto: el del export) o cuando aw-server no está disponible.
+    """
+    tz = get_localzone()
+    ranges = []
+    for day in days:
+        start = datetime.combine(day, time(0, 0, 0)).astimezone(tz)
+        ranges.append((start, datetime.combine(day + timedelta(days=1), time(0, 0, 0)).astimezone(tz)))
+    summaries, host = collect_from_export(Path(source), ranges, SummaryOptions(settings),
+                                          hostname=hostname or settings.get("bucket_hostname") or None,
+                                          any_host=bool(settings.get("bucket_any_host", False)))
+    return [
+        summary_to_payload(settings, summary, start, end, date=start.date().isoformat(),
+                           meta_extra=meta_extra, hostname=host)
+        for summary, (start, end) in zip(summaries, ranges)
+    ]
 
 
 # (NUEVO) Wrapper opcional para facilitar el botón "Enviar informe de ayer"
@@ -334,12 +854,202 @@ def send_yesterday_report(settings: Dict[str, Any], meta_extra: Optional[Dict[st
 # =====================================
 
 
+# ====== Acumulados semanales / mensuales ======
+def _day_closed(settings: Dict[str, Any], end: datetime) -> bool:
+    """El día ya no puede cambiar: terminó hace más que el margen de heartbeats."""
+    margin = timedelta(minutes=float(settings.get("rolling_margin_min", 5)))
+    return end + margin <= datetime.now(end.tzinfo)
+
+
+def collect_days(settings: Dict[str, Any], first: Date, last: Date) -> Tuple[RangeSummary, List[Dict[str, Any]]]:
+    """
+    Suma los resúmenes por día de [first, last] (fechas locales) sin volver a pedir
+    eventos de los días ya guardados (daystore.py). Solo se consulta ActivityWatch por
+    los días que faltan o quedaron incompletos; los días futuros se omiten.
+    Devuelve el resumen acumulado y los totales de cada día.
+    """
+    tz = get_localzone()
+    now = datetime.now(tz)
+    options = SummaryOptions(settings)
+    total = RangeSummary(options.normalizer)
+    days: List[Dict[str, Any]] = []
+    # Días guardados antes de tener foco: el acumulado no lo lleva (quedaría parcial)
+    focus_complete = True
+    src = _AwSource(settings)
+    try:
+        day = first
+        while day <= last:
+            start = datetime.combine(day, time(0, 0, 0)).astimezone(tz)
+            if start >= now:
+                break
+            end = datetime.combine(day + timedelta(days=1), time(0, 0, 0)).astimezone(tz)
+            cached = load_day(day, options.rules)
+            if cached is not None:
+                part = RangeSummary.from_dict(cached)
+                complete = True
+            else:
+                fetch_end = min(end, now)
+                part = src.summary(start, fetch_end, options)
+                complete = fetch_end == end and _day_closed(settings, end)
+                save_day(day, part.to_dict(), complete, options.rules)
+            part.timeline = None
+            if part.focus is None:
+                focus_complete = False
+            total.merge(part)
+            days.append({
+                "date": day.isoformat(),
+                "active_sec": round(part.active_sec, 2),
+                "afk_sec": round(part.afk_sec, 2),
+                "complete": complete,
+            })
+            day += timedelta(days=1)
+    finally:
+        src.close()
+    if not focus_complete:
+        total.focus = None
+    prune_days(int(settings.get("day_summaries_keep_days", 0) or 0))
+    return total, days
+
+
+def _build_period_payload(settings: Dict[str, Any], period: str, first: Date, last: Date,
+                          meta_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    tz = get_localzone()
+    summary, days = collect_days(settings, first, last)
+    start = datetime.combine(first, time(0, 0, 0)).astimezone(tz)
+    end = datetime.combine(last + timedelta(days=1), time(0, 0, 0)).astimezone(tz)
+    extra = {"period": period, "period_complete": len(days) == (last - first).days + 1
+             and all(d["complete"] for d in days)}
+    extra.update(meta_extra or {})
+    payload = summary_to_payload(settings, summary, start, end, date=first.isoformat(), meta_extra=extra)
+    payload["days"] = days
+    return payload
+
+
+def build_week_payload(settings: Dict[str, Any], ref: Optional[Date] = None,
+                       meta_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Acumulado de la semana (lunes → domingo) que contiene `ref` (por defecto, ayer)."""
+    ref = ref or (datetime.now(get_localzone()).date() - timedelta(days=1))
+    first = ref - timedelta(days=ref.weekday())
+    return _build_period_payload(settings, "week", first, first + timedelta(days=6), meta_extra)
+
+
+def build_month_payload(settings: Dict[str, Any], ref: Optional[Date] = None,
+                        meta_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Acumulado del mes calendario que contiene `ref` (por defecto, ayer)."""
+    ref = ref or (datetime.now(get_localzone()).date() - timedelta(days=1))
+    first = ref.replace(day=1)
+    last = (first + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return _build_period_payload(settings, "month", first, last, meta_extra)
+
+
+# ==== idempotencia ====
+def _idempotency_key(hostname: str, user: str, date: str, start: datetime, end: datetime) -> str:
+    """Clave estable del informe: mismo equipo, usuario, fecha y rango → misma clave."""
+    raw = "|".join([hostname, user, date, start.isoformat(), end.isoformat()])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _payload_key(payload: Dict[str, Any]) -> str:
+    """Clave del payload; los pendientes antiguos (sin clave) se agrupan por equipo/usuario/día."""
+    meta = payload.get("meta") or {}
+    key = meta.get("idempotency_key")
+    if key:
+        return str(key)
+    try:
+        start = datetime.fromisoformat(str(meta["range_start"]))
+        return _idempotency_key(str(payload.get("hostname", "")), str(payload.get("user", "")),
+                                str(payload.get("date", "")), start, start + timedelta(days=1))
+    except Exception:
+        pass
+    raw = "|".join(str(payload.get(k, "")) for k in ("hostname", "user", "date"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _content_hash(payload: Dict[str, Any]) -> str:
+    """Hash del contenido ignorando lo que cambia en cada clic (generated_at, correlation_id…)."""
+    body = {k: v for k, v in payload.items() if k != "meta"}
+    meta = payload.get("meta") or {}
+    body["range"] = [meta.get("range_start"), meta.get("range_end")]
+    raw = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ==== informes entregados ====
+# Clave de idempotencia → fecha y hora de envío de los informes que el servidor aceptó
+SENT_FILE = CACHE_DIR / "sent-reports.json"
+_SENT_KEEP_DAYS = 62
+_sent_lock = threading.Lock()
+
+
+def _load_sent() -> Dict[str, Dict[str, Any]]:
+    try:
+        return dict(json.loads(SENT_FILE.read_text(encoding="utf-8")))
+    except Exception:
+        return {}
+
+
+def _record_sent(payload: Dict[str, Any]) -> None:
+    limit = (datetime.now() - timedelta(days=_SENT_KEEP_DAYS)).isoformat()
+    with _sent_lock:
+        sent = {k: v for k, v in _load_sent().items() if str(v.get("sent_at", "")) >= limit}
+        sent[_payload_key(payload)] = {
+            "date": payload.get("date"),
+            "range_end": (payload.get("meta") or {}).get("range_end"),
+            "sent_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        try:
+            SENT_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = SENT_FILE.with_suffix(".tmp")
+            tmp.write_text(json.dumps(sent, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, SENT_FILE)
+        except Exception:
+            pass
+
+
+def day_report_status(day: Date) -> str:
+    """
+    "sent" si el servidor ya aceptó un informe de ese día de este equipo/usuario (por
+    SALIDA o por el de ayer: comparten clave), "pending" si espera en pending/ y
+    "missing" si no hay ninguno.
+    """
+    start = datetime.combine(day, time(0, 0, 0)).astimezone(get_localzone())
+    key = _idempotency_key(socket.gethostname(), getpass.getuser(), day.isoformat(),
+                           start, start + timedelta(days=1))
+    if key in _load_sent():
+        return "sent"
+    if (PENDING_DIR / f"payload-{day.isoformat()}-{key[:16]}.json").exists():
+        return "pending"
+    return "missing"
+
+
 # ==== helpers de guardado ====
+def _pending_path(payload: Dict[str, Any]) -> Path:
+    return PENDING_DIR / f"payload-{payload.get('date','unknown')}-{_payload_key(payload)[:16]}.json"
+
+
+def _generated_at(payload: Dict[str, Any]) -> str:
+    return str((payload.get("meta") or {}).get("generated_at") or "")
+
+
 def _save_pending(payload: Dict[str, Any]) -> Path:
-    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    fname = f"payload-{payload.get('date','unknown')}-{ts}.json"
-    path = PENDING_DIR / fname
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    """
+    Guarda el payload en pending/ con nombre por clave de idempotencia: un clic nuevo para
+    el mismo informe reemplaza al pendiente anterior en vez de sumar otro archivo.
+    Si el pendiente guardado es más nuevo, o tiene el mismo contenido, no se toca.
+    """
+    path = _pending_path(payload)
+    if path.exists():
+        try:
+            current = json.loads(path.read_text(encoding="utf-8"))
+            if _generated_at(current) > _generated_at(payload):
+                return path
+            if _content_hash(current) == _content_hash(payload):
+                return path
+        except Exception:
+            pass  # pendiente corrupto: se reemplaza
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
     return path
 
 
@@ -356,41 +1066,124 @@ def _save_to_desktop(payload: Dict[str, Any]) -> Path:
     return path
 
 
+def _copies(payload: Dict[str, Any], desktop_copy: bool) -> str:
+    if not desktop_copy:
+        return "Guardado en 'pending/'."
+    return f"Copias en 'pending/' y Escritorio: {_save_to_desktop(payload)}"
+
+
 # ==== envío al servidor ====
-def send_payload(settings: Dict[str, Any], payload: Dict[str, Any]) -> Tuple[bool, str]:
+def send_payload(settings: Dict[str, Any], payload: Dict[str, Any], desktop_copy: bool = True) -> Tuple[bool, str]:
     """POST al servidor.
     - 2xx: OK
     - 404 o cualquier otro fallo/exception: guardar en pending/ y también en Escritorio
+      (desktop_copy=False: solo pending/, para envíos automáticos)
+    Envía la clave de idempotencia en el header Idempotency-Key para que el servidor
+    pueda descartar reenvíos del mismo informe. Los informes grandes se suben por partes
+    (upload.py) y un reintento retoma desde la última parte confirmada.
+    Con el circuito del endpoint abierto (breaker.py) no se intenta la red: va directo
+    a pendientes.
     """
     url = settings["server_url"] + settings["ingest_path"]
-    timeout = settings["request_timeout_sec"]
+    breaker = get_breaker(url, settings)
+    cap = float(settings.get("request_timeout_sec", 30))
+    if not breaker.allow():
+        SEND_TOTAL.inc(1, "report", "pending")
+        _save_pending(payload)
+        return False, f"Servidor no disponible (sin conexión). {_copies(payload, desktop_copy)}"
+    headers = {"Idempotency-Key": _payload_key(payload)}
+    t0 = perf_counter()
     try:
-        with httpx.Client(timeout=timeout, follow_redirects=True) as client:
-            r = client.post(url, json=payload)
+        with httpx.Client(timeout=breaker.timeout(cap), follow_redirects=True) as client:
+            r = _post_payload(client, settings, url, payload, headers)
+            remember_versions(url, r.headers)
+            if r.status_code == 415 and is_v2(payload):
+                # El servidor ya no acepta v2: se recuerda y se reenvía este informe como v1
+                remember_versions(url, {VERSIONS_HEADER: "v1"})
+                payload = downgrade_v1(payload)
+                r = _post_payload(client, settings, url, payload, headers)
+            SEND_SECONDS.observe(perf_counter() - t0, "report")
+            breaker.record(r.status_code, perf_counter() - t0)
             if 200 <= r.status_code < 300:
+                SEND_TOTAL.inc(1, "report", "ok")
+                _record_sent(payload)
                 return True, "Enviado con éxito"
+            SEND_TOTAL.inc(1, "report", "pending")
             # Cualquier no-2xx: guardar en pending y Escritorio
             _save_pending(payload)
-            desk_path = _save_to_desktop(payload)
-            return False, f"Error {r.status_code}. Copias en 'pending/' y Escritorio: {desk_path}"
+            return False, f"Error {r.status_code}. {_copies(payload, desktop_copy)}"
     except Exception as e:
         # Error de red (ej. WinError 10061): también guardamos en ambos
+        if isinstance(e, httpx.TransportError):
+            breaker.failure(e, cap)
+        SEND_SECONDS.observe(perf_counter() - t0, "report")
+        SEND_TOTAL.inc(1, "report", "pending")
         _save_pending(payload)
-        desk_path = _save_to_desktop(payload)
-        return False, f"Error de red: {e}. Copias en 'pending/' y Escritorio: {desk_path}"
+        return False, f"Error de red: {e}. {_copies(payload, desktop_copy)}"
+
+
+def _post_payload(
+    client: httpx.Client,
+    settings: Dict[str, Any],
+    url: str,
+    payload: Dict[str, Any],
+    headers: Dict[str, str],
+) -> httpx.Response:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    headers = {**headers, VERSION_HEADER: str((payload.get("meta") or {}).get("version") or "v1")}
+    if should_chunk(settings, len(body), url):
+        try:
+            return chunked_upload(
+                client, url, body,
+                filename=f"payload-{payload.get('date', 'unknown')}.json",
+                content_type="application/json",
+                fields={"idempotency_key": headers["Idempotency-Key"]},
+                chunk_size=int(settings.get("chunk_size_kb", 512)) * 1024,
+                headers=headers,
+            )
+        except UploadUnsupported:
+            pass
+    return client.post(url, content=body, headers={**headers, "Content-Type": "application/json"})
 
 
 # ==== reintento de pendientes ====
-def resend_pending(settings: Dict[str, Any]) -> List[Tuple[Path, bool, str]]:
-    """Intenta reenviar los archivos en pending/. Devuelve lista de (path, éxito, mensaje)."""
+def resend_pending(settings: Dict[str, Any], desktop_copy: bool = True) -> List[Tuple[Path, bool, str]]:
+    """
+    Intenta reenviar los archivos en pending/. Devuelve lista de (path, éxito, mensaje).
+    desktop_copy: como en send_payload (False en los reintentos automáticos).
+    Solo se envía el más reciente por clave de idempotencia; los demás de la misma clave
+    (p.ej. pendientes de versiones anteriores con nombre por timestamp) se descartan.
+    """
     results: List[Tuple[Path, bool, str]] = []
-    files = sorted(PENDING_DIR.glob("payload-*.json"))
-    for path in files:
+    newest: Dict[str, Tuple[Path, Dict[str, Any]]] = {}
+    superseded: Dict[str, List[Path]] = defaultdict(list)
+
+    for path in sorted(PENDING_DIR.glob("payload-*.json")):
         try:
             data = json.loads(path.read_text(encoding="utf-8"))
-            success, msg = send_payload(settings, data)
+        except Exception as e:
+            results.append((path, False, f"Error leyendo o enviando: {e}"))
+            continue
+        key = _payload_key(data)
+        prev = newest.get(key)
+        if prev is None or _generated_at(data) >= _generated_at(prev[1]):
+            if prev is not None:
+                superseded[key].append(prev[0])
+            newest[key] = (path, data)
+        else:
+            superseded[key].append(path)
+
+    for key, (path, data) in newest.items():
+        for old in superseded.get(key, []):
+            old.unlink(missing_ok=True)
+            results.append((old, True, "Descartado: reemplazado por un informe más reciente"))
+        try:
+            success, msg = send_payload(settings, data, desktop_copy=desktop_copy)
             if success:
-                path.unlink()  # borrar si se envió con éxito
+                path.unlink(missing_ok=True)  # borrar si se envió con éxito
+            elif _pending_path(data) != path and _pending_path(data).exists():
+                # send_payload ya lo guardó con el nombre por clave; el archivo viejo sobra
+                path.unlink(missing_ok=True)
             results.append((path, success, msg))
         except Exception as e:
             results.append((path, False, f"Error leyendo o enviando: {e}"))
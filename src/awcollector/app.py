@@ -2,6 +2,9 @@
 from __future__ import annotations
 
 def main():
+    # Los procesos del plegado repartido (aggregate.py) re-ejecutan el .exe empaquetado
+    import multiprocessing
+    multiprocessing.freeze_support()
     # Import absoluto para que funcione al empaquetar con PyInstaller
     from awcollector.ui_tk import run
     run()
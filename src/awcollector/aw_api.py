@@ -33,6 +33,21 @@ def get_events(
     r.raise_for_status()
     return r.json()
 
+def get_events_body(
+    client: httpx.Client,
+    aw_base_url: str,
+    bucket_id: str,
+    start: datetime,
+    end: datetime,
+    limit: int = 2000000
+) -> bytes:
+    """Igual que get_events pero sin decodificar: el agregado lo pasa a events.decode_events."""
+    url = _join(aw_base_url, f"buckets/{bucket_id}/events")
+    params = {"start": _iso(start), "end": _iso(end), "limit": str(limit)}
+    r = client.get(url, params=params)
+    r.raise_for_status()
+    return r.content
+
 # ====== Helpers de rango diario (hoy/ayer) ======
 
 def _local_tz():
@@ -0,0 +1,231 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\aw_sqlite.py
+from __future__ import annotations
+import os
+import sys
+import sqlite3
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+# Esquema de aw-server-rust (datastore SQLite). Los tiempos son nanosegundos epoch (UTC)
+# y `data` es el JSON del evento. Se usa tal cual para generar bases de prueba.
+RUST_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL,
+    type TEXT NOT NULL,
+    client TEXT NOT NULL,
+    hostname TEXT NOT NULL,
+    created TEXT NOT NULL,
+    data TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    bucketrow INTEGER NOT NULL,
+    starttime INTEGER NOT NULL,
+    endtime INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    FOREIGN KEY (bucketrow) REFERENCES buckets(id)
+);
+CREATE INDEX IF NOT EXISTS events_bucketrow_index ON events(bucketrow);
+CREATE INDEX IF NOT EXISTS events_starttime_index ON events(starttime);
+CREATE INDEX IF NOT EXISTS events_endtime_index ON events(endtime);
+CREATE TABLE IF NOT EXISTS key_value (
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    last_modified NUMBER NOT NULL
+);
+PRAGMA user_version = 4;
+"""
+
+# Versiones de esquema (PRAGMA user_version) que sabemos leer
+KNOWN_SCHEMA_VERSIONS = {1, 2, 3, 4}
+_REQUIRED_COLUMNS = {
+    "buckets": {"id", "name", "type", "hostname", "created"},
+    "events": {"bucketrow", "starttime", "endtime", "data"},
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Duración recortada al rango [:s, :e] en ns (igual que recorta aw-server al consultar)
+_TRIMMED = "(MIN(endtime, :e) - MAX(starttime, :s))"
+_IN_RANGE = "bucketrow = :b AND endtime >= :s AND starttime <= :e"
+
+# Conteos de input: el primer campo numérico presente, como RangeSummary.fold_input
+_KEYS = ("keys", "keycount", "keypresses", "keystrokes")
+_MOUSE = ("mouse_distance", "mouse", "mouse_move_distance")
+
+
+def _first_numeric(fields) -> str:
+    whens = " ".join(
+        f"WHEN json_type(data, '$.{f}') IN ('integer', 'real') THEN json_extract(data, '$.{f}')"
+        for f in fields
+    )
+    return f"CASE {whens} END"
+
+
+def epoch_ns(dt: datetime) -> int:
+    """Fecha con zona → nanosegundos epoch (unidad de starttime/endtime)."""
+    return ((dt - _EPOCH) // timedelta(microseconds=1)) * 1000
+
+
+def default_paths() -> List[Path]:
+    """Ubicaciones habituales de sqlite.db de aw-server-rust según el sistema."""
+    paths = []
+    if os.environ.get("LOCALAPPDATA"):
+        paths.append(Path(os.environ["LOCALAPPDATA"]) / "activitywatch" / "aw-server-rust" / "sqlite.db")
+    home = Path.home()
+    if sys.platform == "darwin":
+        paths.append(home / "Library" / "Application Support" / "activitywatch" / "aw-server-rust" / "sqlite.db")
+    paths.append(Path(os.environ.get("XDG_DATA_HOME", home / ".local" / "share"))
+                 / "activitywatch" / "aw-server-rust" / "sqlite.db")
+    return paths
+
+
+class SchemaError(Exception):
+    """La base no tiene un esquema de aw-server-rust conocido."""
+
+
+class AwDatabase:
+    """
+    Lectura directa (solo lectura) del datastore SQLite de aw-server-rust:
+    - los rangos se filtran con los índices de starttime/endtime,
+    - las duraciones se recortan al rango y se suman por clave dentro de SQLite
+      (GROUP BY app/título, URL, estado AFK), así que a Python llegan claves distintas,
+      no eventos.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        uri = "file:" + self.path.resolve().as_posix() + "?mode=ro"
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=5)
+        self.conn.execute("PRAGMA query_only = 1")
+        self._rows: Dict[str, int] = {}
+        self.check_schema()
+
+    def close(self) -> None:
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+    def __enter__(self) -> "AwDatabase":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def check_schema(self) -> None:
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in KNOWN_SCHEMA_VERSIONS:
+            raise SchemaError(f"versión de esquema desconocida: {version}")
+        for table, cols in _REQUIRED_COLUMNS.items():
+            have = {r[1] for r in self.conn.execute(f"PRAGMA table_info({table})")}
+            if not cols <= have:
+                raise SchemaError(f"faltan columnas en {table}: {sorted(cols - have)}")
+
+    # ====== buckets ======
+    def list_buckets(self) -> Dict[str, Dict[str, Any]]:
+        """Misma forma que /api/0/buckets/ (sin last_updated: no se calcula aquí)."""
+        out: Dict[str, Dict[str, Any]] = {}
+        for row, name, typ, host, created in self.conn.execute(
+                "SELECT id, name, type, hostname, created FROM buckets"):
+            self._rows[name] = row
+            out[name] = {"id": name, "type": typ, "hostname": host, "created": created, "last_updated": None}
+        return out
+
+    def _row(self, bucket_id: str) -> Optional[int]:
+        if not self._rows:
+            self.list_buckets()
+        return self._rows.get(bucket_id)
+
+    # ====== eventos agregados ======
+    def grouped_events(
+        self,
+        kind: str,
+        bucket_id: str,
+        start: datetime,
+        end: datetime,
+        skip_before: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        "Eventos" sintéticos ya sumados por clave dentro de SQLite, con la misma forma que
+        los de la API ({"duration", "data"}), para plegarlos con RangeSummary.fold_*.
+        """
+        row = self._row(bucket_id)
+        if row is None:
+            return []
+        p = {"b": row, "s": epoch_ns(start), "e": epoch_ns(end)}
+        if kind == "afk":
+            sql = (f"SELECT json_extract(data, '$.status'), SUM({_TRIMMED}) FROM events "
+                   f"WHERE {_IN_RANGE} GROUP BY 1")
+            return [{"duration": ns / 1e9, "data": {"status": st}}
+                    for st, ns in self.conn.execute(sql, p)]
+        if kind == "window":
+            sql = (f"SELECT json_extract(data, '$.executable'), json_extract(data, '$.app'), "
+                   f"json_extract(data, '$.title'), SUM({_TRIMMED}) FROM events "
+                   f"WHERE {_IN_RANGE} GROUP BY 1, 2, 3")
+            return [{"duration": ns / 1e9, "data": {"executable": exe, "app": app, "title": title}}
+                    for exe, app, title, ns in self.conn.execute(sql, p)]
+        if kind == "web":
+            sql = (f"SELECT json_extract(data, '$.url'), SUM({_TRIMMED}) FROM events "
+                   f"WHERE {_IN_RANGE} GROUP BY 1")
+            return [{"duration": ns / 1e9, "data": {"url": url}}
+                    for url, ns in self.conn.execute(sql, p)]
+        # input: los conteos no se recortan; en plegados incrementales se omite lo que
+        # empieza en/antes de skip_before (ver RangeSummary.fold_input)
+        where = _IN_RANGE
+        if skip_before is not None:
+            where += " AND starttime > :k"
+            p["k"] = epoch_ns(skip_before)
+        sql = (f"SELECT SUM({_first_numeric(_KEYS)}), SUM({_first_numeric(_MOUSE)}) "
+               f"FROM events WHERE {where}")
+        keys, mouse = self.conn.execute(sql, p).fetchone()
+        return [{"data": {"keys": float(keys or 0), "mouse_distance": float(mouse or 0)}}]
+
+    def intervals(
+        self,
+        kind: str,
+        bucket_id: str,
+        start: datetime,
+        end: datetime,
+    ) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]]]:
+        """Intervalos recortados (epoch s) y datos mínimos por evento, para la línea de tiempo."""
+        row = self._row(bucket_id)
+        field = {"afk": "$.status", "window": "$.app", "web": "$.url"}[kind]
+        if row is None:
+            return np.zeros(0), np.zeros(0), []
+        p = {"b": row, "s": epoch_ns(start), "e": epoch_ns(end)}
+        extra = ", json_extract(data, '$.executable')" if kind == "window" else ""
+        cur = self.conn.execute(
+            f"SELECT MAX(starttime, :s), MIN(endtime, :e), json_extract(data, '{field}'){extra} "
+            f"FROM events WHERE {_IN_RANGE}", p)
+        rows = cur.fetchall()
+        if not rows:
+            return np.zeros(0), np.zeros(0), []
+        starts = np.array([r[0] for r in rows], dtype=np.int64) / 1e9
+        ends = np.array([r[1] for r in rows], dtype=np.int64) / 1e9
+        key = {"afk": "status", "window": "app", "web": "url"}[kind]
+        datas = [{key: r[2], "executable": r[3]} if kind == "window" else {key: r[2]} for r in rows]
+        return starts, ends, datas
+
+
+def open_datastore(settings: Dict[str, Any]) -> Optional[AwDatabase]:
+    """
+    Abre el datastore SQLite si aw_backend="sqlite" y el archivo existe con un esquema
+    conocido. En cualquier otro caso devuelve None y se usa la API HTTP.
+    """
+    if str(settings.get("aw_backend", "http")).lower() != "sqlite":
+        return None
+    custom = str(settings.get("aw_sqlite_path") or "").strip()
+    candidates = [Path(custom)] if custom else default_paths()
+    for path in candidates:
+        if not path.is_file():
+            continue
+        try:
+            return AwDatabase(path)
+        except (sqlite3.Error, SchemaError):
+            return None
+    return None
@@ -0,0 +1,180 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\breaker.py
+from __future__ import annotations
+import time
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from .metrics import CIRCUIT_OPEN, SHORT_CIRCUITS
+
+# Muestras de latencia que se recuerdan y mínimo para adaptar el timeout
+_WINDOW = 50
+_MIN_SAMPLES = 8
+# Respuestas que cuentan como caída del servidor (además de errores de red)
+_DOWN_STATUS = {502, 503, 504}
+_PROBE_MAX_SEC = 60.0
+# Ajustes que usa el circuito; se copian al crearlo (ver get_breaker). El tope del
+# timeout (request_timeout_sec) no: cada llamada pasa el suyo (SALIDA lo acorta al plazo)
+_SETTINGS_KEYS = ("circuit_enabled", "circuit_failures", "circuit_probe_sec", "circuit_reset_sec",
+                  "connect_timeout_sec", "adaptive_timeout", "timeout_min_sec")
+
+
+def _endpoint(url: str) -> str:
+    u = urlsplit(url)
+    return f"{u.scheme}://{u.netloc}{u.path}"
+
+
+def _origin(url: str) -> str:
+    u = urlsplit(url)
+    return f"{u.scheme}://{u.netloc}/"
+
+
+class CircuitBreaker:
+    """
+    Circuito por endpoint:
+    - closed: se envía normal; circuit_failures fallos de red seguidos lo abren.
+    - open: allow() devuelve False y el llamador guarda directo en pendientes. Un hilo
+      sondea el origen (HEAD barato, cualquier respuesta HTTP vale) con espera creciente
+      y cierra el circuito al primer éxito. Pasado circuit_reset_sec se deja pasar un
+      envío real de prueba aunque el sondeo no haya respondido.
+    - timeout(cap): timeout adaptado al p95 de las latencias observadas, acotado entre
+      timeout_min_sec y el tope de la llamada (su request_timeout_sec); el de conexión,
+      a connect_timeout_sec. Vencer ese timeout adaptado por debajo del tope no es una
+      caída (el servidor contestaba, pero más lento que antes): failure(e, cap) no suma
+      fallos y descarta las muestras, así los envíos siguientes usan el tope completo
+      hasta volver a medir.
+    """
+
+    def __init__(self, url: str, settings: Dict[str, Any]) -> None:
+        self.endpoint = _endpoint(url)
+        self.origin = _origin(url)
+        self.settings = {k: settings[k] for k in _SETTINGS_KEYS if k in settings}
+        self._lock = threading.Lock()
+        self._latencies: deque = deque(maxlen=_WINDOW)
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._probe: Optional[threading.Thread] = None
+
+    # ====== estado ======
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if not self.settings.get("circuit_enabled", True):
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            reset = float(self.settings.get("circuit_reset_sec", 120))
+            if not self._trial and time.monotonic() - self._opened_at >= reset:
+                self._trial = True  # un único envío real de prueba
+                return True
+        SHORT_CIRCUITS.inc(1, self.endpoint)
+        return False
+
+    def success(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+            self._failures = 0
+            self._close()
+
+    def failure(self, error: Optional[BaseException] = None, cap: Optional[float] = None) -> None:
+        """
+        Error de red. Con la excepción y el tope que se pasó a timeout(), un ReadTimeout
+        del timeout adaptado se distingue de una caída.
+        """
+        if isinstance(error, httpx.ReadTimeout) and cap is not None:
+            if self._read_timeout(cap) < cap:
+                with self._lock:
+                    self._latencies.clear()
+                return
+        with self._lock:
+            self._failures += 1
+            if self._opened_at is not None:
+                if self._trial:  # falló el envío de prueba: otro periodo abierto
+                    self._opened_at = time.monotonic()
+                    self._trial = False
+                return
+            if self._failures >= int(self.settings.get("circuit_failures", 2)):
+                self._opened_at = time.monotonic()
+                self._trial = False
+                CIRCUIT_OPEN.set(1, self.endpoint)
+                self._start_probe()
+
+    def record(self, status_code: int, latency: float) -> None:
+        """Respuesta HTTP recibida: 502/503/504 cuentan como fallo, lo demás como éxito."""
+        if status_code in _DOWN_STATUS:
+            self.failure()
+        else:
+            self.success(latency)
+
+    def _close(self) -> None:
+        if self._opened_at is not None:
+            self._opened_at = None
+            self._trial = False
+            CIRCUIT_OPEN.set(0, self.endpoint)
+
+    # ====== timeouts ======
+    def timeout(self, cap: float) -> httpx.Timeout:
+        """Timeout de esta llamada; `cap` = su request_timeout_sec."""
+        connect = min(cap, float(self.settings.get("connect_timeout_sec", 5)))
+        return httpx.Timeout(self._read_timeout(cap), connect=connect)
+
+    def _read_timeout(self, cap: float) -> float:
+        read = cap
+        if self.settings.get("adaptive_timeout", True):
+            with self._lock:
+                samples = sorted(self._latencies)
+            if len(samples) >= _MIN_SAMPLES:
+                p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+                read = min(cap, max(float(self.settings.get("timeout_min_sec", 5)), 4 * p95))
+        return read
+
+    # ====== sondeo ======
+    def _start_probe(self) -> None:
+        if self._probe is not None and self._probe.is_alive():
+            return
+        self._probe = threading.Thread(target=self._probe_loop, name="circuit-probe", daemon=True)
+        self._probe.start()
+
+    def _probe_loop(self) -> None:
+        wait = max(1.0, float(self.settings.get("circuit_probe_sec", 5)))
+        connect = float(self.settings.get("connect_timeout_sec", 5))
+        while self.is_open:
+            time.sleep(wait)
+            if not self.is_open:
+                return
+            try:
+                r = httpx.head(self.origin, timeout=connect, follow_redirects=False)
+                if r.status_code not in _DOWN_STATUS:
+                    with self._lock:
+                        self._failures = 0
+                        self._close()
+                    return
+            except httpx.HTTPError:
+                pass
+            wait = min(_PROBE_MAX_SEC, wait * 2)
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(url: str, settings: Dict[str, Any]) -> CircuitBreaker:
+    """
+    Circuito compartido del endpoint (mismo esquema/host/ruta). Sus umbrales son los de
+    la primera llamada para ese endpoint: los settings de otro llamador (p.ej. una copia
+    modificada en otro hilo) no cambian el circuito que comparten todos. El tope del
+    timeout sí es de cada llamada: se pasa a timeout() y failure().
+    """
+    key = _endpoint(url)
+    with _BREAKERS_LOCK:
+        br = _BREAKERS.get(key)
+        if br is None:
+            br = _BREAKERS[key] = CircuitBreaker(url, settings)
+        return br
@@ -0,0 +1,214 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\buckets.py
+from __future__ import annotations
+import os
+import json
+import socket
+import hashlib
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+from .config import CACHE_DIR
+from .aw_api import list_buckets
+
+REGISTRY_FILE = CACHE_DIR / "buckets.json"
+PARTIALS_DIR = CACHE_DIR / "buckets"
+
+# Tipo de bucket de ActivityWatch → clase de watcher que usa el agregado
+BUCKET_TYPES = {
+    "afkstatus": "afk",
+    "currentwindow": "window",
+    "web.tab.current": "web",
+    "os.hid.input": "input",
+}
+
+# Respaldo por id para watchers que no declaran un tipo conocido
+_ID_HINTS = (
+    ("aw-watcher-afk", "afk"),
+    ("aw-watcher-window", "window"),
+    ("aw-watcher-web", "web"),
+    ("aw-watcher-input", "input"),
+)
+
+# Hostnames que aw-watcher-web usa cuando no conoce el equipo
+_ANY_HOST = {"", "unknown"}
+
+
+def _parse_dt(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def kind_of(bid: str, meta: Dict[str, Any]) -> Optional[str]:
+    """Clase de watcher del bucket (afk/window/web/input) o None si no se usa."""
+    kind = BUCKET_TYPES.get(str(meta.get("type") or ""))
+    if kind:
+        return kind
+    for hint, k in _ID_HINTS:
+        if hint in bid:
+            return k
+    return None
+
+
+class BucketRegistry:
+    """
+    Registro de buckets armado con los metadatos que ya trae list_buckets
+    (type, hostname, created, last_updated):
+    - select(): buckets por tipo y hostname local (descarta los de otros equipos).
+    - is_stale(): el bucket no tiene nada desde el inicio del rango → no se consulta.
+    - cached_partial()/store_partial(): resumen parcial por bucket de la última consulta;
+      si el bucket no cambió desde entonces se reutiliza sin pedir eventos.
+    El registro y los parciales se guardan en cache/ entre ejecuciones.
+    """
+
+    def __init__(self, raw: Any, hostname: Optional[str] = None, any_host: bool = False) -> None:
+        self.hostname = (hostname or socket.gethostname()).lower()
+        self.any_host = any_host
+        self.meta: Dict[str, Dict[str, Any]] = {}
+        # /buckets/ devuelve {id: {...}}; toleramos también una lista de ids o de dicts
+        if isinstance(raw, dict):
+            items = [(bid, m if isinstance(m, dict) else {}) for bid, m in raw.items()]
+        else:
+            items = [(b["id"], b) if isinstance(b, dict) else (b, {}) for b in (raw or [])]
+        for bid, m in items:
+            self.meta[str(bid)] = {
+                "type": m.get("type"),
+                "hostname": m.get("hostname"),
+                "created": m.get("created"),
+                "last_updated": m.get("last_updated"),
+            }
+        self._index = self._load_index()
+
+    @classmethod
+    def from_server(cls, client: httpx.Client, aw_base: str, settings: Dict[str, Any]) -> "BucketRegistry":
+        reg = cls(
+            list_buckets(client, aw_base),
+            hostname=settings.get("bucket_hostname") or None,
+            any_host=bool(settings.get("bucket_any_host", False)),
+        )
+        reg._save_index()
+        return reg
+
+    @staticmethod
+    def main_hostname(raw: Dict[str, Dict[str, Any]]) -> Optional[str]:
+        """Hostname más frecuente entre los buckets (p.ej. el del equipo de un export)."""
+        hosts = [str(m.get("hostname") or "").lower() for m in raw.values()]
+        hosts = [h for h in hosts if h not in _ANY_HOST]
+        return max(set(hosts), key=hosts.count) if hosts else None
+
+    # ====== selección ======
+    def _local(self, meta: Dict[str, Any]) -> bool:
+        if self.any_host:
+            return True
+        host = str(meta.get("hostname") or "").lower()
+        return host == self.hostname or host in _ANY_HOST
+
+    def select(self) -> Dict[str, List[str]]:
+        """Ids de bucket del equipo local agrupados por clase (afk/window/web/input)."""
+        out: Dict[str, List[str]] = {"afk": [], "window": [], "web": [], "input": []}
+        for bid in sorted(self.meta):
+            meta = self.meta[bid]
+            kind = kind_of(bid, meta)
+            if kind and self._local(meta):
+                out[kind].append(bid)
+        return out
+
+    def last_updated(self, bid: str) -> Optional[datetime]:
+        return _parse_dt(self.meta.get(bid, {}).get("last_updated"))
+
+    def is_stale(self, bid: str, start: datetime) -> bool:
+        """True si el bucket no recibió nada desde `start` (watcher muerto o sin uso)."""
+        lu = self.last_updated(bid)
+        return lu is not None and lu < start
+
+    def fingerprint(self, bucket_ids: List[str], settled_after: Optional[datetime] = None) -> Optional[str]:
+        """
+        Huella de los buckets participantes (ids + last_updated). Con settled_after, un
+        bucket escrito después de esa hora cuenta como "asentado" para un rango que ya
+        terminó: lo nuevo cae fuera y la huella no cambia con cada heartbeat.
+        None si algún bucket no informa last_updated (p.ej. backend SQLite).
+        """
+        parts = []
+        for bid in sorted(bucket_ids):
+            lu = self.last_updated(bid)
+            if lu is None:
+                return None
+            if settled_after is not None and lu >= settled_after:
+                parts.append(f"{bid}@settled")
+            else:
+                parts.append(f"{bid}@{self.meta[bid]['last_updated']}")
+        return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:32]
+
+    # ====== parciales por bucket ======
+    def cached_partial(self, bid: str, start: datetime, end: datetime, rules: str) -> Optional[Dict[str, Any]]:
+        """
+        Resumen parcial guardado si sigue siendo válido para [start, end): mismo inicio,
+        mismas reglas, last_updated sin cambios y todo lo registrado cae dentro de lo ya
+        consultado.
+        """
+        rec = self._index.get(bid)
+        lu = self.meta.get(bid, {}).get("last_updated")
+        if not rec or lu is None or rec.get("last_updated") != lu or rec.get("rules") != rules:
+            return None
+        rec_start, rec_end = _parse_dt(rec.get("start")), _parse_dt(rec.get("end"))
+        lu_dt = _parse_dt(lu)
+        if rec_start != start or rec_end is None or lu_dt is None:
+            return None
+        if not (rec_end == end or (rec_end <= end and lu_dt <= rec_end)):
+            return None
+        try:
+            return json.loads(self._partial_path(bid).read_text(encoding="utf-8"))
+        except Exception:
+            return None
+
+    def store_partial(self, bid: str, start: datetime, end: datetime, rules: str, data: Dict[str, Any]) -> None:
+        lu = self.meta.get(bid, {}).get("last_updated")
+        if lu is None:
+            return
+        try:
+            PARTIALS_DIR.mkdir(parents=True, exist_ok=True)
+            path = self._partial_path(bid)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+            self._index[bid] = {
+                "last_updated": lu,
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "rules": rules,
+            }
+            self._save_index()
+        except Exception:
+            pass
+
+    # ====== persistencia ======
+    @staticmethod
+    def _partial_path(bid: str) -> Path:
+        return PARTIALS_DIR / f"{hashlib.sha1(bid.encode('utf-8')).hexdigest()}.json"
+
+    @staticmethod
+    def _load_index() -> Dict[str, Dict[str, Any]]:
+        try:
+            data = json.loads(REGISTRY_FILE.read_text(encoding="utf-8"))
+            return dict(data.get("fetched") or {})
+        except Exception:
+            return {}
+
+    def _save_index(self) -> None:
+        try:
+            REGISTRY_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = REGISTRY_FILE.with_suffix(".tmp")
+            tmp.write_text(json.dumps({
+                "hostname": self.hostname,
+                "buckets": self.meta,
+                "fetched": self._index,
+            }, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, REGISTRY_FILE)
+        except Exception:
+            pass
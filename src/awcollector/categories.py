@@ -0,0 +1,115 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\categories.py
+from __future__ import annotations
+import re
+import json
+from functools import lru_cache
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple, DefaultDict
+
+UNCATEGORIZED = "Sin categoría"
+SEP = " > "
+
+# Tope de memoización por motor (claves distintas); al llenarse se vacía
+_MEMO_MAX = 200_000
+
+
+def _keyword(k: str) -> str:
+    """
+    Palabra clave → patrón. Con un punto es un dominio (o parte, "docs.google") y debe
+    coincidir en límites de etiqueta: "x.com" vale en "x.com" o "m.x.com", no en
+    "dropbox.com" ni "netflix.com". Las demás coinciden en cualquier parte del texto.
+    """
+    if "." in k:
+        return f"(?<![\\w-]){re.escape(k)}(?![\\w-])"
+    return re.escape(k)
+
+
+
+class CategoryEngine:
+    """
+    Clasificador de reglas al estilo de las categorías de ActivityWatch.
+
+    Cada regla mapea una expresión regular y/o palabras clave a una categoría
+    jerárquica ("Trabajo > Programación"). Todas las reglas se compilan en una sola
+    expresión: una cadena de lookaheads opcionales anclados al inicio, uno por regla,
+    de modo que un único .match() informa qué reglas coinciden. Gana la categoría más
+    profunda y, a igual profundidad, la regla que va primero. El resultado se memoiza
+    por clave, así clasificar un día cuesta lo que sus claves distintas, no sus eventos.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]]) -> None:
+        self._cats: List[Tuple[str, ...]] = []
+        parts: List[str] = []
+        for rule in rules:
+            cat = rule.get("category")
+            path = tuple(cat) if isinstance(cat, list) else tuple(
+                p.strip() for p in str(cat or "").split(">") if p.strip())
+            alts = []
+            if rule.get("regex"):
+                alts.append(f"(?:{rule['regex']})")
+            if rule.get("keywords"):
+                alts.append("|".join(_keyword(k) for k in rule["keywords"] if k))
+            if not path or not alts:
+                continue
+            flags = "(?i:" if rule.get("ignore_case", True) else "(?:"
+            parts.append(f"(?=[\\s\\S]*?(?P<r{len(self._cats)}>{flags}{'|'.join(alts)})))?")
+            self._cats.append(path)
+        self._rx = re.compile("^" + "".join(parts)) if parts else None
+        # prioridad: más profunda primero, luego orden de la regla
+        self._order = sorted(range(len(self._cats)), key=lambda i: (-len(self._cats[i]), i))
+        self._memo: Dict[str, Tuple[str, ...]] = {}
+
+    def classify(self, text: str) -> Tuple[str, ...]:
+        cat = self._memo.get(text)
+        if cat is None:
+            cat = (UNCATEGORIZED,)
+            m = self._rx.match(text) if self._rx is not None else None
+            if m is not None:
+                for i in self._order:
+                    if m.group(f"r{i}") is not None:
+                        cat = self._cats[i]
+                        break
+            if len(self._memo) >= _MEMO_MAX:
+                self._memo.clear()
+            self._memo[text] = cat
+        return cat
+
+
+def _rollup(totals: Dict[Tuple[str, ...], float], unit: float = 1.0) -> List[Dict[str, Any]]:
+    """Suma cada categoría en ella misma y en todos sus ancestros."""
+    acc: DefaultDict[str, float] = defaultdict(float)
+    for path, sec in totals.items():
+        for depth in range(1, len(path) + 1):
+            acc[SEP.join(path[:depth])] += sec
+    return [{"category": k, "total_sec": round(v / unit, 2)}
+            for k, v in sorted(acc.items(), key=lambda x: x[1], reverse=True)]
+
+
+def categorize(engine: CategoryEngine, app_titles: Dict[str, Dict[str, float]],
+               domain_totals: Dict[str, float], unit: float = 1.0) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Totales por categoría:
+    - "apps": tiempo de ventana clasificado por "app título"
+    - "web": tiempo de navegador clasificado por dominio
+    - unit: unidades por segundo de los valores de entrada (1e6 si vienen en µs)
+    """
+    apps: DefaultDict[Tuple[str, ...], float] = defaultdict(float)
+    for app, titles in app_titles.items():
+        for title, sec in titles.items():
+            apps[engine.classify(f"{app} {title}")] += sec
+    web: DefaultDict[Tuple[str, ...], float] = defaultdict(float)
+    for dom, sec in domain_totals.items():
+        web[engine.classify(dom)] += sec
+    return {"apps": _rollup(apps, unit), "web": _rollup(web, unit)}
+
+
+@lru_cache(maxsize=4)
+def _compiled(signature: str) -> CategoryEngine:
+    return CategoryEngine(json.loads(signature))
+
+
+def get_engine(settings: Dict[str, Any]) -> Optional[CategoryEngine]:
+    """Motor compilado para las reglas de settings (None si categories_enabled=False)."""
+    if not settings.get("categories_enabled", True):
+        return None
+    return _compiled(json.dumps(settings.get("category_rules") or [], sort_keys=True))
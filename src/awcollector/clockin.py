@@ -0,0 +1,117 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\clockin.py
+from __future__ import annotations
+import uuid
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable, Set
+
+from tzlocal import get_localzone
+
+from .photo_api import spool_photo, upload_spooled
+from .spool import get_spool
+
+
+def _receipt(meta: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: meta.get(k) for k in ("correlation_id", "tipo", "marcado_local")}
+
+
+class ClockInQueue:
+    """
+    ENTRADA optimista (entrada_optimistic): la foto queda en el spool durable con la hora
+    local de la marcación y un correlation_id, y la UI muestra el comprobante al instante.
+    La subida y la respuesta del reconocimiento corren en este hilo:
+    - commit(): encola sin tocar la red y despierta al hilo; devuelve el comprobante.
+    - cada pendiente optimista se sube en orden de llegada; la ronda se corta solo ante un
+      error de red o el circuito abierto, y lo que queda se reintenta cada
+      entrada_optimistic_retry_sec. Un 5xx/429 deja esa marcación en cola y sigue con la
+      siguiente. Todo sobrevive a un reinicio de la app.
+    - una marcación rechazada (otro 4xx o sin foto) se descarta del spool: reenviarla
+      repetiría la ENTRADA con la hora vieja, y la UI pide volver a marcar. Así una
+      marcación mala no frena a las demás.
+    - on_result(comprobante, resultado, respuesta, msg), resultado como en upload_spooled:
+      "ok" con la respuesta del servidor, "rejected" una vez, y "retry"/"offline" solo en
+      el primer fallo de cada marcación (sigue en cola). Se llama desde este hilo.
+    La hora (marcado_local, ISO con zona) se toma al hacer clic y no cambia en los
+    reintentos. Es la hora que declara el equipo, sin firma: el spool es un archivo local
+    editable, así que el servidor debe tratarla como dato del cliente.
+    """
+
+    def __init__(
+        self,
+        settings: Dict[str, Any],
+        on_result: Optional[Callable[[Dict[str, Any], str, Optional[Dict[str, Any]], str], None]] = None,
+    ) -> None:
+        self.settings = settings
+        self.on_result = on_result
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._notified: Set[str] = set()  # marcaciones con el fallo ya avisado
+
+    # ====== ciclo de vida ======
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._wake.set()  # marcaciones que quedaron de una ejecución anterior
+        self._thread = threading.Thread(target=self._loop, name="clockin-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self) -> None:
+        retry = float(self.settings.get("entrada_optimistic_retry_sec", 30))
+        while not self._stop.is_set():
+            self._wake.wait(retry)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    # ====== marcación ======
+    def commit(self, photo_path: Path, tipo: str = "entrada") -> Optional[Dict[str, Any]]:
+        """Encola la marcación y devuelve el comprobante; None si no se pudo guardar."""
+        cid = str(uuid.uuid4())
+        marcado = datetime.now(get_localzone()).isoformat(timespec="seconds")
+        extra = {"marcado_local": marcado}
+        meta = {"optimistic": True, "correlation_id": cid, "tipo": tipo, "marcado_local": marcado}
+        item_id, _ = spool_photo(self.settings, photo_path, tipo, correlation_id=cid,
+                                 extra_fields=extra, meta_extra=meta)
+        if item_id is None:
+            return None
+        self._wake.set()
+        return _receipt(meta)
+
+    def pending(self) -> int:
+        return sum(1 for _, meta in get_spool().items() if meta.get("optimistic"))
+
+    def flush(self) -> None:
+        """Sube las marcaciones optimistas en cola; corta la ronda ante un error de red."""
+        spool = get_spool()
+        for item_id, meta in spool.items():
+            if self._stop.is_set():
+                return
+            if not meta.get("optimistic"):
+                continue
+            try:
+                result, msg, data = upload_spooled(self.settings, item_id, meta)
+            except Exception as e:
+                result, msg, data = "offline", f"Error de red al enviar la foto: {e}", None
+
+            if result == "rejected":
+                spool.done(item_id)  # no pasa a "Reenviar pendientes": duplicaría la ENTRADA
+            if result in ("ok", "rejected"):
+                self._notified.discard(item_id)
+                notify = True
+            else:
+                notify = item_id not in self._notified
+                self._notified.add(item_id)
+            if notify and self.on_result is not None:
+                self.on_result(_receipt(meta), result, data, msg)
+            if result == "offline":
+                return  # servidor caído o circuito abierto: el resto espera al reintento
@@ -12,6 +12,7 @@ SETTINGS_FILE = CONFIG_DIR / "settings.json"
 APPDATA = Path(os.environ.get("LOCALAPPDATA", str(ROOT))) / "ColectorAW"
 PENDING_DIR = APPDATA / "pending"
 LOGS_DIR = APPDATA / "logs"
+CACHE_DIR = APPDATA / "cache"
 
 # ➕ Pendientes específicos para fotos (JSON + copias de archivos)
 PENDING_PHOTOS_DIR = PENDING_DIR / "photos"
@@ -23,11 +24,131 @@ DEFAULTS = {
     "ingest_path": "/reports",
     "aw_base_url": "http://localhost:5600/api/0",
     "request_timeout_sec": 30,
+    # Plazo total de SALIDA (foto + reporte en paralelo); al vencer se muestra el modal
+    # con lo que haya respondido y el resto sigue en segundo plano.
+    "salida_deadline_sec": 40,
+    # ENTRADA optimista (clockin.py): la foto queda en pendientes con la hora local y el
+    # comprobante se muestra al instante; subida y reconocimiento siguen en segundo plano
+    "entrada_optimistic": False,
+    "entrada_optimistic_retry_sec": 30,
+    # Subida por partes reanudable (upload.py) para cuerpos grandes; el servidor debe
+    # exponer <endpoint>/uploads, si no se usa la subida de una sola petición.
+    "chunked_upload_enabled": True,
+    "chunked_upload_min_mb": 2,
+    "chunk_size_kb": 512,
 
     # ▶ SIN LÍMITE (0 = todos)
     "top_titles_limit": 0,
     "top_urls_limit": 0,
 
+    # Buckets: solo los del equipo local ("" = hostname actual); any_host=True los toma todos
+    "bucket_hostname": "",
+    "bucket_any_host": False,
+
+    # Origen de eventos: "http" (API de aw-server) o "sqlite" (lectura directa del
+    # datastore de aw-server-rust; si no se puede abrir se usa HTTP)
+    "aw_backend": "http",
+    "aw_sqlite_path": "",             # "" = ubicación por defecto de aw-server-rust
+
+    # Métricas locales (metrics.py): archivo Prometheus en logs/ para el textfile
+    # collector de node_exporter y, con metrics_port > 0, /metrics en 127.0.0.1
+    "metrics_enabled": True,
+    "metrics_textfile_sec": 60,
+    "metrics_port": 0,
+
+    # Circuito por endpoint (breaker.py): tras circuit_failures fallos de red seguidos los
+    # envíos van directo a pendientes hasta que un sondeo en segundo plano responda
+    "circuit_enabled": True,
+    "circuit_failures": 2,
+    "circuit_probe_sec": 5,           # primer sondeo; luego se duplica hasta 60 s
+    "circuit_reset_sec": 120,         # pasado este tiempo se permite un envío real de prueba
+    "connect_timeout_sec": 5,
+    "adaptive_timeout": True,         # timeout de lectura = 4 × p95 de latencia (entre min y request_timeout_sec)
+    "timeout_min_sec": 5,
+
+    # Perfilado (profiling.py): True = cada envío de reporte deja un zip con cProfile y
+    # tracemalloc en logs/profiles. Ctrl+Shift+P en la ventana perfila solo el próximo.
+    "profile_sends": False,
+
+    # === Reducción de cardinalidad de títulos/URLs (normalize.py) ===
+    # Opcional: al activarla cambian los títulos/URLs del payload (se quitan query y
+    # fragmento salvo url_keep_params, se colapsan IDs y se reescriben títulos)
+    "normalize_enabled": False,
+    "url_keep_params": [],            # params de query que se conservan (["*"] = todos)
+    "url_strip_fragment": True,
+    "collapse_numeric_ids": True,     # /pedido/12345 → /pedido/{id}; "Factura 004512" → "Factura {n}"
+    "numeric_id_min_digits": 4,
+    "title_rewrite_rules": [          # [regex, reemplazo], en orden
+        [r"^\(\d+\)\s*", ""],            # contadores: "(3) Bandeja de entrada"
+        [r"^[*●•]\s*|\s*\*(?=\s+[-–—]\s)|\s*\*$", ""],  # marcadores de "sin guardar"
+        [r"\b\d{1,2}:\d{2}(:\d{2})?\b", "{hh:mm}"],  # horas embebidas
+    ],
+    # Formato del payload: "auto" = v1 hasta que el servidor anuncie v2 (X-Payload-Versions);
+    # "v1" o "v2" lo fuerzan. v2: tabla de strings y segundos por título/URL (payload_v2.py)
+    "payload_version": "auto",
+    # Tamaño máximo del payload en bytes (0 = sin límite); recorta la cola de los top
+    "payload_max_bytes": 0,
+
+    # Línea de tiempo del día en bins de N minutos (0 = sin timeline)
+    "timeline_bin_min": 60,
+
+    # Sesiones de foco (focus.py): tramos continuos en una app, solo tiempo no-AFK.
+    # Un hueco mayor que focus_gap_sec corta la sesión; < focus_short_sec = sesión corta
+    "focus_enabled": True,
+    "focus_gap_sec": 60,
+    "focus_short_sec": 60,
+
+    # Días muy grandes: con shard_min_events eventos o más en un bucket el plegado se
+    # reparte en procesos (0 = nunca). shard_workers 0 = núcleos - 1 (máx. 4)
+    "shard_min_events": 150000,
+    "shard_workers": 0,
+
+    # === Categorías (categories.py): regex y/o palabras clave → "Padre > Hijo" ===
+    # Una palabra clave con punto ("x.com", "docs.google") es un dominio: solo coincide
+    # entera entre etiquetas ("m.x.com" sí, "dropbox.com" no)
+    "categories_enabled": True,
+    "category_rules": [
+        {"category": "Trabajo > Programación",
+         "regex": r"\b(code|pycharm\d*|idea\d*|devenv|sublime_text|notepad\+\+)\.exe\b",
+         "keywords": ["github", "gitlab", "stackoverflow"]},
+        {"category": "Trabajo > Ofimática",
+         "keywords": ["excel", "winword", "powerpnt", "onenote", "docs.google", "sheets.google"]},
+        {"category": "Comunicación",
+         "keywords": ["teams", "zoom", "slack", "outlook", "whatsapp", "mail.google", "meet.google"]},
+        {"category": "Ocio > Multimedia",
+         "keywords": ["youtube", "netflix", "spotify", "twitch"]},
+        {"category": "Ocio > Redes sociales",
+         "keywords": ["facebook", "instagram", "tiktok", "twitter", "x.com", "linkedin"]},
+    ],
+
+    # Resumen rodante del día: cada N minutos se pliega lo nuevo (0 = desactivado).
+    # El margen deja fuera los últimos minutos, que ActivityWatch aún puede extender.
+    "rolling_refresh_min": 5,
+    "rolling_margin_min": 5,
+    # Consulta local del resumen rodante (summary_server.py): GET /today y /pending en
+    # 127.0.0.1:<summary_port> con ETag (0 = apagado; requiere el resumen rodante)
+    "summary_port": 0,
+    "summary_top_n": 10,
+
+    # Envíos automáticos (scheduler.py): el informe de ayer si el servidor no tiene
+    # ninguno de ese día y, con schedule_report_time="HH:MM", el del día a esa hora.
+    # Cada equipo desplaza las horas un tramo fijo dentro de schedule_jitter_min.
+    # Opcional: "ya enviado" sale de cache/sent-reports.json, que solo registra envíos
+    # hechos desde esta versión; los días enviados antes podrían enviarse de nuevo
+    "schedule_yesterday": False,
+    "schedule_report_time": "",       # "" = sin envío diario programado
+    "schedule_jitter_min": 30,
+    "schedule_startup_delay_sec": 60,
+    "schedule_retry_min": 15,         # reintento de pendientes y tras un fallo
+
+    # Resúmenes por día guardados en cache/days para acumulados semana/mes (0 = sin límite)
+    "day_summaries_keep_days": 400,
+    # Caché de informes ya armados (reportcache.py): el de ayer se reutiliza mientras
+    # los buckets no cambien. Se desaloja por edad y por tamaño total
+    "report_cache_enabled": True,
+    "report_cache_max_age_h": 48,
+    "report_cache_max_kb": 4096,
+
     # === API de marcación con foto ===
     "photo_api_url": "https://app.appfastway.com",
     "photo_ingest_path": "/app/marcacion/auto",
@@ -36,11 +157,23 @@ DEFAULTS = {
     "photo_max_mb": 8,
     "photo_default_umbral": 0.55,
     "photo_auth_token": "",
+
+    # Control local de la foto antes de enviarla (photo_quality.py)
+    "photo_quality_enabled": True,
+    "photo_ring_frames": 8,         # cuadros recientes entre los que se elige el mejor
+    "photo_blur_min": 40,           # varianza del Laplaciano mínima (nitidez)
+    "photo_frozen_diff_max": 0.1,   # diferencia media entre cuadros bajo la cual se considera congelada
+    "photo_min_brightness": 25,     # brillo medio mínimo (0-255); debajo = cámara tapada
+    # Exigir rostro detectado: opcional, con poca luz puede rechazar marcaciones válidas
+    "photo_require_face": False,
+    # Fotos en pendientes: se re-codifican si pesan más de esto (0 = usar photo_max_mb)
+    "photo_spool_max_kb": 512,
 }
 
 def ensure_dirs() -> None:
     PENDING_DIR.mkdir(parents=True, exist_ok=True)
     LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
     PENDING_PHOTOS_DIR.mkdir(parents=True, exist_ok=True)
     PENDING_PHOTOS_FILES_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -74,4 +207,87 @@ def load_settings() -> dict:
     except Exception:
         cfg["photo_default_umbral"] = 0.55
 
+    for key, default in (("photo_blur_min", 40.0), ("photo_frozen_diff_max", 0.1),
+                         ("photo_min_brightness", 25.0)):
+        try:
+            cfg[key] = max(0.0, float(cfg.get(key, default)))
+        except Exception:
+            cfg[key] = default
+    try:
+        cfg["photo_spool_max_kb"] = max(0.0, float(cfg.get("photo_spool_max_kb", 512)))
+    except Exception:
+        cfg["photo_spool_max_kb"] = 512.0
+    try:
+        cfg["photo_ring_frames"] = max(1, int(cfg.get("photo_ring_frames", 8)))
+    except Exception:
+        cfg["photo_ring_frames"] = 8
+
+    for key, default in (("rolling_refresh_min", 5.0), ("rolling_margin_min", 5.0),
+                         ("salida_deadline_sec", 40.0), ("timeline_bin_min", 60.0),
+                         ("focus_gap_sec", 60.0), ("focus_short_sec", 60.0)):
+        try:
+            cfg[key] = max(0.0, float(cfg.get(key, default)))
+        except Exception:
+            cfg[key] = default
+    try:
+        cfg["entrada_optimistic_retry_sec"] = max(5.0, float(cfg.get("entrada_optimistic_retry_sec", 30)))
+    except Exception:
+        cfg["entrada_optimistic_retry_sec"] = 30.0
+
+    try:
+        cfg["chunked_upload_min_mb"] = max(0.0, float(cfg.get("chunked_upload_min_mb", 2)))
+        cfg["chunk_size_kb"] = max(16, int(cfg.get("chunk_size_kb", 512)))
+    except Exception:
+        cfg["chunked_upload_min_mb"] = 2.0
+        cfg["chunk_size_kb"] = 512
+    try:
+        cfg["day_summaries_keep_days"] = max(0, int(cfg.get("day_summaries_keep_days", 400)))
+    except Exception:
+        cfg["day_summaries_keep_days"] = 400
+    for key, default in (("schedule_jitter_min", 30.0), ("schedule_startup_delay_sec", 60.0),
+                         ("schedule_retry_min", 15.0)):
+        try:
+            cfg[key] = max(0.0, float(cfg.get(key, default)))
+        except Exception:
+            cfg[key] = default
+    cfg["schedule_retry_min"] = max(1.0, cfg["schedule_retry_min"])
+    try:
+        cfg["report_cache_max_age_h"] = max(0.0, float(cfg.get("report_cache_max_age_h", 48)))
+        cfg["report_cache_max_kb"] = max(0.0, float(cfg.get("report_cache_max_kb", 4096)))
+    except Exception:
+        cfg["report_cache_max_age_h"] = 48.0
+        cfg["report_cache_max_kb"] = 4096.0
+    try:
+        cfg["payload_max_bytes"] = max(0, int(cfg.get("payload_max_bytes", 0)))
+    except Exception:
+        cfg["payload_max_bytes"] = 0
+    try:
+        cfg["shard_min_events"] = max(0, int(cfg.get("shard_min_events", 150000)))
+        cfg["shard_workers"] = max(0, int(cfg.get("shard_workers", 0)))
+    except Exception:
+        cfg["shard_min_events"] = 150000
+        cfg["shard_workers"] = 0
+    try:
+        cfg["metrics_textfile_sec"] = max(5.0, float(cfg.get("metrics_textfile_sec", 60)))
+        cfg["metrics_port"] = max(0, int(cfg.get("metrics_port", 0)))
+    except Exception:
+        cfg["metrics_textfile_sec"] = 60.0
+        cfg["metrics_port"] = 0
+    try:
+        cfg["summary_port"] = max(0, int(cfg.get("summary_port", 0)))
+        cfg["summary_top_n"] = min(100, max(1, int(cfg.get("summary_top_n", 10))))
+    except Exception:
+        cfg["summary_port"] = 0
+        cfg["summary_top_n"] = 10
+    for key, default in (("circuit_probe_sec", 5.0), ("circuit_reset_sec", 120.0),
+                         ("connect_timeout_sec", 5.0), ("timeout_min_sec", 5.0)):
+        try:
+            cfg[key] = max(1.0, float(cfg.get(key, default)))
+        except Exception:
+            cfg[key] = default
+    try:
+        cfg["circuit_failures"] = max(1, int(cfg.get("circuit_failures", 2)))
+    except Exception:
+        cfg["circuit_failures"] = 2
+
     return cfg
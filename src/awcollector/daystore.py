@@ -0,0 +1,66 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\daystore.py
+from __future__ import annotations
+import os
+import json
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from .config import CACHE_DIR
+
+DAYS_DIR = CACHE_DIR / "days"
+
+
+def _day_path(day: date) -> Path:
+    return DAYS_DIR / f"{day.isoformat()}.json"
+
+
+def save_day(day: date, summary: Dict[str, Any], complete: bool, rules: str) -> None:
+    """
+    Guarda el resumen compacto de un día (totales por app/título y dominio/URL + totales
+    del día). complete=False marca un día aún abierto o consultado antes de cerrarse:
+    se vuelve a pedir a ActivityWatch la próxima vez que se necesite.
+    """
+    try:
+        DAYS_DIR.mkdir(parents=True, exist_ok=True)
+        path = _day_path(day)
+        tmp = path.with_suffix(".tmp")
+        data = dict(summary)
+        data.pop("timeline", None)  # la línea de tiempo no se acumula entre días
+        tmp.write_text(json.dumps({
+            "date": day.isoformat(),
+            "rules": rules,
+            "complete": bool(complete),
+            "saved_at": datetime.now().isoformat(),
+            "summary": data,
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def load_day(day: date, rules: str) -> Optional[Dict[str, Any]]:
+    """Resumen guardado del día si está completo y se armó con las mismas reglas; si no, None."""
+    try:
+        data = json.loads(_day_path(day).read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if not data.get("complete") or data.get("rules") != rules:
+        return None
+    return data.get("summary") or None
+
+
+def prune_days(keep_days: int) -> int:
+    """Borra resúmenes de más de keep_days días (0 = conservar todo). Devuelve cuántos borró."""
+    if keep_days <= 0 or not DAYS_DIR.exists():
+        return 0
+    limit = (datetime.now().date() - timedelta(days=keep_days)).isoformat()
+    removed = 0
+    for p in DAYS_DIR.glob("*.json"):
+        if p.stem < limit:
+            try:
+                p.unlink()
+                removed += 1
+            except Exception:
+                pass
+    return removed
@@ -0,0 +1,78 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\events.py
+from __future__ import annotations
+import json
+from operator import attrgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import msgspec  # opcional: decodifica la respuesta directo a structs, sin dicts intermedios
+except ImportError:
+    msgspec = None
+
+# Campos de `data` que usa el agregado por clase de bucket; el resto (y "id") se descarta
+# al decodificar. input queda en dicts: cada watcher nombra distinto sus contadores.
+DATA_FIELDS = {
+    "afk": ("status",),
+    "window": ("app", "executable", "title"),
+    "web": ("url",),
+}
+
+
+def _structs() -> Dict[str, Any]:
+    # Structs congelados y fuera del GC (solo contienen str/float): crear 100k no dispara
+    # recolecciones y ocupan la mitad que un dict por evento. Las clases (p.ej. WindowEvent)
+    # quedan como globales del módulo: pickle las necesita al repartir el plegado
+    out = {}
+    for kind, fields in DATA_FIELDS.items():
+        data = msgspec.defstruct(f"{kind.title()}Data", [(f, Optional[str], None) for f in fields],
+                                 frozen=True, gc=False, module=__name__)
+        event = msgspec.defstruct(f"{kind.title()}Event", [
+            ("timestamp", str),
+            ("duration", Optional[float], None),
+            ("data", data, msgspec.field(default_factory=data)),
+        ], frozen=True, gc=False, module=__name__)
+        globals()[data.__name__] = data
+        globals()[event.__name__] = event
+        out[kind] = event
+    return out
+
+
+_STRUCTS = _structs() if msgspec is not None else {}
+_DECODERS = {kind: msgspec.json.Decoder(List[event]) for kind, event in _STRUCTS.items()}
+# (timestamp, duration, *campos) de un struct en una sola llamada en C
+_GETTERS = {kind: attrgetter("timestamp", "duration", *(f"data.{f}" for f in fields))
+            for kind, fields in DATA_FIELDS.items()}
+
+
+def decode_events(kind: str, body: bytes) -> List[Any]:
+    """
+    Cuerpo de /events → lista de eventos. Con msgspec, afk/window/web llegan como structs
+    con timestamp, duration y data.<campo> (None si falta) y nada más; sin msgspec (o si
+    un tipo no encaja, p.ej. data: null) quedan los dicts de json. Leerlos con rows().
+    """
+    decoder = _DECODERS.get(kind)
+    if decoder is not None:
+        try:
+            return decoder.decode(body)
+        except msgspec.ValidationError:
+            pass
+    return json.loads(body)
+
+
+def rows(kind: str, events: List[Any]) -> Iterable[Tuple[Any, ...]]:
+    """
+    (timestamp, duración en s, *DATA_FIELDS[kind]) por evento, sean structs de
+    decode_events o dicts (json, export, SQLite). Los campos que faltan son None, y
+    también la duración de un struct que no la trae (leer como `dur or 0.0`).
+    """
+    if events and not isinstance(events[0], dict):
+        return map(_GETTERS[kind], events)
+    return _dict_rows(DATA_FIELDS[kind], events)
+
+
+def _dict_rows(fields: Tuple[str, ...], events: List[Dict[str, Any]]) -> Iterator[Tuple[Any, ...]]:
+    for ev in events:
+        d = ev.get("duration")
+        # ActivityWatch suele incluir "duration" en segundos; si no, 0
+        dur = float(d) if isinstance(d, (int, float)) else 0.0
+        yield (ev.get("timestamp"), dur) + tuple(map((ev.get("data") or {}).get, fields))
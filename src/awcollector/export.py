@@ -0,0 +1,174 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\export.py
+from __future__ import annotations
+import json
+from pathlib import Path
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterator, List, Tuple, TextIO
+
+import numpy as np
+
+from .timeline import epoch_seconds
+
+# Tamaño de lectura y de los lotes de eventos que se entregan por bucket
+_CHUNK = 1 << 20
+_BATCH = 5000
+_WS = " \t\n\r"
+
+
+class ExportFormatError(ValueError):
+    """El archivo no tiene la forma de un export de ActivityWatch."""
+
+
+class _Reader:
+    """
+    Lector JSON incremental mínimo: recorre objetos/arrays a mano y decodifica cada
+    valor hoja (o cada evento completo) con json.raw_decode sobre un búfer que se
+    rellena por bloques. Nunca tiene en memoria más que un bloque y el valor actual.
+    """
+
+    def __init__(self, fh: TextIO) -> None:
+        self._fh = fh
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._dec = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        data = self._fh.read(_CHUNK)
+        if not data:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WS:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ExportFormatError(f"se esperaba '{ch}' cerca de la posición {self._pos}")
+        self._pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                val, end = self._dec.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise ExportFormatError("JSON incompleto o inválido")
+            # un número al final del búfer puede seguir en el próximo bloque
+            if end == len(self._buf) and not self._eof and self._fill():
+                continue
+            self._pos = end
+            return val
+
+    def members(self) -> Iterator[str]:
+        """Recorre las claves de un objeto; el llamador consume cada valor."""
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            ch = self.peek()
+            self._pos += 1
+            if ch == "}":
+                return
+            if ch != ",":
+                raise ExportFormatError("objeto mal formado")
+
+    def items(self) -> Iterator[None]:
+        """Recorre los elementos de un array; el llamador consume cada valor."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield None
+            ch = self.peek()
+            self._pos += 1
+            if ch == "]":
+                return
+            if ch != ",":
+                raise ExportFormatError("array mal formado")
+
+
+def iter_export(path: Path) -> Iterator[Tuple[str, str, Any]]:
+    """
+    Recorre un export de ActivityWatch ({"buckets": {id: {..., "events": [...]}}}) sin
+    cargarlo entero. Emite tuplas:
+    - ("begin", bucket_id, meta)  al llegar a "events" (meta leída hasta ahí: type, hostname…)
+    - ("events", bucket_id, [eventos])  en lotes
+    - ("end", bucket_id, meta)  con la meta completa del bucket
+    """
+    with open(path, "r", encoding="utf-8-sig") as fh:
+        rd = _Reader(fh)
+        found = False
+        for top in rd.members():
+            if top != "buckets":
+                rd.value()
+                continue
+            found = True
+            for bid in rd.members():
+                meta: Dict[str, Any] = {"id": bid}
+                for key in rd.members():
+                    if key != "events":
+                        meta[key] = rd.value()
+                        continue
+                    yield "begin", bid, dict(meta)
+                    batch: List[Dict[str, Any]] = []
+                    for _ in rd.items():
+                        batch.append(rd.value())
+                        if len(batch) >= _BATCH:
+                            yield "events", bid, batch
+                            batch = []
+                    if batch:
+                        yield "events", bid, batch
+                yield "end", bid, meta
+        if not found:
+            raise ExportFormatError("el archivo no trae la clave 'buckets'")
+
+
+def clip_events(
+    events: List[Dict[str, Any]],
+    ranges: List[Tuple[datetime, datetime]],
+) -> List[List[Dict[str, Any]]]:
+    """
+    Reparte un lote de eventos entre los rangos pedidos y los recorta a cada rango, igual
+    que hace aw-server al consultar con start/end. Conserva el orden del lote.
+    """
+    out: List[List[Dict[str, Any]]] = [[] for _ in ranges]
+    if not events:
+        return out
+    starts = epoch_seconds([str(ev.get("timestamp")) for ev in events])
+    durs = np.array([float(ev.get("duration") or 0.0) if isinstance(ev.get("duration"), (int, float)) else 0.0
+                     for ev in events])
+    ends = starts + durs
+    for r, (rs, re_) in enumerate(ranges):
+        a, b = rs.timestamp(), re_.timestamp()
+        hit = np.nonzero((ends > a) & (starts < b))[0]
+        inside = (starts[hit] >= a) & (ends[hit] <= b)
+        for i, whole in zip(hit.tolist(), inside.tolist()):
+            ev = events[i]
+            if whole:
+                out[r].append(ev)
+                continue
+            ts = datetime.fromisoformat(str(ev.get("timestamp")).replace("Z", "+00:00"))
+            te = ts + timedelta(seconds=float(durs[i]))
+            ns, ne = max(ts, rs), min(te, re_)
+            ns = ns.astimezone(timezone.utc)
+            out[r].append({**ev, "timestamp": ns.isoformat(), "duration": (ne - ns).total_seconds()})
+    return out
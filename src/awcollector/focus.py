@@ -0,0 +1,281 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\focus.py
+from __future__ import annotations
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+US = 1_000_000
+
+# Límites (s) del histograma de duración de sesiones de foco; el último bucket es "más"
+SESSION_BUCKETS = (60, 300, 900, 1800, 3600)
+_BOUNDS_US = tuple(b * US for b in SESSION_BUCKETS)
+
+# [app, inicio, fin] en segundos epoch
+Session = List[Any]
+
+
+def _union(a: List[List[float]], b: List[List[float]]) -> List[List[float]]:
+    """Unión de dos listas ordenadas de intervalos [inicio, fin] (se funden los que se tocan)."""
+    out: List[List[float]] = []
+    i = j = 0
+    while i < len(a) or j < len(b):
+        if j >= len(b) or (i < len(a) and a[i][0] <= b[j][0]):
+            s, e = a[i]
+            i += 1
+        else:
+            s, e = b[j]
+            j += 1
+        if out and s <= out[-1][1]:
+            if e > out[-1][1]:
+                out[-1][1] = e
+        else:
+            out.append([s, e])
+    return out
+
+
+class FocusStats:
+    """
+    Fragmentación del tiempo de ventana, en una pasada y fusionable:
+    - sesión = tramo continuo en la misma app (huecos <= gap_sec no la cortan),
+      contando solo el tiempo no-AFK;
+    - cambio = paso a otra app sin un hueco mayor que gap_sec;
+    - histograma de duración de sesiones (cantidad y µs por bucket), sesión más larga y
+      tiempo en sesiones cortas (< short_sec).
+    La primera y la última sesión de cada tramo quedan abiertas (head/tail): al fusionar
+    tramos contiguos se unen si siguen en la misma app, así que el resultado no depende de
+    cómo se partió el rango. El estado (lo que se fusiona y se guarda) es de tamaño fijo:
+    contadores y esas dos sesiones. Los intervalos no-AFK son contexto del plegado de un
+    rango: las ventanas se recortan contra ellos al plegarse y no se conservan.
+    """
+
+    def __init__(self, gap_sec: float = 60.0, short_sec: float = 60.0) -> None:
+        self.gap_sec = float(gap_sec)
+        self.short_sec = float(short_sec)
+        # Contexto del plegado (no se fusiona ni se guarda):
+        # - not_afk: intervalos no-AFK de los buckets afk plegados aquí (None = ninguno)
+        # - clip_to: intervalos contra los que se recortan las ventanas; None = sin datos
+        #   de AFK: cuenta todo el tiempo de ventana
+        self.not_afk: Optional[List[List[float]]] = None
+        self.clip_to: Optional[List[List[float]]] = None
+        # Export: las ventanas pueden llegar antes que el bucket afk del equipo; se guardan
+        # compactas (arrays) hasta resolve()
+        self.defer = False
+        self._deferred: List[Tuple[np.ndarray, np.ndarray, List[str]]] = []
+        self.switches = 0
+        self.hist_n = [0] * (len(SESSION_BUCKETS) + 1)
+        self.hist_us = [0] * (len(SESSION_BUCKETS) + 1)
+        self.short_us = 0
+        self.longest_us = 0
+        self.head: Optional[Session] = None
+        self.tail: Optional[Session] = None
+        self.single = False  # head y tail son la misma sesión
+
+    def empty_like(self) -> "FocusStats":
+        return FocusStats(self.gap_sec, self.short_sec)
+
+    # --- plegado ---
+    def add_active(self, starts: np.ndarray, ends: np.ndarray, active: List[int]) -> None:
+        """Anota en not_afk los tramos no-AFK (contexto para recortar las ventanas del rango)."""
+        if self.not_afk is None:
+            self.not_afk = []
+        mask = np.asarray(active, dtype=bool)
+        if not mask.any():
+            return
+        s, e = starts[mask], ends[mask]
+        order = np.argsort(s, kind="stable")
+        new = _union([], [[float(a), float(b)] for a, b in zip(s[order], e[order]) if b > a])
+        self.not_afk = _union(self.not_afk, new)
+
+    def add_windows(self, starts: np.ndarray, ends: np.ndarray, apps: List[str]) -> None:
+        if len(apps) == 0:
+            return
+        if self.defer:
+            self._deferred.append((starts, ends, list(apps)))
+            return
+        order = np.argsort(starts, kind="stable")  # la API entrega los más recientes primero
+        chunk = self.empty_like()
+        chunk._reduce(starts[order].tolist(), ends[order].tolist(), [apps[i] for i in order.tolist()],
+                      self.clip_to)
+        self._merge_sessions(chunk)
+
+    def resolve(self, clip_to: Optional[List[List[float]]]) -> None:
+        """Pliega las ventanas diferidas recortándolas a `clip_to` (None = sin recorte)."""
+        self.defer = False
+        self.clip_to = clip_to
+        deferred, self._deferred = self._deferred, []
+        for starts, ends, apps in deferred:
+            self.add_windows(starts, ends, apps)
+
+    def _reduce(self, starts: List[float], ends: List[float], apps: List[str],
+                clip: Optional[List[List[float]]]) -> None:
+        gap = self.gap_sec
+        cur: Optional[Session] = None
+        k = 0
+        for s0, e0, app in zip(starts, ends, apps):
+            # recorte a no-AFK: el puntero solo avanza (ventanas ordenadas, sin solapes)
+            if clip is None:
+                pieces = ((s0, e0),) if e0 > s0 else ()
+            else:
+                while k < len(clip) and clip[k][1] <= s0:
+                    k += 1
+                pieces = []
+                j = k
+                while j < len(clip) and clip[j][0] < e0:
+                    a, b = max(s0, clip[j][0]), min(e0, clip[j][1])
+                    if b > a:
+                        pieces.append((a, b))
+                    j += 1
+            for s, e in pieces:
+                if cur is None:
+                    cur = [app, s, e]
+                    continue
+                hole = s - cur[2]
+                if app == cur[0] and hole <= gap:
+                    if e > cur[2]:
+                        cur[2] = e
+                    continue
+                if app != cur[0] and hole <= gap:
+                    self.switches += 1
+                if self.head is None:
+                    self.head = cur
+                else:
+                    self._close(cur)
+                cur = [app, s, e]
+        if cur is not None:
+            if self.head is None:
+                self.head, self.single = cur, True
+            self.tail = cur
+
+    def _close(self, sess: Session) -> None:
+        dur = round((sess[2] - sess[1]) * US)
+        i = bisect_left(_BOUNDS_US, dur)
+        self.hist_n[i] += 1
+        self.hist_us[i] += dur
+        if dur < self.short_sec * US:
+            self.short_us += dur
+        if dur > self.longest_us:
+            self.longest_us = dur
+
+    # --- fusión ---
+    def merge(self, other: "FocusStats") -> "FocusStats":
+        if other._deferred:
+            self.defer = True
+            self._deferred.extend(other._deferred)
+        self._merge_sessions(other)
+        return self
+
+    def _merge_sessions(self, other: "FocusStats") -> None:
+        if other.head is None:
+            self._add_counts(other)
+            return
+        if self.head is None:
+            self._add_counts(other)
+            self.head, self.tail, self.single = _copy(other.head), _copy(other.tail), other.single
+            if self.single:
+                self.tail = self.head
+            return
+        # a = tramo anterior, b = posterior (los tramos no se solapan)
+        if other.head[1] >= self.head[1]:
+            a_head, a_tail, a_single = self.head, self.tail, self.single
+            b_head, b_tail, b_single = _copy(other.head), _copy(other.tail), other.single
+        else:
+            a_head, a_tail, a_single = _copy(other.head), _copy(other.tail), other.single
+            b_head, b_tail, b_single = self.head, self.tail, self.single
+        if a_single:
+            a_tail = a_head
+        if b_single:
+            b_tail = b_head
+        self._add_counts(other)
+        hole = b_head[1] - a_tail[2]
+        if a_tail[0] == b_head[0] and hole <= self.gap_sec:
+            joined = [a_tail[0], a_tail[1], max(a_tail[2], b_head[2])]
+            if a_single and b_single:
+                self.head = self.tail = joined
+                self.single = True
+                return
+            if a_single:
+                self.head, self.tail = joined, b_tail
+            elif b_single:
+                self.head, self.tail = a_head, joined
+            else:
+                self.head, self.tail = a_head, b_tail
+                self._close(joined)
+            self.single = False
+            return
+        if hole <= self.gap_sec:
+            self.switches += 1
+        if not a_single:
+            self._close(a_tail)
+        if not b_single:
+            self._close(b_head)
+        self.head, self.tail, self.single = a_head, b_tail, False
+
+    def _add_counts(self, other: "FocusStats") -> None:
+        self.switches += other.switches
+        self.hist_n = [x + y for x, y in zip(self.hist_n, other.hist_n)]
+        self.hist_us = [x + y for x, y in zip(self.hist_us, other.hist_us)]
+        self.short_us += other.short_us
+        self.longest_us = max(self.longest_us, other.longest_us)
+
+    # --- salida ---
+    def to_payload(self, active_sec: float) -> Dict[str, Any]:
+        done = self.empty_like()
+        done._add_counts(self)
+        if self.head is not None:
+            done._close(self.head)
+            if not self.single:
+                done._close(self.tail)
+        n = sum(done.hist_n)
+        total_us = sum(done.hist_us)
+        bounds = list(SESSION_BUCKETS) + [None]
+        return {
+            "switches": self.switches,
+            "switches_per_hour": round(self.switches / (active_sec / 3600), 2) if active_sec > 0 else 0.0,
+            "sessions": n,
+            "avg_session_sec": round(total_us / n / US, 2) if n else 0.0,
+            "longest_session_sec": round(done.longest_us / US, 2),
+            "short_sessions_sec": round(done.short_us / US, 2),
+            "session_hist": [{"le_sec": b, "count": c, "total_sec": round(u / US, 2)}
+                             for b, c, u in zip(bounds, done.hist_n, done.hist_us)],
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.defer:
+            self.resolve(None)
+        return {
+            "gap_sec": self.gap_sec,
+            "short_sec": self.short_sec,
+            "switches": self.switches,
+            "hist_n": self.hist_n,
+            "hist_us": self.hist_us,
+            "short_us": self.short_us,
+            "longest_us": self.longest_us,
+            "head": self.head,
+            "tail": self.tail,
+            "single": self.single,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "FocusStats":
+        f = cls(data.get("gap_sec", 60.0), data.get("short_sec", 60.0))
+        f.switches = int(data.get("switches", 0))
+        f.hist_n = [int(x) for x in data.get("hist_n") or f.hist_n]
+        f.hist_us = [int(x) for x in data.get("hist_us") or f.hist_us]
+        f.short_us = int(data.get("short_us", 0))
+        f.longest_us = int(data.get("longest_us", 0))
+        f.head = _copy(data.get("head"))
+        f.single = bool(data.get("single"))
+        f.tail = f.head if f.single else _copy(data.get("tail"))
+        return f
+
+
+def clip_union(a: Optional[List[List[float]]], b: Optional[List[List[float]]]) -> Optional[List[List[float]]]:
+    """Une el not_afk de varios buckets afk (None = todavía ninguno)."""
+    if b is None:
+        return a
+    return _union(a or [], b)
+
+
+def _copy(sess: Optional[Session]) -> Optional[Session]:
+    return list(sess) if sess is not None else None
@@ -0,0 +1,205 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\jobs.py
+from __future__ import annotations
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import LOGS_DIR
+from .metrics import JOB_SECONDS
+
+JOBS_LOG = LOGS_DIR / "jobs.log"
+
+
+class Cancelled(Exception):
+    """El usuario canceló el trabajo; se lanza en el siguiente punto de control."""
+
+
+class Job:
+    """
+    Trabajo lanzado desde la UI. El código del trabajo corre en un hilo del ejecutor y
+    solo habla con la UI por dos vías que terminan en la cola del hilo de Tk:
+    - progress(): evento de avance (fase, bucket, conteos); también es punto de cancelación.
+    - ui(fn, ...): cualquier otra cosa que toque widgets.
+    """
+
+    def __init__(self, runner: "JobRunner", name: str) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self._runner = runner
+        self._cancel = threading.Event()
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.status = "running"
+        self.last_progress: Dict[str, Any] = {}
+        # Sub-tareas de spawn() sin terminar y si fn ya volvió: el trabajo sigue en
+        # curso (current) hasta que las dos cosas acaben
+        self._spawned = 0
+        self._returned = False
+
+    # ====== cancelación ======
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise Cancelled(self.name)
+
+    # ====== canal hacia la UI ======
+    def progress(self, event: Dict[str, Any]) -> None:
+        """Publica un evento de avance ({"phase", "bucket", "events", "done", "total"…})."""
+        self.check()
+        event = {**event, "job": self.name, "elapsed": round(self.elapsed, 3)}
+        self.last_progress = event
+        listener = self._runner.on_progress
+        if listener is not None:
+            self._runner.dispatch(listener, self, event)
+
+    def phase(self, name: str) -> None:
+        self.progress({"phase": name})
+
+    def ui(self, fn: Callable[..., Any], *args: Any) -> None:
+        self._runner.dispatch(fn, *args)
+
+    def spawn(self, fn: Callable[..., Any], *args: Any) -> Future:
+        """
+        Sub-tarea en el mismo ejecutor (p.ej. foto y reporte en paralelo). Si sigue
+        corriendo cuando fn vuelve (plazo vencido), el trabajo no termina hasta que acabe:
+        así un trabajo nuevo no queda en cola detrás de los restos del anterior.
+        """
+        with self._runner._lock:
+            self._spawned += 1
+        try:
+            fut = self._runner.executor.submit(fn, *args)
+        except Exception:
+            self._runner._child_done(self)
+            raise
+        fut.add_done_callback(lambda _: self._runner._child_done(self))
+        return fut
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+
+class JobRunner:
+    """
+    Ejecutor único de los trabajos de la UI:
+    - un solo trabajo a la vez (submit devuelve None si hay uno en curso, contando las
+      sub-tareas de spawn() que sigan corriendo tras volver el trabajo),
+    - cancelación cooperativa (Job.cancel → Cancelled en el siguiente punto de control),
+    - cola de despacho que se vacía en el hilo de Tk con drain(): es la única vía por la
+      que los hilos de trabajo tocan widgets,
+    - latencia de cada trabajo registrada en logs/jobs.log.
+    """
+
+    def __init__(self, max_workers: int = 3) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ui-job")
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self.current: Optional[Job] = None
+        self.on_progress: Optional[Callable[[Job, Dict[str, Any]], None]] = None
+        self.history: List[Dict[str, Any]] = []
+
+    @property
+    def busy(self) -> bool:
+        return self.current is not None
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args: Any,
+        on_done: Optional[Callable[[Job, Any, Optional[BaseException]], None]] = None,
+    ) -> Optional[Job]:
+        """
+        Lanza fn(job, *args) si no hay otro trabajo en curso. on_done(job, resultado, error)
+        se ejecuta en el hilo de Tk cuando fn vuelve (error es Cancelled si se canceló),
+        aunque queden sub-tareas en segundo plano.
+        """
+        with self._lock:
+            if self.current is not None:
+                return None
+            job = Job(self, name)
+            self.current = job
+
+        def _run() -> None:
+            result, error = None, None
+            try:
+                result = fn(job, *args)
+                job.status = "cancelled" if job.cancelled else "ok"
+            except Cancelled as e:
+                error, job.status = e, "cancelled"
+            except Exception as e:
+                error, job.status = e, "error"
+            finally:
+                job.finished = time.monotonic()
+                with self._lock:
+                    job._returned = True
+                    self._release(job)
+                self._record(job)
+                if on_done is not None:
+                    self.dispatch(on_done, job, result, error)
+
+        self.executor.submit(_run)
+        return job
+
+    def _child_done(self, job: Job) -> None:
+        with self._lock:
+            job._spawned -= 1
+            self._release(job)
+
+    def _release(self, job: Job) -> None:
+        # con self._lock tomado
+        if job._returned and job._spawned == 0 and self.current is job:
+            self.current = None
+
+    def cancel_current(self) -> bool:
+        job = self.current
+        if job is None:
+            return False
+        job.cancel()
+        return True
+
+    # ====== cola hacia el hilo de Tk ======
+    def dispatch(self, fn: Callable[..., Any], *args: Any) -> None:
+        self._queue.put((fn, args))
+
+    def drain(self, max_items: int = 100) -> int:
+        """Ejecuta lo encolado (llamar solo desde el hilo de Tk). Devuelve cuántos corrió."""
+        n = 0
+        while n < max_items:
+            try:
+                fn, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            n += 1
+            try:
+                fn(*args)
+            except Exception:
+                pass
+        return n
+
+    def shutdown(self) -> None:
+        self.cancel_current()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # ====== métricas ======
+    def _record(self, job: Job) -> None:
+        rec = {"job": job.name, "status": job.status, "elapsed_sec": round(job.elapsed, 3)}
+        self.history = (self.history + [rec])[-50:]
+        JOB_SECONDS.observe(job.elapsed, job.name, job.status)
+        try:
+            LOGS_DIR.mkdir(parents=True, exist_ok=True)
+            with open(JOBS_LOG, "a", encoding="utf-8") as fh:
+                fh.write(f"{datetime.now().isoformat(timespec='seconds')}\t{job.name}\t"
+                         f"{job.status}\t{rec['elapsed_sec']:.3f}s\n")
+        except Exception:
+            pass
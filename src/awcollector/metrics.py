@@ -0,0 +1,283 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\metrics.py
+from __future__ import annotations
+import os
+import time
+import uuid
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .config import LOGS_DIR, PENDING_DIR
+
+# Archivo para el textfile collector de node_exporter (--collector.textfile.directory=LOGS_DIR)
+TEXTFILE = LOGS_DIR / "colector_aw.prom"
+
+# Límites (segundos) de los histogramas de latencia
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+CAMERA_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _labelstr(self, values: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, values)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(_Metric):
+    """Contador monótono; inc(n, *valores_de_etiqueta)."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, n: float = 1.0, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + n
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labelstr(k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Valor instantáneo; set() o una función que se evalúa al exportar (track)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._funcs: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, *label_values: str) -> None:
+        with self._lock:
+            self._values[label_values] = float(value)
+
+    def track(self, fn: Callable[[], float], *label_values: str) -> None:
+        with self._lock:
+            self._funcs[label_values] = fn
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            funcs = list(self._funcs.items())
+        for k, fn in funcs:
+            try:
+                values[k] = float(fn())
+            except Exception:
+                continue
+        return [f"{self.name}{self._labelstr(k)} {_fmt(v)}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    """Histograma de buckets fijos (conteo por bucket + suma); observe(v, *etiquetas)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # por etiquetas: [conteos por bucket (+Inf al final), suma]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    @contextmanager
+    def time(self, *label_values: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *label_values)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(k, list(c), total) for k, (c, total) in self._series.items()]
+        out: List[str] = []
+        for k, counts, total in series:
+            acc = 0
+            for le, c in zip(self.buckets + (float("inf"),), counts):
+                acc += c
+                le_label = 'le="' + _fmt(le) + '"'
+                out.append(f"{self.name}_bucket{self._labelstr(k, le_label)} {acc}")
+            out.append(f"{self.name}_sum{self._labelstr(k)} {total:.6f}")
+            out.append(f"{self.name}_count{self._labelstr(k)} {acc}")
+        return out
+
+
+class Registry:
+    """Conjunto de métricas del proceso, en orden de registro."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> Any:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        """Formato de texto de Prometheus (0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# ====== Métricas del colector ======
+AW_FETCH_SECONDS = REGISTRY.histogram(
+    "colector_aw_fetch_seconds", "Tiempo de lectura de eventos de un bucket de ActivityWatch.", ["backend"])
+SEND_SECONDS = REGISTRY.histogram(
+    "colector_send_seconds", "Latencia de envío al servidor (reporte o foto).", ["kind"])
+SEND_TOTAL = REGISTRY.counter(
+    "colector_send_total", "Envíos por resultado (ok | pending).", ["kind", "result"])
+PENDING_ITEMS = REGISTRY.gauge(
+    "colector_pending_items", "Elementos en cola de reenvío.", ["queue"])
+PHOTO_CHECKS = REGISTRY.counter(
+    "colector_photo_checks_total", "Controles locales de foto por resultado (ok o motivo de rechazo).", ["result"])
+CAMERA_OPEN_SECONDS = REGISTRY.histogram(
+    "colector_camera_open_seconds", "Tiempo hasta obtener el primer cuadro de la cámara.", ["result"],
+    buckets=CAMERA_BUCKETS)
+JOB_SECONDS = REGISTRY.histogram(
+    "colector_job_seconds", "Duración de los trabajos lanzados desde la UI.", ["job", "status"])
+CIRCUIT_OPEN = REGISTRY.gauge(
+    "colector_circuit_open", "1 si el circuito del endpoint está abierto (envíos directo a pendientes).", ["endpoint"])
+SHORT_CIRCUITS = REGISTRY.counter(
+    "colector_short_circuits_total", "Envíos que fueron directo a pendientes por circuito abierto.", ["endpoint"])
+
+
+def _pending_reports() -> float:
+    return float(sum(1 for _ in PENDING_DIR.glob("payload-*.json")))
+
+
+def _pending_photos() -> float:
+    from .spool import get_spool  # importa cv2: solo al exportar
+    return float(len(get_spool()))
+
+
+PENDING_ITEMS.track(_pending_reports, "reports")
+PENDING_ITEMS.track(_pending_photos, "photos")
+
+
+class MetricsExporter:
+    """
+    Publica REGISTRY para node_exporter:
+    - cada metrics_textfile_sec reescribe logs/colector_aw.prom (tmp + rename atómico),
+    - con metrics_port > 0 además sirve /metrics en 127.0.0.1:<puerto>.
+    """
+
+    def __init__(self, settings: Dict[str, Any], registry: Registry = REGISTRY) -> None:
+        self.settings = settings
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> None:
+        if self._thread is not None or not self.settings.get("metrics_enabled", True):
+            return
+        port = int(self.settings.get("metrics_port", 0) or 0)
+        if port > 0:
+            try:
+                self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+            except OSError:
+                self._server = None  # puerto ocupado: queda solo el archivo
+        self._thread = threading.Thread(target=self._loop, name="metrics-textfile", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._server is not None:
+            try:
+                self._server.shutdown()
+                self._server.server_close()
+            except Exception:
+                pass
+            self._server = None
+        self.write_textfile()
+
+    def _loop(self) -> None:
+        interval = max(5.0, float(self.settings.get("metrics_textfile_sec", 60)))
+        while not self._stop.is_set():
+            self.write_textfile()
+            self._stop.wait(interval)
+
+    def write_textfile(self) -> bool:
+        try:
+            LOGS_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = TEXTFILE.with_name(f".{TEXTFILE.name}.{uuid.uuid4().hex[:8]}.tmp")
+            tmp.write_text(self.registry.render(), encoding="utf-8")
+            os.replace(tmp, TEXTFILE)
+            return True
+        except Exception:
+            return False
+
+    def _handler(self):
+        registry = self.registry
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return _Handler
@@ -0,0 +1,193 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\normalize.py
+from __future__ import annotations
+import re
+import json
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Tope de memoización por normalizador (claves distintas); al llenarse se vacía
+_MEMO_MAX = 200_000
+
+# Segmentos de ruta que son IDs: números, UUIDs o hashes hex largos
+_ID_SEGMENT = re.compile(
+    r"^(?:\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,})$",
+    re.IGNORECASE,
+)
+
+
+class Normalizer:
+    """
+    Reduce la cardinalidad de títulos y URLs antes de acumularlos:
+    - URLs: quita parámetros de query fuera de la lista permitida, el fragmento y
+      colapsa segmentos de ruta que son IDs (/pedido/12345 → /pedido/{id}).
+    - Títulos: aplica reglas regex (marcadores de "sin guardar", contadores, horas…)
+      y colapsa números largos ("Factura 004512" → "Factura {n}").
+    Las reglas se compilan una sola vez y cada clave distinta se memoiza.
+    """
+
+    def __init__(
+        self,
+        keep_params: List[str],
+        strip_fragment: bool,
+        collapse_ids: bool,
+        min_digits: int,
+        title_rules: List[Tuple[str, str]],
+    ) -> None:
+        self._keep_all = "*" in keep_params
+        self._keep = frozenset(p.lower() for p in keep_params)
+        self._strip_fragment = strip_fragment
+        self._collapse_ids = collapse_ids
+        self._number = re.compile(r"\d{%d,}" % max(1, int(min_digits)))
+        self._title_rules = [(re.compile(p), r) for p, r in title_rules]
+        self._title_memo: Dict[str, str] = {}
+        self._url_memo: Dict[str, str] = {}
+        # Firma de las reglas (rules_signature); la fija _compiled
+        self.signature = ""
+
+    def title(self, title: str) -> str:
+        out = self._title_memo.get(title)
+        if out is None:
+            out = title
+            for rx, repl in self._title_rules:
+                out = rx.sub(repl, out)
+            if self._collapse_ids:
+                out = self._number.sub("{n}", out)
+            out = out.strip() or title
+            if len(self._title_memo) >= _MEMO_MAX:
+                self._title_memo.clear()
+            self._title_memo[title] = out
+        return out
+
+    def url(self, url: str) -> str:
+        out = self._url_memo.get(url)
+        if out is None:
+            out = self._normalize_url(url)
+            if len(self._url_memo) >= _MEMO_MAX:
+                self._url_memo.clear()
+            self._url_memo[url] = out
+        return out
+
+    def _normalize_url(self, url: str) -> str:
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return url
+        query = parts.query
+        if query and not self._keep_all:
+            kept = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k.lower() in self._keep]
+            query = urlencode(kept)
+        path = parts.path
+        if self._collapse_ids and path:
+            path = "/".join("{id}" if _ID_SEGMENT.match(seg) else seg for seg in path.split("/"))
+        fragment = "" if self._strip_fragment else parts.fragment
+        return urlunsplit((parts.scheme, parts.netloc, path, query, fragment))
+
+
+def rules_signature(settings: Dict[str, Any]) -> str:
+    """Firma estable de las reglas; cambia si cambia cualquier ajuste que afecte las claves."""
+    return json.dumps({
+        "keep": sorted(settings.get("url_keep_params") or []),
+        "frag": bool(settings.get("url_strip_fragment", True)),
+        "ids": bool(settings.get("collapse_numeric_ids", True)),
+        "digits": int(settings.get("numeric_id_min_digits", 4)),
+        "titles": [list(r) for r in (settings.get("title_rewrite_rules") or [])],
+    }, sort_keys=True)
+
+
+@lru_cache(maxsize=8)
+def _compiled(signature: str) -> Normalizer:
+    rules = json.loads(signature)
+    norm = Normalizer(
+        keep_params=rules["keep"],
+        strip_fragment=rules["frag"],
+        collapse_ids=rules["ids"],
+        min_digits=rules["digits"],
+        title_rules=[(p, r) for p, r in rules["titles"]],
+    )
+    norm.signature = signature
+    return norm
+
+
+def get_normalizer(settings: Dict[str, Any]) -> Optional[Normalizer]:
+    """Normalizador compilado para estos settings (None si normalize_enabled=False)."""
+    if not settings.get("normalize_enabled", False):
+        return None
+    return _compiled(rules_signature(settings))
+
+
+# ====== Presupuesto de bytes del payload ======
+
+def _json_size(obj: Any) -> int:
+    # Igual que lo serializa httpx al enviar (compacto, UTF-8)
+    return len(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def apply_byte_budget(payload: Dict[str, Any], max_bytes: int) -> Dict[str, Any]:
+    """
+    Recorta la cola larga de top_titles/top_urls hasta que el payload quepa en max_bytes.
+    Busca el mayor tope K de elementos por lista que cabe (tamaños precalculados con sumas
+    prefijas, sin re-serializar todo en cada intento). Si ni con K=0 cabe, descarta apps y
+    dominios de menor tiempo, salvo que el resto del payload ya exceda el máximo (entonces
+    no serviría: meta["trimmed"]["over_budget"]). Deja constancia en meta["trimmed"].
+    """
+    if not max_bytes or max_bytes <= 0:
+        return payload
+    total = _json_size(payload)
+    if total <= max_bytes:
+        return payload
+
+    lists: List[List[str]] = [a["top_titles"] for a in payload.get("apps", [])]
+    lists += [w["top_urls"] for w in payload.get("web", [])]
+
+    # prefix[i][k] = bytes que aportan los primeros k elementos de la lista i
+    prefix: List[List[int]] = []
+    for items in lists:
+        acc = [0]
+        for j, item in enumerate(items):
+            acc.append(acc[-1] + _json_size(item) + (1 if j else 0))  # coma separadora
+        prefix.append(acc)
+    full = sum(p[-1] for p in prefix)
+    base = total - full + 128  # holgura para meta["trimmed"]
+
+    def size_for(k: int) -> int:
+        return base + sum(p[min(k, len(p) - 1)] for p in prefix)
+
+    lo, hi = 0, max((len(p) - 1 for p in prefix), default=0)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if size_for(mid) <= max_bytes:
+            lo = mid
+        else:
+            hi = mid - 1
+    k = lo
+    for items in lists:
+        del items[k:]
+
+    # Último recurso: quitar entradas completas de menor tiempo. Cada entrada se mide una
+    # vez y su tamaño (más la coma) se descuenta al quitarla, sin re-serializar el payload.
+    apps, web = payload.get("apps") or [], payload.get("web") or []
+    app_sizes = [_json_size(a) for a in apps]
+    web_sizes = [_json_size(w) for w in web]
+    current = _json_size(payload)
+    # Lo que no se puede recortar (totales, meta, timeline, focus, categorías...)
+    fixed = current - sum(app_sizes) - sum(web_sizes) - max(len(apps) - 1, 0) - max(len(web) - 1, 0)
+    dropped = 0
+    if fixed + 128 <= max_bytes:
+        while current + 128 > max_bytes and (apps or web):
+            last_app = apps[-1]["total_sec"] if apps else float("inf")
+            last_web = web[-1]["total_sec"] if web else float("inf")
+            entries, sizes = (apps, app_sizes) if last_app <= last_web else (web, web_sizes)
+            entries.pop()
+            current -= sizes.pop() + (1 if sizes else 0)
+            dropped += 1
+
+    trimmed = {
+        "max_bytes": int(max_bytes),
+        "max_items_per_list": k,
+        "dropped_entries": dropped,
+    }
+    if fixed + 128 > max_bytes:
+        trimmed["over_budget"] = True  # ni sin apps ni dominios cabe: no se descarta nada
+    payload.setdefault("meta", {})["trimmed"] = trimmed
+    return payload
@@ -0,0 +1,239 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\payload_v2.py
+from __future__ import annotations
+import os
+import re
+import json
+import threading
+from datetime import datetime
+from collections import Counter
+from typing import Dict, Any, List, Mapping, Optional, Union
+
+from .config import CACHE_DIR
+
+# Versiones que anunció cada endpoint de ingesta (se recuerda entre ejecuciones)
+CAPS_FILE = CACHE_DIR / "server_caps.json"
+
+# Respuesta del servidor: versiones de payload que acepta ("v1, v2")
+VERSIONS_HEADER = "X-Payload-Versions"
+# Petición: versión del cuerpo enviado
+VERSION_HEADER = "X-Payload-Version"
+
+_URL_ORIGIN = re.compile(r"^[A-Za-z][A-Za-z0-9+.\-]*://[^/?#]*")
+# Separadores tras los que los títulos suelen repetir el nombre de la app/documento
+_TITLE_SEPS = (" - ", " — ", " – ", " | ")
+
+_caps_lock = threading.Lock()
+
+Ref = Union[int, str, List[Union[int, str]]]
+
+
+# ====== negociación ======
+def _ingest_url(settings: Dict[str, Any]) -> str:
+    return str(settings.get("server_url", "")) + str(settings.get("ingest_path", ""))
+
+
+def _load_caps() -> Dict[str, Any]:
+    try:
+        return json.loads(CAPS_FILE.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+
+
+def payload_version(settings: Dict[str, Any]) -> str:
+    """
+    Versión con la que se arma el payload: payload_version="v1"/"v2" la fuerza; con
+    "auto" es v1 hasta que el servidor anuncie v2 en X-Payload-Versions.
+    """
+    want = str(settings.get("payload_version", "auto")).lower()
+    if want in ("v1", "v2"):
+        return want
+    versions = (_load_caps().get(_ingest_url(settings)) or {}).get("payload_versions") or []
+    return "v2" if "v2" in versions else "v1"
+
+
+def remember_versions(url: str, headers: Mapping[str, str]) -> None:
+    """Guarda las versiones que anunció el servidor en la respuesta (si lo hizo)."""
+    raw = headers.get(VERSIONS_HEADER)
+    if raw is None:
+        return
+    versions = sorted({v.strip().lower() for v in str(raw).split(",") if v.strip()})
+    with _caps_lock:
+        caps = _load_caps()
+        if (caps.get(url) or {}).get("payload_versions") == versions:
+            return
+        caps[url] = {"payload_versions": versions, "seen_at": datetime.now().isoformat(timespec="seconds")}
+        try:
+            CAPS_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = CAPS_FILE.with_suffix(".tmp")
+            tmp.write_text(json.dumps(caps, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, CAPS_FILE)
+        except Exception:
+            pass
+
+
+def is_v2(payload: Dict[str, Any]) -> bool:
+    return (payload.get("meta") or {}).get("version") == "v2"
+
+
+# ====== codificación ======
+class _Table:
+    """
+    Tabla de strings sin repetidos; cada string se referencia por su índice. Solo entran
+    los trozos que aparecen más de una vez (`counts`): uno único va tal cual en su lugar,
+    porque su índice no ahorra nada y, comprimido, hasta cuesta más.
+    """
+
+    def __init__(self, counts: Counter) -> None:
+        self.strings: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._counts = counts
+
+    def ref(self, s: Optional[str]) -> Optional[Union[int, str]]:
+        if s is None or self._counts[s] < 2:
+            return s
+        i = self._index.get(s)
+        if i is None:
+            i = self._index[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def parts(self, pieces: List[str]) -> Ref:
+        refs = [self.ref(p) for p in pieces]
+        return refs[0] if len(refs) == 1 else refs
+
+
+def _split_url(url: str) -> List[str]:
+    # origen (esquema://host) + resto: el origen se repite en todas las URLs del dominio
+    m = _URL_ORIGIN.match(url)
+    if m and 0 < m.end() < len(url):
+        return [url[:m.end()], url[m.end():]]
+    return [url]
+
+
+def _split_title(title: str) -> List[str]:
+    # "main.py - ColectorAW - Visual Studio Code" → ["main.py - ColectorAW", " - Visual Studio Code"]
+    cut = max(title.rfind(sep) for sep in _TITLE_SEPS)
+    if cut > 0:
+        return [title[:cut], title[cut:]]
+    return [title]
+
+
+def _deltas(secs: List[float]) -> List[int]:
+    # Segundos (de mayor a menor) → centésimas: la primera y luego lo que baja cada una
+    cs = [round(x * 100) for x in secs]
+    return cs[:1] + [a - b for a, b in zip(cs, cs[1:])]
+
+
+def _undeltas(deltas: List[int]) -> List[float]:
+    out: List[float] = []
+    cs = 0
+    for i, d in enumerate(deltas):
+        cs = d if i == 0 else cs - d
+        out.append(cs / 100)
+    return out
+
+
+def encode_v2(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte un payload con top_titles/top_urls como pares [texto, segundos] (el que
+    arma summary_to_payload para v2) al formato v2, por columnas (cada clave va una vez
+    por lista, no una vez por elemento):
+    - "strings": tabla de los textos que se repiten; el resto del payload usa refs.
+    - apps: {"app": [ref], "total_sec": [seg], "titles": [[ref] por app],
+             "titles_cs": [[centésimas] por app]}
+    - web:  {"domain": [ref], "total_sec": [seg], "urls": [[ref] por dominio],
+             "urls_cs": [[centésimas] por dominio]}
+    - *_cs: segundos por título/URL en centésimas, en el orden de la lista (de mayor a
+      menor): la primera tal cual y luego la diferencia con la anterior.
+    - timeline.top_app / top_domain: refs (o null).
+    Un ref es un índice de la tabla, el texto mismo (si aparece una sola vez) o una lista
+    de refs que se concatenan: URLs y títulos se parten en origen/resto y texto/sufijo
+    para que lo repetido entre en la tabla una vez.
+    """
+    apps = payload.get("apps") or []
+    web = payload.get("web") or []
+    tl_in = payload.get("timeline") or {}
+    counts: Counter = Counter()
+    for a in apps:
+        counts[a["app"]] += 1
+        for title, _ in a["top_titles"]:
+            counts.update(_split_title(title))
+    for w in web:
+        counts[w["domain"]] += 1
+        for url, _ in w["top_urls"]:
+            counts.update(_split_url(url))
+    counts.update(x for x in (tl_in.get("top_app") or []) + (tl_in.get("top_domain") or []) if x is not None)
+
+    t = _Table(counts)
+    out: Dict[str, Any] = {}
+    for key, value in payload.items():
+        if key == "apps":
+            out["strings"] = t.strings
+            out["apps"] = {
+                "app": [t.ref(a["app"]) for a in value],
+                "total_sec": [a["total_sec"] for a in value],
+                "titles": [[t.parts(_split_title(title)) for title, _ in a["top_titles"]] for a in value],
+                "titles_cs": [_deltas([sec for _, sec in a["top_titles"]]) for a in value],
+            }
+        elif key == "web":
+            out["web"] = {
+                "domain": [t.ref(w["domain"]) for w in value],
+                "total_sec": [w["total_sec"] for w in value],
+                "urls": [[t.parts(_split_url(url)) for url, _ in w["top_urls"]] for w in value],
+                "urls_cs": [_deltas([sec for _, sec in w["top_urls"]]) for w in value],
+            }
+        elif key == "timeline":
+            tl = dict(value)
+            tl["top_app"] = [t.ref(x) for x in tl.get("top_app") or []]
+            tl["top_domain"] = [t.ref(x) for x in tl.get("top_domain") or []]
+            out["timeline"] = tl
+        elif key == "meta":
+            out["meta"] = {**value, "version": "v2"}
+        else:
+            out[key] = value
+    out.setdefault("strings", t.strings)
+    return out
+
+
+def decode_v2(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverso de encode_v2 (referencia para el servidor y el bench)."""
+    strings = payload.get("strings") or []
+
+    def text(ref: Optional[Ref]) -> Optional[str]:
+        if isinstance(ref, list):
+            return "".join(text(r) for r in ref)
+        return strings[ref] if isinstance(ref, int) else ref
+
+    out: Dict[str, Any] = {}
+    for key, value in payload.items():
+        if key == "strings":
+            continue
+        if key == "apps":
+            out["apps"] = [{"app": text(app), "total_sec": total,
+                            "top_titles": [[text(r), sec] for r, sec in zip(refs, _undeltas(cs))]}
+                           for app, total, refs, cs in zip(value["app"], value["total_sec"],
+                                                           value["titles"], value["titles_cs"])]
+        elif key == "web":
+            out["web"] = [{"domain": text(dom), "total_sec": total,
+                           "top_urls": [[text(r), sec] for r, sec in zip(refs, _undeltas(cs))]}
+                          for dom, total, refs, cs in zip(value["domain"], value["total_sec"],
+                                                          value["urls"], value["urls_cs"])]
+        elif key == "timeline":
+            tl = dict(value)
+            tl["top_app"] = [text(i) for i in tl.get("top_app") or []]
+            tl["top_domain"] = [text(i) for i in tl.get("top_domain") or []]
+            out["timeline"] = tl
+        else:
+            out[key] = value
+    return out
+
+
+def downgrade_v1(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload v2 → v1 (listas de textos sin segundos), para un servidor que dejó de aceptar v2."""
+    out = decode_v2(payload)
+    for a in out.get("apps", []):
+        a["top_titles"] = [title for title, _ in a["top_titles"]]
+    for w in out.get("web", []):
+        w["top_urls"] = [url for url, _ in w["top_urls"]]
+    out["meta"] = {**(out.get("meta") or {}), "version": "v1"}
+    return out
@@ -2,26 +2,20 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import Dict, Optional, Tuple, List
-import json
-import shutil
 import mimetypes
-from datetime import datetime
+from time import perf_counter
 
 import httpx
 
-from .config import (
-    load_settings,
-    PENDING_PHOTOS_DIR,
-    PENDING_PHOTOS_FILES_DIR,
-)
+from .config import load_settings
+from .upload import should_chunk, chunked_upload, UploadUnsupported
+from .spool import get_spool
+from .metrics import SEND_SECONDS, SEND_TOTAL
+from .breaker import get_breaker
 
 
 # ========== helpers internos ==========
 
-def _now_ts() -> str:
-    return datetime.now().strftime("%Y%m%d-%H%M%S")
-
-
 def _mime_for(path: Path) -> str:
     mt, _ = mimetypes.guess_type(str(path))
     return mt or "application/octet-stream"
@@ -33,35 +27,60 @@ def _endpoint_url(settings: Dict) -> str:
     return f"{base}{path}"
 
 
-def _copy_into_pending_files(src: Path) -> Optional[Path]:
+def _spool_budget(settings: Dict) -> int:
+    """Bytes máximos por foto en pendientes (photo_spool_max_kb; 0 = photo_max_mb)."""
+    kb = float(settings.get("photo_spool_max_kb", 0) or 0)
+    if kb > 0:
+        return int(kb * 1024)
+    return int(float(settings.get("photo_max_mb", 8)) * 1024 * 1024)
+
+
+def _save_photo_pending(settings: Dict, photo_path: Path, meta: Dict) -> Optional[str]:
     """
-    Copia el archivo original dentro de pending/photos/files/ para garantizar reintentos,
-    incluso si el usuario mueve o borra el archivo original. Devuelve la ruta de la copia.
+    Encola la foto en el spool de pendientes (spool.py) con metadatos para el reintento:
+    endpoint, headers, fields, file_path (ruta original) e info opcional (status_code,
+    error…). La imagen se guarda por hash, así el reintento no depende del original.
     """
-    try:
-        PENDING_PHOTOS_FILES_DIR.mkdir(parents=True, exist_ok=True)
-        dst = PENDING_PHOTOS_FILES_DIR / f"{_now_ts()}_{src.name}"
-        shutil.copy2(src, dst)
-        return dst
-    except Exception:
-        return None
+    return get_spool().put(photo_path, meta, _spool_budget(settings))
 
 
-def _save_photo_pending(meta: Dict) -> Path:
+def _post_photo(
+    client: httpx.Client,
+    settings: Dict,
+    url: str,
+    fpath: Path,
+    fields: Dict[str, str],
+    field_name: str,
+    filename: Optional[str] = None,
+) -> httpx.Response:
     """
-    Guarda un JSON de pendiente en pending/photos/, con metadatos suficientes para reintento.
-    Espera que meta incluya:
-    - endpoint (str)
-    - headers (dict)
-    - fields (dict)
-    - file_path (str)  -> ruta original
-    - file_copy (str|None) -> copia en pending/photos/files/ si existe
-    - info opcional (status_code, error, etc.)
+    Sube la foto: por partes y reanudable si supera chunked_upload_min_mb (upload.py),
+    o multipart de una sola petición (lo normal, y el respaldo si el servidor no admite
+    /uploads).
     """
-    jname = f"photo-{_now_ts()}.json"
-    jpath = PENDING_PHOTOS_DIR / jname
-    jpath.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-    return jpath
+    filename = filename or fpath.name
+    if should_chunk(settings, fpath.stat().st_size, url):
+        try:
+            return chunked_upload(
+                client, url, fpath,
+                filename=filename,
+                content_type=_mime_for(fpath),
+                fields={**fields, "field_name": field_name},
+                chunk_size=int(settings.get("chunk_size_kb", 512)) * 1024,
+            )
+        except UploadUnsupported:
+            pass
+    with open(fpath, "rb") as fh:
+        files = {field_name: (filename, fh, _mime_for(fpath))}
+        return client.post(url, data=fields, files=files)
+
+
+def _auth_headers(settings: Dict) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    token = (settings.get("photo_auth_token") or "").strip()
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
 
 
 def _validate_photo(settings: Dict, photo_path: Path) -> Optional[str]:
@@ -160,13 +179,10 @@ def send_photo(
         return False, err, None
 
     url = _endpoint_url(settings)
-    timeout = settings.get("request_timeout_sec", 20)
+    breaker = get_breaker(url, settings)
+    cap = float(settings.get("request_timeout_sec", 30))
     field_name = settings.get("photo_field_file", "file")
-
-    headers: Dict[str, str] = {}
-    token = (settings.get("photo_auth_token") or "").strip()
-    if token:
-        headers["Authorization"] = f"Bearer {token}"
+    headers = _auth_headers(settings)
 
     # Campos del formulario
     fields = prepare_photo_fields(
@@ -177,102 +193,171 @@ def send_photo(
         extra=extra_fields,
     )
 
-    # POST multipart
+    # Circuito abierto (sin conexión reciente): directo a pendientes, sin esperar timeouts
+    if not breaker.allow():
+        SEND_TOTAL.inc(1, "photo", "pending")
+        _save_photo_pending(settings, photo_path, {
+            "endpoint": url,
+            "headers": headers,
+            "fields": fields,
+            "file_path": str(photo_path),
+            "error": "circuito abierto",
+        })
+        return False, "Servidor de fotos no disponible (sin conexión). Guardada en pendientes.", None
+
+    # POST multipart (o por partes si la foto es grande)
+    t0 = perf_counter()
     try:
-        with httpx.Client(timeout=timeout, follow_redirects=True, headers=headers) as client:
-            with open(photo_path, "rb") as fh:
-                files = {field_name: (photo_path.name, fh, _mime_for(photo_path))}
-                resp = client.post(url, data=fields, files=files)
+        with httpx.Client(timeout=breaker.timeout(cap), follow_redirects=True, headers=headers) as client:
+            resp = _post_photo(client, settings, url, photo_path, fields, field_name)
+        SEND_SECONDS.observe(perf_counter() - t0, "photo")
+        breaker.record(resp.status_code, perf_counter() - t0)
 
         if 200 <= resp.status_code < 300:
+            SEND_TOTAL.inc(1, "photo", "ok")
             try:
                 data = resp.json()
             except Exception:
                 data = None
             return True, "Foto enviada con éxito.", data
 
-        # No-2xx → guardamos pendiente (JSON + copia del archivo)
-        copy_path = _copy_into_pending_files(photo_path)
+        # No-2xx → guardamos pendiente (foto por hash + entrada en el índice)
+        SEND_TOTAL.inc(1, "photo", "pending")
         pending_meta = {
             "endpoint": url,
             "headers": headers,
             "fields": fields,
             "file_path": str(photo_path),
-            "file_copy": str(copy_path) if copy_path else None,
             "status_code": resp.status_code,
             "response_text": resp.text[:1000],  # acortar por si es muy largo
-            "saved_at": _now_ts(),
         }
-        _save_photo_pending(pending_meta)
+        _save_photo_pending(settings, photo_path, pending_meta)
         return False, f"Error {resp.status_code} al enviar la foto. Guardada en pendientes.", None
 
     except Exception as e:
         # Error de red → también guardamos pendiente
-        copy_path = _copy_into_pending_files(photo_path)
+        if isinstance(e, httpx.TransportError):
+            breaker.failure(e, cap)
+        SEND_SECONDS.observe(perf_counter() - t0, "photo")
+        SEND_TOTAL.inc(1, "photo", "pending")
         pending_meta = {
             "endpoint": url,
             "headers": headers,
             "fields": fields,
             "file_path": str(photo_path),
-            "file_copy": str(copy_path) if copy_path else None,
             "error": str(e),
-            "saved_at": _now_ts(),
         }
-        _save_photo_pending(pending_meta)
+        _save_photo_pending(settings, photo_path, pending_meta)
         return False, f"Error de red al enviar la foto: {e}. Guardada en pendientes.", None
 
 
-def resend_pending_photos(settings: Dict) -> List[Tuple[Path, bool, str]]:
+def spool_photo(
+    settings: Dict,
+    photo_path: Path,
+    tipo: str,
+    correlation_id: Optional[str] = None,
+    extra_fields: Optional[Dict[str, str]] = None,
+    meta_extra: Optional[Dict] = None,
+) -> Tuple[Optional[str], str]:
     """
-    Reintenta todos los pendientes en pending/photos/.
-    Devuelve una lista de tuplas: (ruta_json_pendiente, ok, mensaje)
+    Como send_photo pero sin tocar la red: deja la foto en el spool con los mismos campos
+    para que la suba send_spooled. meta_extra se guarda junto al pendiente.
+    Retorna: (id del pendiente | None, mensaje)
     """
-    results: List[Tuple[Path, bool, str]] = []
-    url_default = _endpoint_url(settings)
-    timeout = settings.get("request_timeout_sec", 20)
+    err = _validate_photo(settings, photo_path)
+    if err:
+        return None, err
+    fields = prepare_photo_fields(settings=settings, tipo=tipo, correlation_id=correlation_id,
+                                  extra=extra_fields)
+    item_id = _save_photo_pending(settings, photo_path, {
+        **(meta_extra or {}),
+        "endpoint": _endpoint_url(settings),
+        "headers": _auth_headers(settings),
+        "fields": fields,
+        "file_path": str(photo_path),
+    })
+    if item_id is None:
+        return None, "No se pudo guardar la foto en pendientes."
+    return item_id, "Foto guardada; se enviará en segundo plano."
+
+
+# 4xx que sí se reintentan: plazo vencido, demasiado pronto, demasiadas peticiones
+_RETRY_4XX = {408, 425, 429}
+
+
+def upload_spooled(settings: Dict, item_id: str, meta: Dict) -> Tuple[str, str, Optional[Dict]]:
+    """
+    Sube un pendiente del spool con sus campos guardados; si el servidor responde 2xx sale
+    del spool. Retorna (resultado, mensaje, respuesta_json|None) con resultado:
+    - "ok": aceptada (ya no está en el spool);
+    - "offline": circuito abierto, no se intentó (los errores de red se propagan);
+    - "retry": 5xx, 408, 425 o 429: el mismo envío puede salir bien más tarde;
+    - "rejected": otro 4xx o falta la foto: reintentar el mismo envío no sirve.
+    """
+    spool = get_spool()
+    fpath = spool.blob_path(meta)
+    url = str(meta.get("endpoint") or _endpoint_url(settings))
+    headers = dict(meta.get("headers") or {})
+    fields = dict(meta.get("fields") or {})
     field_name = settings.get("photo_field_file", "file")
 
-    for jpath in sorted(PENDING_PHOTOS_DIR.glob("photo-*.json")):
+    if not fpath.exists():
+        return "rejected", "Archivo de foto no encontrado para reintento.", None
+
+    breaker = get_breaker(url, settings)
+    cap = float(settings.get("request_timeout_sec", 30))
+    if not breaker.allow():
+        return "offline", "Servidor de fotos no disponible (circuito abierto).", None
+    t0 = perf_counter()
+    try:
+        with httpx.Client(timeout=breaker.timeout(cap), follow_redirects=True, headers=headers) as client:
+            resp = _post_photo(client, settings, url, fpath, fields, field_name,
+                               filename=meta.get("file_name"))
+    except httpx.TransportError as e:
+        breaker.failure(e, cap)
+        raise
+    breaker.record(resp.status_code, perf_counter() - t0)
+
+    if 200 <= resp.status_code < 300:
+        # éxito → sale del índice (y la foto, si ningún otro pendiente la usa)
+        spool.done(item_id)
         try:
-            meta = json.loads(jpath.read_text(encoding="utf-8"))
+            data = resp.json()
+        except Exception:
+            data = None
+        return "ok", "Foto reenviada con éxito.", data
+    msg = f"Error {resp.status_code} al reenviar la foto."
+    if 400 <= resp.status_code < 500 and resp.status_code not in _RETRY_4XX:
+        return "rejected", msg, None
+    return "retry", msg, None
 
-            url = str(meta.get("endpoint") or url_default)
-            headers = dict(meta.get("headers") or {})
-            fields = dict(meta.get("fields") or {})
 
-            # usar copia si existe, si no el original
-            fcopy = meta.get("file_copy")
-            fpath = Path(fcopy) if fcopy else Path(meta.get("file_path", ""))
+def send_spooled(settings: Dict, item_id: str, meta: Dict) -> Tuple[bool, str, Optional[Dict]]:
+    """Como upload_spooled, con (ok, mensaje, respuesta_json|None) igual que send_photo."""
+    result, msg, data = upload_spooled(settings, item_id, meta)
+    return result == "ok", msg, data
 
-            if not fpath.exists():
-                results.append((jpath, False, "Archivo de foto no encontrado para reintento."))
-                continue
 
-            with httpx.Client(timeout=timeout, follow_redirects=True, headers=headers) as client:
-                with open(fpath, "rb") as fh:
-                    files = {field_name: (fpath.name, fh, _mime_for(fpath))}
-                    resp = client.post(url, data=fields, files=files)
-
-            if 200 <= resp.status_code < 300:
-                # éxito → borrar pendiente y (si es copia) el archivo
-                try:
-                    if fcopy and Path(fcopy).exists():
-                        Path(fcopy).unlink(missing_ok=True)
-                finally:
-                    jpath.unlink(missing_ok=True)
-
-                try:
-                    data = resp.json()
-                except Exception:
-                    data = None
-                msg_ok = "Foto reenviada con éxito."
-                if data:
-                    msg_ok += " (Respuesta recibida)"
-                results.append((jpath, True, msg_ok))
-            else:
-                results.append((jpath, False, f"Error {resp.status_code} al reenviar la foto."))
+def resend_pending_photos(settings: Dict) -> List[Tuple[Path, bool, str]]:
+    """
+    Reintenta todos los pendientes del spool (pending/photos/), en orden de llegada.
+    Los de ENTRADA optimista ("optimistic") los sube clockin.py, que avisa a la UI.
+    Devuelve una lista de tuplas: (ruta_foto_pendiente, ok, mensaje)
+    """
+    results: List[Tuple[Path, bool, str]] = []
+    spool = get_spool()
+    spool.import_legacy(_spool_budget(settings))
 
+    for item_id, meta in spool.items():
+        if meta.get("optimistic"):
+            continue
+        fpath = spool.blob_path(meta)
+        try:
+            ok, msg, data = send_spooled(settings, item_id, meta)
+            if ok and data:
+                msg += " (Respuesta recibida)"
+            results.append((fpath, ok, msg))
         except Exception as e:
-            results.append((jpath, False, f"Error procesando pendiente: {e}"))
+            results.append((fpath, False, f"Error procesando pendiente: {e}"))
 
     return results
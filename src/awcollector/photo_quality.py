@@ -0,0 +1,143 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\photo_quality.py
+from __future__ import annotations
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Any, List, Optional
+
+import cv2
+import numpy as np
+
+from .metrics import PHOTO_CHECKS
+
+# Ancho al que se reducen los cuadros para medir (rápido y suficiente para nitidez/rostro)
+_ANALYSIS_WIDTH = 320
+
+
+class FrameRing:
+    """Últimos N cuadros de la cámara (BGR) para elegir el mejor al capturar."""
+
+    def __init__(self, size: int = 8) -> None:
+        self._frames: deque = deque(maxlen=max(1, int(size)))
+
+    def push(self, frame: np.ndarray) -> None:
+        self._frames.append(frame)
+
+    def frames(self) -> List[np.ndarray]:
+        return list(self._frames)
+
+    def clear(self) -> None:
+        self._frames.clear()
+
+
+class QualityResult:
+    """
+    Resultado del control: ok, cuadro elegido (BGR), motivo de rechazo, métricas y un
+    código corto del resultado para las métricas (ok, no_frames, dark, blur, frozen, no_face).
+    """
+
+    def __init__(self, ok: bool, frame: Optional[np.ndarray], reason: str = "",
+                 scores: Optional[Dict[str, Any]] = None, code: str = "ok") -> None:
+        self.ok = ok
+        self.frame = frame
+        self.reason = reason
+        self.scores = scores or {}
+        self.code = code
+
+
+@lru_cache(maxsize=1)
+def _face_detector() -> Optional[cv2.CascadeClassifier]:
+    """Haar cascade frontal que trae opencv-python; None si no está disponible."""
+    try:
+        path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+        det = cv2.CascadeClassifier(path)
+        return None if det.empty() else det
+    except Exception:
+        return None
+
+
+def _gray_small(frame: np.ndarray) -> np.ndarray:
+    h, w = frame.shape[:2]
+    if w > _ANALYSIS_WIDTH:
+        frame = cv2.resize(frame, (_ANALYSIS_WIDTH, int(h * _ANALYSIS_WIDTH / w)),
+                           interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+
+def blur_score(gray: np.ndarray) -> float:
+    """Varianza del Laplaciano: baja = imagen borrosa o sin detalle (cámara tapada)."""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def motion_score(grays: List[np.ndarray]) -> float:
+    """Mayor diferencia media absoluta entre cuadros consecutivos (0 = stream congelado)."""
+    best = 0.0
+    for a, b in zip(grays, grays[1:]):
+        best = max(best, float(cv2.absdiff(a, b).mean()))
+    return best
+
+
+def has_face(gray: np.ndarray) -> Optional[bool]:
+    """True/False según el detector; None si no hay detector disponible."""
+    det = _face_detector()
+    if det is None:
+        return None
+    faces = det.detectMultiScale(gray, scaleFactor=1.15, minNeighbors=4, minSize=(40, 40))
+    return len(faces) > 0
+
+
+def assess_frames(frames: List[np.ndarray], settings: Dict[str, Any]) -> QualityResult:
+    """Control local de la foto (ver _assess); cuenta el resultado en las métricas."""
+    res = _assess(frames, settings)
+    PHOTO_CHECKS.inc(1, res.code)
+    return res
+
+
+def _assess(frames: List[np.ndarray], settings: Dict[str, Any]) -> QualityResult:
+    """
+    Control local antes de enviar la foto:
+    - cámara tapada/oscura (brillo medio), nitidez (varianza del Laplaciano),
+    - stream congelado (sin cambios entre cuadros) y presencia de rostro.
+    Elige el cuadro más nítido que tenga rostro. Con photo_quality_enabled=False solo
+    devuelve el último cuadro.
+    """
+    if not frames:
+        return QualityResult(False, None, "No hay imagen de la cámara.", code="no_frames")
+    if not settings.get("photo_quality_enabled", True):
+        return QualityResult(True, frames[-1])
+
+    grays = [_gray_small(f) for f in frames]
+    scores: Dict[str, Any] = {"frames": len(frames)}
+
+    brightness = float(np.mean([g.mean() for g in grays]))
+    scores["brightness"] = round(brightness, 1)
+    if brightness < float(settings.get("photo_min_brightness", 25)):
+        return QualityResult(False, None, "La imagen está muy oscura. ¿La cámara está tapada?", scores, "dark")
+
+    blur = [blur_score(g) for g in grays]
+    order = sorted(range(len(frames)), key=lambda i: blur[i], reverse=True)
+    scores["blur_best"] = round(blur[order[0]], 1)
+    if blur[order[0]] < float(settings.get("photo_blur_min", 40)):
+        return QualityResult(False, None, "La imagen está desenfocada. Acércate o limpia la cámara.", scores, "blur")
+
+    if len(grays) >= 3:
+        motion = motion_score(grays)
+        scores["motion"] = round(motion, 3)
+        if motion < float(settings.get("photo_frozen_diff_max", 0.1)):
+            return QualityResult(False, None, "La cámara parece congelada. Ciérrala en otras apps e intenta de nuevo.", scores, "frozen")
+
+    if not settings.get("photo_require_face", False):
+        return QualityResult(True, frames[order[0]], scores=scores)
+    # del más nítido al menos nítido: el primero con rostro gana (se corta ahí)
+    for i in order:
+        if blur[i] < float(settings.get("photo_blur_min", 40)):
+            break
+        face = has_face(grays[i])
+        if face is None:
+            scores["face"] = "sin detector"
+            return QualityResult(True, frames[i], scores=scores)
+        if face:
+            scores["face"] = True
+            scores["blur"] = round(blur[i], 1)
+            return QualityResult(True, frames[i], scores=scores)
+    scores["face"] = False
+    return QualityResult(False, None, "No se detecta un rostro. Mira a la cámara e intenta de nuevo.", scores, "no_face")
@@ -0,0 +1,131 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\profiling.py
+from __future__ import annotations
+import io
+import json
+import marshal
+import time
+import pstats
+import cProfile
+import platform
+import threading
+import tracemalloc
+import zipfile
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from .config import LOGS_DIR
+
+PROFILES_DIR = LOGS_DIR / "profiles"
+
+# Cuántos paquetes se conservan, marcos por asignación y filas de cada informe
+_KEEP = 10
+_TRACE_FRAMES = 10
+_TOP = 40
+
+_armed = threading.Event()
+_active = threading.Lock()
+
+
+def arm() -> None:
+    """Perfila el próximo envío (atajo oculto de la UI)."""
+    _armed.set()
+
+
+def maybe_profile(settings: Dict[str, Any], label: str):
+    """
+    Contexto de perfilado si está armado (una vez) o si profile_sends=True; si no, un
+    nullcontext: sin perfilado el camino normal solo paga esta comprobación.
+    """
+    if not (_armed.is_set() or settings.get("profile_sends", False)):
+        return nullcontext()
+    _armed.clear()
+    return capture(label)
+
+
+@contextmanager
+def capture(label: str) -> Iterator[Dict[str, Any]]:
+    """
+    Envuelve el bloque en cProfile (hilo actual) y tracemalloc (todo el proceso) y deja
+    un único zip en logs/profiles/ con:
+    - profile.prof  (para snakeviz / pstats),
+    - stats.txt     (top por tiempo acumulado y propio),
+    - alloc.txt     (top de sitios de asignación vivos al final),
+    - summary.json  (duración, pico de memoria, versión, plataforma).
+    Devuelve un dict que al salir trae "path" con la ruta del zip.
+    Si ya hay otra captura en curso, el bloque corre sin perfilar.
+    """
+    info: Dict[str, Any] = {"label": label}
+    if not _active.acquire(blocking=False):
+        yield info
+        return
+    started_tm = not tracemalloc.is_tracing()
+    if started_tm:
+        tracemalloc.start(_TRACE_FRAMES)
+    tracemalloc.reset_peak()
+    prof = cProfile.Profile()
+    t0 = time.perf_counter()
+    error: Optional[str] = None
+    try:
+        prof.enable()
+        try:
+            yield info
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            prof.disable()
+    finally:
+        try:
+            elapsed = time.perf_counter() - t0
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tm:
+                tracemalloc.stop()
+            info["path"] = _write_bundle(label, prof, snapshot, {
+                "label": label,
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "elapsed_sec": round(elapsed, 4),
+                "traced_current_bytes": current,
+                "traced_peak_bytes": peak,
+                "error": error,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+            })
+        except Exception:
+            pass
+        finally:
+            _active.release()
+
+
+def _write_bundle(label: str, prof: cProfile.Profile, snapshot: tracemalloc.Snapshot,
+                  summary: Dict[str, Any]) -> Path:
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = PROFILES_DIR / f"profile-{stamp}-{label}.zip"
+
+    stats_txt = io.StringIO()
+    st = pstats.Stats(prof, stream=stats_txt)
+    st.sort_stats("cumulative").print_stats(_TOP)
+    st.sort_stats("tottime").print_stats(_TOP)
+
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    alloc_lines = [f"pico: {summary['traced_peak_bytes'] / 1024:.1f} KiB  "
+                   f"vivo al final: {summary['traced_current_bytes'] / 1024:.1f} KiB", ""]
+    for stat in snapshot.statistics("traceback")[:_TOP]:
+        alloc_lines.append(f"{stat.size / 1024:10.1f} KiB  {stat.count:8d} bloques")
+        alloc_lines.extend("    " + line for line in stat.traceback.format(limit=_TRACE_FRAMES))
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("profile.prof", marshal.dumps(st.stats))  # mismo formato que dump_stats
+        zf.writestr("stats.txt", stats_txt.getvalue())
+        zf.writestr("alloc.txt", "\n".join(alloc_lines) + "\n")
+        zf.writestr("summary.json", json.dumps(summary, ensure_ascii=False, indent=2))
+
+    for old in sorted(PROFILES_DIR.glob("profile-*.zip"))[:-_KEEP]:
+        old.unlink(missing_ok=True)
+    return path
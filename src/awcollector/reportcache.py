@@ -0,0 +1,131 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\reportcache.py
+from __future__ import annotations
+import os
+import json
+import copy
+import hashlib
+import socket
+import getpass
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from .config import CACHE_DIR
+from .payload_v2 import payload_version
+
+REPORTS_DIR = CACHE_DIR / "reports"
+
+# Ajustes que cambian el payload y no entran en SummaryOptions.signature
+OUTPUT_KEYS = (
+    "top_titles_limit",
+    "top_urls_limit",
+    "payload_max_bytes",
+    "categories_enabled",
+    "category_rules",
+    "bucket_hostname",
+    "bucket_any_host",
+)
+
+# Campos de meta que summary_to_payload fija después de mezclar meta_extra
+_META_FIXED = ("idempotency_key", "trimmed")
+
+
+def report_key(kind: str, start: datetime, end: datetime, settings: Dict[str, Any],
+               signature: str, fingerprint: str) -> str:
+    """Clave del informe: rango, ajustes de salida (y versión de payload), firma y huella de buckets."""
+    raw = json.dumps([
+        kind, start.isoformat(), end.isoformat(),
+        {k: settings.get(k) for k in OUTPUT_KEYS},
+        signature, fingerprint, payload_version(settings), socket.gethostname(), getpass.getuser(),
+    ], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _path(key: str) -> Path:
+    return REPORTS_DIR / f"{key}.json"
+
+
+def get_report(key: str, settings: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Payload guardado con esa clave si no superó report_cache_max_age_h; si no, None."""
+    if not settings.get("report_cache_enabled", True):
+        return None
+    path = _path(key)
+    try:
+        max_age = float(settings.get("report_cache_max_age_h", 48)) * 3600
+        if time.time() - path.stat().st_mtime > max_age:
+            path.unlink(missing_ok=True)
+            return None
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        os.utime(path)  # uso reciente: lo último en desalojarse por tamaño
+        return payload
+    except Exception:
+        return None
+
+
+def put_report(key: str, payload: Dict[str, Any], settings: Dict[str, Any]) -> None:
+    """Guarda el payload (sin meta_extra) y desaloja por edad y por tamaño total."""
+    if not settings.get("report_cache_enabled", True):
+        return
+    try:
+        REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+        path = _path(key)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception:
+        return
+    prune_reports(settings)
+
+
+def prune_reports(settings: Dict[str, Any]) -> int:
+    """
+    Borra los informes de más de report_cache_max_age_h horas y, si el total pasa de
+    report_cache_max_kb, los usados hace más tiempo. Devuelve cuántos borró.
+    """
+    if not REPORTS_DIR.exists():
+        return 0
+    max_age = float(settings.get("report_cache_max_age_h", 48)) * 3600
+    max_bytes = float(settings.get("report_cache_max_kb", 4096)) * 1024
+    now = time.time()
+    entries = []
+    removed = 0
+    for p in REPORTS_DIR.glob("*.json"):
+        try:
+            st = p.stat()
+            if now - st.st_mtime > max_age:
+                p.unlink()
+                removed += 1
+            else:
+                entries.append((st.st_mtime, st.st_size, p))
+        except Exception:
+            pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            p.unlink()
+            total -= size
+            removed += 1
+        except Exception:
+            pass
+    return removed
+
+
+def refresh_report(payload: Dict[str, Any], meta_extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Copia del payload guardado con generated_at actual y meta_extra mezclado igual que en
+    summary_to_payload (los campos que este fija después no se pisan).
+    """
+    out = copy.deepcopy(payload)
+    meta = out.setdefault("meta", {})
+    fixed = {k: meta[k] for k in _META_FIXED if k in meta}
+    meta["generated_at"] = datetime.now().isoformat()
+    if meta_extra and isinstance(meta_extra, dict):
+        try:
+            meta.update(meta_extra)
+        except Exception:
+            meta["meta_extra_error"] = "meta_extra no fusionable; se omitieron algunos campos"
+    meta.update(fixed)
+    return out
@@ -0,0 +1,228 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\rolling.py
+from __future__ import annotations
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import httpx
+
+from .config import CACHE_DIR
+from .buckets import BucketRegistry
+from .aggregate import (
+    RangeSummary,
+    SummaryOptions,
+    _today_range_local,
+    collect_summary,
+    summary_to_payload,
+    build_daily_payload,
+)
+
+ROLLING_FILE = CACHE_DIR / "rolling-today.json"
+
+
+class RollingSummary:
+    """
+    Resumen del día que se mantiene al día en segundo plano mientras la app está abierta.
+
+    Cada `rolling_refresh_min` minutos se pide a ActivityWatch solo el tramo nuevo
+    [marca_de_agua, ahora - margen) y se pliega sobre lo acumulado. Al pulsar SALIDA
+    basta con traer los últimos minutos (desde la marca de agua) y fusionarlos.
+    El estado se guarda en cache/rolling-today.json para sobrevivir reinicios.
+    """
+
+    def __init__(self, settings: Dict[str, Any]) -> None:
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        # Estado (protegido por _lock)
+        self._date: Optional[str] = None
+        self._start: Optional[datetime] = None
+        self._watermark: Optional[datetime] = None
+        self._buckets: Optional[Dict[str, List[str]]] = None
+        self._summary: Optional[RangeSummary] = None
+        self._rules = SummaryOptions(settings).signature
+        # Sube con cada cambio del resumen: los lectores (summary_server.py) comparan
+        # este número sin copiar nada
+        self._generation = 0
+
+        self._load()
+
+    # ====== ciclo de vida ======
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="rolling-summary", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        interval = max(30.0, float(self.settings.get("rolling_refresh_min", 5)) * 60)
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                # ActivityWatch caído o lento: se reintenta en el siguiente ciclo
+                pass
+            self._stop.wait(interval)
+
+    # ====== plegado incremental ======
+    def refresh(self) -> None:
+        """Pliega el tramo [marca_de_agua, ahora - margen) sobre el resumen del día."""
+        aw_base = self.settings["aw_base_url"]
+        timeout = self.settings["request_timeout_sec"]
+        margin = timedelta(minutes=float(self.settings.get("rolling_margin_min", 5)))
+
+        start, now = _today_range_local()
+        new_mark = now - margin
+        if new_mark <= start:
+            return
+
+        with httpx.Client(timeout=timeout, follow_redirects=True) as client:
+            registry = BucketRegistry.from_server(client, aw_base, self.settings)
+            buckets = registry.select()
+
+            with self._lock:
+                valid = self._valid_for(start, buckets)
+                base_mark = self._watermark if valid else None
+            from_ = base_mark or start
+            if new_mark <= from_:
+                return
+
+            part = collect_summary(client, aw_base, from_, new_mark, registry,
+                                   SummaryOptions(self.settings),
+                                   incremental=base_mark is not None)
+
+        with self._lock:
+            # Si otro refresco avanzó la marca mientras tanto, se descarta este tramo
+            if (self._watermark if self._valid_for(start, buckets) else None) != base_mark:
+                return
+            if base_mark is None:
+                self._summary = part
+            else:
+                self._summary.merge(part)
+            self._date = start.date().isoformat()
+            self._start = start
+            self._buckets = buckets
+            self._watermark = new_mark
+            self._generation += 1
+            self._save_locked()
+
+    def _valid_for(self, start: datetime, buckets: Dict[str, List[str]]) -> bool:
+        # El estado solo sirve para el mismo día, los mismos buckets y los mismos ajustes
+        return (
+            self._summary is not None
+            and self._start == start
+            and self._buckets == buckets
+            and self._rules == SummaryOptions(self.settings).signature
+        )
+
+    # ====== lectura ======
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def snapshot(self) -> Optional[Tuple[int, datetime, RangeSummary]]:
+        """
+        (generación, marca de agua, copia del resumen) del día en curso, sin consultar
+        ActivityWatch; None si no hay estado o es de otro día.
+        """
+        start, _ = _today_range_local()
+        with self._lock:
+            if self._summary is None or self._start != start:
+                return None
+            return self._generation, self._watermark, self._summary.copy()
+
+    # ====== payload al hacer clic ======
+    def build_payload(
+        self,
+        meta_extra: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Igual que build_daily_payload, pero reutilizando el resumen rodante: solo se
+        consultan los eventos posteriores a la marca de agua. Sin estado válido, cae
+        al cálculo completo.
+        - timeout: permite acotar la consulta (p.ej. al plazo restante de SALIDA)
+        - progress: eventos de avance por bucket (ver collect_summary)
+        """
+        aw_base = self.settings["aw_base_url"]
+        if timeout is None:
+            timeout = self.settings["request_timeout_sec"]
+        start, end = _today_range_local()
+
+        with httpx.Client(timeout=timeout, follow_redirects=True) as client:
+            registry = BucketRegistry.from_server(client, aw_base, self.settings)
+            buckets = registry.select()
+            with self._lock:
+                if not self._valid_for(start, buckets):
+                    snapshot = None
+                else:
+                    snapshot = self._summary.copy()
+                    mark = self._watermark
+
+            options = SummaryOptions(self.settings)
+            if snapshot is None:
+                summary = collect_summary(client, aw_base, start, end, registry, options, progress=progress)
+            else:
+                tail = collect_summary(client, aw_base, mark, end, registry, options, incremental=True,
+                                       progress=progress)
+                summary = snapshot.merge(tail)
+
+        return summary_to_payload(self.settings, summary, start, end,
+                                  date=start.date().isoformat(), meta_extra=meta_extra,
+                                  key_end=start + timedelta(days=1))
+
+    # ====== persistencia ======
+    def _save_locked(self) -> None:
+        try:
+            data = {
+                "date": self._date,
+                "start": self._start.isoformat(),
+                "watermark": self._watermark.isoformat(),
+                "buckets": self._buckets,
+                "rules": self._rules,
+                "summary": self._summary.to_dict(),
+            }
+            tmp = ROLLING_FILE.with_suffix(".tmp")
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, ROLLING_FILE)
+        except Exception:
+            pass
+
+    def _load(self) -> None:
+        try:
+            if not ROLLING_FILE.exists():
+                return
+            data = json.loads(ROLLING_FILE.read_text(encoding="utf-8"))
+            self._date = data["date"]
+            self._start = datetime.fromisoformat(data["start"])
+            self._watermark = datetime.fromisoformat(data["watermark"])
+            self._buckets = data["buckets"]
+            if data.get("rules") != self._rules:
+                raise ValueError("ajustes del resumen distintos")
+            self._summary = RangeSummary.from_dict(data["summary"])
+        except Exception:
+            # Archivo corrupto o de otra versión: se empieza de cero
+            self._date = self._start = self._watermark = None
+            self._buckets = None
+            self._summary = None
+
+
+def build_today_payload(
+    settings: Dict[str, Any],
+    rolling: Optional[RollingSummary] = None,
+    meta_extra: Optional[Dict[str, Any]] = None,
+    progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """Atajo: usa el resumen rodante si existe; si no, el cálculo completo."""
+    if rolling is not None:
+        return rolling.build_payload(meta_extra=meta_extra, timeout=settings["request_timeout_sec"],
+                                     progress=progress)
+    return build_daily_payload(settings, meta_extra=meta_extra, progress=progress)
@@ -0,0 +1,164 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\scheduler.py
+from __future__ import annotations
+import os
+import json
+import uuid
+import socket
+import hashlib
+import threading
+from datetime import datetime, time, timedelta
+from typing import Dict, Any, Optional, Callable
+
+from tzlocal import get_localzone
+
+from .config import CACHE_DIR, PENDING_DIR
+from .aggregate import build_yesterday_payload, send_payload, resend_pending, day_report_status
+
+STATE_FILE = CACHE_DIR / "scheduler.json"
+
+# Cada cuánto se revisa si toca enviar algo (segundos)
+_TICK_SEC = 30.0
+
+
+def host_jitter(max_sec: float, salt: str = "") -> float:
+    """
+    Desfase fijo del equipo en [0, max_sec): depende solo del hostname, así que cada
+    equipo usa siempre el mismo y la flota queda repartida de forma pareja en la ventana.
+    """
+    if max_sec <= 0:
+        return 0.0
+    digest = hashlib.sha256(f"{socket.gethostname().lower()}|{salt}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 * max_sec
+
+
+def _parse_hhmm(value: Any) -> Optional[time]:
+    try:
+        hh, mm = str(value).strip().split(":")
+        return time(int(hh), int(mm))
+    except Exception:
+        return None
+
+
+class ReportScheduler:
+    """
+    Envíos de informes sin clic, en segundo plano:
+    - informe de ayer: si el servidor no recibió ninguno de ese día (ni por SALIDA ni por
+      el botón de ayer), se arma y envía; se revisa al arrancar y pasada la medianoche;
+    - informe del día: a schedule_report_time (HH:MM local; "" = desactivado), una vez
+      por día y solo si no se marcó SALIDA; si la app abre después de esa hora, al abrir.
+    Las horas llevan un desfase determinista por equipo (schedule_jitter_min) para que
+    toda la flota no llegue al servidor en los mismos minutos. Los envíos fallidos quedan
+    en pending/ (sin copia en el Escritorio) y se reintentan cada schedule_retry_min.
+    - build_today(meta_extra): arma el payload del día (la UI le pasa el resumen rodante).
+    - on_result(tipo, ok, msg): aviso opcional (se llama desde el hilo del programador).
+    """
+
+    def __init__(
+        self,
+        settings: Dict[str, Any],
+        build_today: Callable[[Dict[str, Any]], Dict[str, Any]],
+        on_result: Optional[Callable[[str, bool, str], None]] = None,
+    ) -> None:
+        self.settings = settings
+        self.build_today = build_today
+        self.on_result = on_result
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._jitter = timedelta(seconds=host_jitter(float(settings.get("schedule_jitter_min", 30)) * 60))
+        self._state = self._load()
+        self._next_retry: Optional[datetime] = None
+
+    # ====== ciclo de vida ======
+    def start(self) -> None:
+        if self._thread is not None or not self.enabled:
+            return
+        self._thread = threading.Thread(target=self._loop, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    @property
+    def enabled(self) -> bool:
+        s = self.settings
+        return bool(s.get("schedule_yesterday", False) or _parse_hhmm(s.get("schedule_report_time")))
+
+    def _loop(self) -> None:
+        # Al arrancar también se espera el desfase: la flota enciende a la misma hora
+        delay = float(self.settings.get("schedule_startup_delay_sec", 60)) + self._jitter.total_seconds()
+        if self._stop.wait(delay):
+            return
+        while not self._stop.is_set():
+            try:
+                self.tick(datetime.now(get_localzone()))
+                wait = _TICK_SEC
+            except Exception:
+                # p.ej. ActivityWatch no responde: se reintenta más tarde, no en cada ciclo
+                wait = float(self.settings.get("schedule_retry_min", 15)) * 60
+            self._stop.wait(wait)
+
+    # ====== planificación ======
+    def due_today(self, now: datetime) -> Optional[datetime]:
+        """Hora (con desfase) del envío del día, o None si no hay hora configurada."""
+        at = _parse_hhmm(self.settings.get("schedule_report_time"))
+        if at is None:
+            return None
+        return datetime.combine(now.date(), at).astimezone(now.tzinfo) + self._jitter
+
+    def due_yesterday(self, now: datetime) -> datetime:
+        """Desde cuándo se revisa el día anterior: medianoche + margen de heartbeats + desfase."""
+        margin = timedelta(minutes=float(self.settings.get("rolling_margin_min", 5)))
+        return datetime.combine(now.date(), time(0, 0)).astimezone(now.tzinfo) + margin + self._jitter
+
+    def tick(self, now: datetime) -> None:
+        retry = timedelta(minutes=float(self.settings.get("schedule_retry_min", 15)))
+        today = now.date().isoformat()
+        yesterday = now.date() - timedelta(days=1)
+        if (self.settings.get("schedule_yesterday", False) and now >= self.due_yesterday(now)
+                and self._state.get("yesterday_checked") != yesterday.isoformat()):
+            if day_report_status(yesterday) == "missing":
+                if not self._send("ayer", build_yesterday_payload(self.settings, meta_extra=self._meta("auto_ayer"))):
+                    self._next_retry = now + retry
+            self._mark("yesterday_checked", yesterday.isoformat())
+
+        due = self.due_today(now)
+        if due is not None and now >= due and self._state.get("today_sent") != today:
+            # Si ya se marcó SALIDA hoy, ese informe cubre el día
+            if day_report_status(now.date()) == "missing":
+                if not self._send("dia", self.build_today(self._meta("auto"))):
+                    self._next_retry = now + retry
+            self._mark("today_sent", today)
+
+        # Pendientes (de estos envíos o de clics anteriores): el circuito evita martillar
+        if self._next_retry is None or now >= self._next_retry:
+            self._next_retry = now + retry
+            if any(PENDING_DIR.glob("payload-*.json")):
+                resend_pending(self.settings, desktop_copy=False)
+
+    def _send(self, tipo: str, payload: Dict[str, Any]) -> bool:
+        ok, msg = send_payload(self.settings, payload, desktop_copy=False)
+        if self.on_result is not None:
+            self.on_result(tipo, ok, msg)
+        return ok
+
+    @staticmethod
+    def _meta(tipo: str) -> Dict[str, Any]:
+        return {"correlation_id": str(uuid.uuid4()), "marcacion_tipo": tipo}
+
+    # ====== estado ======
+    @staticmethod
+    def _load() -> Dict[str, Any]:
+        try:
+            return dict(json.loads(STATE_FILE.read_text(encoding="utf-8")))
+        except Exception:
+            return {}
+
+    def _mark(self, key: str, value: str) -> None:
+        self._state[key] = value
+        try:
+            STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = STATE_FILE.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._state, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, STATE_FILE)
+        except Exception:
+            pass
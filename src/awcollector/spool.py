@@ -0,0 +1,197 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\spool.py
+from __future__ import annotations
+import os
+import json
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .config import PENDING_PHOTOS_DIR, PENDING_PHOTOS_FILES_DIR
+
+INDEX_FILE = PENDING_PHOTOS_DIR / "index.jsonl"
+
+# Se reescribe el índice cuando las líneas muertas superan este múltiplo de las vivas
+_COMPACT_RATIO = 2
+_COMPACT_MIN_LINES = 256
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def fit_to_budget(data: bytes, max_bytes: int) -> Tuple[bytes, bool]:
+    """
+    Re-codifica la imagen a JPEG hasta que pese <= max_bytes: primero baja la calidad,
+    luego reduce a la mitad la resolución. Devuelve (bytes, re_codificada).
+    Si no se puede decodificar, la deja tal cual.
+    """
+    if max_bytes <= 0 or len(data) <= max_bytes:
+        return data, False
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return data, False
+    best = data
+    while True:
+        for quality in (85, 75, 65):
+            ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            if not ok:
+                return best, best is not data
+            best = buf.tobytes()
+            if len(best) <= max_bytes:
+                return best, True
+        h, w = img.shape[:2]
+        if w <= 320:
+            return best, True
+        img = cv2.resize(img, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
+
+
+class PhotoSpool:
+    """
+    Cola de fotos pendientes direccionada por contenido:
+    - cada foto se guarda una sola vez como files/<sha256>.<ext> (dos fallos con la
+      misma imagen comparten archivo), re-codificada si supera el presupuesto;
+    - los metadatos viven en un único índice de solo-anexar (index.jsonl): encolar y
+      quitar cuestan una línea, y el índice se compacta con un rename atómico cuando
+      acumula demasiadas líneas muertas;
+    - todos los archivos se escriben en un .tmp y se renombran.
+    """
+
+    def __init__(self, root: Path = PENDING_PHOTOS_DIR, blobs: Path = PENDING_PHOTOS_FILES_DIR) -> None:
+        self.root = root
+        self.blobs = blobs
+        self.index_file = root / INDEX_FILE.name
+        self._lock = threading.Lock()
+        self._items: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lines = 0
+
+    # ====== índice ======
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._items is not None:
+            return self._items
+        items: Dict[str, Dict[str, Any]] = {}
+        lines = 0
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    lines += 1
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # línea cortada por un cierre abrupto
+                    if rec.get("op") == "put":
+                        items[rec["id"]] = rec["meta"]
+                    elif rec.get("op") == "del":
+                        items.pop(rec.get("id"), None)
+        except FileNotFoundError:
+            pass
+        self._items, self._lines = items, lines
+        return items
+
+    def _append(self, rec: Dict[str, Any]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.index_file, "a", encoding="utf-8") as fh:
+            fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+        self._lines += 1
+
+    def _maybe_compact(self) -> None:
+        items = self._load()
+        if self._lines < _COMPACT_MIN_LINES or self._lines <= _COMPACT_RATIO * max(1, len(items)):
+            return
+        body = "".join(json.dumps({"op": "put", "id": k, "meta": v}, ensure_ascii=False) + "\n"
+                       for k, v in items.items())
+        _atomic_write(self.index_file, body.encode("utf-8"))
+        self._lines = len(items)
+
+    # ====== API ======
+    def blob_path(self, meta: Dict[str, Any]) -> Path:
+        return self.blobs / f"{meta['sha256']}{meta.get('ext', '.jpg')}"
+
+    def put(self, src: Path, meta: Dict[str, Any], max_bytes: int = 0) -> Optional[str]:
+        """Encola la foto `src` con sus metadatos. Devuelve el id del pendiente (None si falla)."""
+        try:
+            data, reencoded = fit_to_budget(src.read_bytes(), max_bytes)
+            sha = hashlib.sha256(data).hexdigest()
+            ext = ".jpg" if reencoded else (src.suffix.lower() or ".jpg")
+            rec_meta = {
+                **meta,
+                "sha256": sha,
+                "ext": ext,
+                "file_name": src.stem + ext,
+                "saved_at": datetime.now().isoformat(),
+            }
+            with self._lock:
+                self.blobs.mkdir(parents=True, exist_ok=True)
+                blob = self.blob_path(rec_meta)
+                if not blob.exists():
+                    _atomic_write(blob, data)
+                item_id = uuid.uuid4().hex
+                self._load()[item_id] = rec_meta
+                self._append({"op": "put", "id": item_id, "meta": rec_meta})
+            return item_id
+        except Exception:
+            return None
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Pendientes en orden de llegada."""
+        with self._lock:
+            return list(self._load().items())
+
+    def done(self, item_id: str) -> None:
+        """Quita el pendiente y borra su archivo si ningún otro lo referencia."""
+        with self._lock:
+            items = self._load()
+            meta = items.pop(item_id, None)
+            if meta is None:
+                return
+            self._append({"op": "del", "id": item_id})
+            if not any(m.get("sha256") == meta.get("sha256") for m in items.values()):
+                self.blob_path(meta).unlink(missing_ok=True)
+            self._maybe_compact()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+    def import_legacy(self, max_bytes: int = 0) -> int:
+        """Pasa los pendientes antiguos (photo-*.json + copia en files/) al spool."""
+        moved = 0
+        for jpath in sorted(self.root.glob("photo-*.json")):
+            try:
+                meta = json.loads(jpath.read_text(encoding="utf-8"))
+                fcopy = meta.pop("file_copy", None)
+                src = Path(fcopy) if fcopy else Path(meta.get("file_path", ""))
+                if not src.exists() or self.put(src, meta, max_bytes) is None:
+                    continue
+                jpath.unlink(missing_ok=True)
+                if fcopy:
+                    Path(fcopy).unlink(missing_ok=True)
+                moved += 1
+            except Exception:
+                continue
+        return moved
+
+
+_SPOOL: Optional[PhotoSpool] = None
+_SPOOL_LOCK = threading.Lock()
+
+
+def get_spool() -> PhotoSpool:
+    """Spool compartido del proceso (el índice se carga una sola vez)."""
+    global _SPOOL
+    with _SPOOL_LOCK:
+        if _SPOOL is None:
+            _SPOOL = PhotoSpool()
+        return _SPOOL
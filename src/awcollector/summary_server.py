@@ -0,0 +1,207 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\summary_server.py
+from __future__ import annotations
+import json
+import heapq
+import hashlib
+import threading
+from datetime import date, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit, parse_qs
+
+from .config import PENDING_DIR
+from .aggregate import US, day_report_status
+from .rolling import RollingSummary
+
+# Nombres con los que se acepta la cabecera Host (evita DNS rebinding desde un navegador)
+_LOCAL_HOSTS = {"127.0.0.1", "localhost"}
+
+# Tope del parámetro ?top=
+_MAX_TOP = 100
+
+
+def pending_status() -> Dict[str, Any]:
+    """Informes y fotos en cola y estado del informe de ayer (sin tocar la red)."""
+    out: Dict[str, Any] = {"reports": sum(1 for _ in PENDING_DIR.glob("payload-*.json"))}
+    try:
+        from .spool import get_spool  # importa cv2
+        out["photos"] = len(get_spool())
+    except Exception:
+        out["photos"] = None
+    out["yesterday"] = day_report_status(date.today() - timedelta(days=1))
+    return out
+
+
+def _top(totals: Dict[str, int], n: int, key: str) -> list:
+    return [{key: k, "total_sec": round(v / US, 2)}
+            for k, v in heapq.nlargest(n, totals.items(), key=lambda x: x[1])]
+
+
+class SummaryServer:
+    """
+    Consulta de solo lectura en 127.0.0.1:<summary_port> (0 = apagado), servida desde el
+    resumen rodante en memoria: nunca consulta ActivityWatch ni el servidor.
+    - GET /today[?top=N]: totales del día hasta la marca de agua (as_of), top apps y
+      dominios, foco y cola de pendientes.
+    - GET /pending: solo la cola de pendientes.
+    Las respuestas llevan ETag (hash del cuerpo) y Cache-Control: no-cache; con
+    If-None-Match igual se responde 304 sin cuerpo. Cuerpo y cola de pendientes se arman
+    una vez por versión del resumen rodante (cada rolling_refresh_min): un sondeo con la
+    versión vigente solo compara el ETag, sin glob ni lectura del spool.
+    """
+
+    def __init__(self, settings: Dict[str, Any], rolling: Optional[RollingSummary]) -> None:
+        self.settings = settings
+        self.rolling = rolling
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._lock = threading.Lock()
+        # (ruta, top) → (versión, etag, cuerpo): solo se guarda la última versión de cada una
+        self._cache: Dict[Tuple[str, int], Tuple[Tuple[Any, ...], str, bytes]] = {}
+        # (versión, pending_status()) de la última versión servida
+        self._pending: Optional[Tuple[Tuple[Any, ...], Dict[str, Any]]] = None
+
+    def start(self) -> None:
+        port = int(self.settings.get("summary_port", 0) or 0)
+        if self._server is not None or port <= 0 or self.rolling is None:
+            return
+        try:
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="summary-http", daemon=True).start()
+        except OSError:
+            self._server = None  # puerto ocupado: sin consulta local
+
+    def stop(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.shutdown()
+                self._server.server_close()
+            except Exception:
+                pass
+            self._server = None
+
+    # ====== respuestas ======
+    def respond(self, path: str, query: Dict[str, list],
+                if_none_match: Optional[str] = None) -> Tuple[int, Optional[str], bytes]:
+        """(estado, etag, cuerpo) de una consulta GET; 304 sin cuerpo si If-None-Match coincide."""
+        if path == "/pending":
+            slot = ("pending", 0)
+        elif path in ("/", "/today"):
+            try:
+                top = int((query.get("top") or [self.settings.get("summary_top_n", 10)])[0])
+            except ValueError:
+                return 400, None, b'{"error": "top debe ser un entero"}'
+            slot = ("today", min(max(1, top), _MAX_TOP))
+        else:
+            return 404, None, b'{"error": "ruta desconocida"}'
+
+        today = date.today().isoformat()
+        with self._lock:
+            hit = self._cache.get(slot)
+        if hit is None or hit[0] != (today, self.rolling.generation):
+            hit = self._build(slot, today)
+            if hit is None:
+                body = {"error": "el resumen del día aún no está listo", "date": today,
+                        "pending": self._pending_for((today, self.rolling.generation))}
+                return 503, None, json.dumps(body, ensure_ascii=False).encode("utf-8")
+        if _matches(if_none_match, hit[1]):
+            return 304, hit[1], b""
+        return 200, hit[1], hit[2]
+
+    def _pending_for(self, version: Tuple[Any, ...]) -> Dict[str, Any]:
+        with self._lock:
+            cached = self._pending
+        if cached is None or cached[0] != version:
+            cached = (version, pending_status())
+            with self._lock:
+                self._pending = cached
+        return cached[1]
+
+    def _build(self, slot: Tuple[str, int], today: str) -> Optional[Tuple[Tuple[Any, ...], str, bytes]]:
+        """Arma y guarda el cuerpo de `slot` para la versión actual; None si no hay resumen."""
+        if slot[0] == "pending":
+            version = (today, self.rolling.generation)
+            out: Dict[str, Any] = self._pending_for(version)
+        else:
+            snap = self.rolling.snapshot()
+            if snap is None:
+                return None
+            generation, watermark, summary = snap
+            # La generación de la copia puede ser más nueva que la leída en respond
+            version = (today, generation)
+            top = slot[1]
+            out = {
+                "date": today,
+                "as_of": watermark.isoformat(),
+                "totals": {
+                    "active_sec": round(summary.active_sec, 2),
+                    "afk_sec": round(summary.afk_sec, 2),
+                    "keys": round(summary.keys_count, 2),
+                    "mouse_dist": round(summary.mouse_dist, 2),
+                },
+                "apps": _top(summary.app_totals, top, "app"),
+                "web": _top(summary.domain_totals, top, "domain"),
+                "pending": self._pending_for(version),
+            }
+            if summary.focus is not None:
+                out["focus"] = summary.focus.to_payload(summary.active_sec)
+        body = json.dumps(out, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        hit = (version, '"' + hashlib.sha256(body).hexdigest()[:24] + '"', body)
+        with self._lock:
+            self._cache[slot] = hit
+        return hit
+
+    def _handler(self):
+        service = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                self._answer(with_body=True)
+
+            def do_HEAD(self) -> None:
+                self._answer(with_body=False)
+
+            def _answer(self, with_body: bool) -> None:
+                host = (self.headers.get("Host") or "").rsplit(":", 1)[0].strip("[]").lower()
+                if host not in _LOCAL_HOSTS:
+                    self.send_error(403)
+                    return
+                url = urlsplit(self.path)
+                try:
+                    status, etag, body = service.respond(url.path.rstrip("/") or "/", parse_qs(url.query),
+                                                         self.headers.get("If-None-Match"))
+                except Exception:
+                    status, etag, body = 500, None, b'{"error": "error interno"}'
+                if status == 304:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Cache-Control", "no-cache")
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-cache")
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                if with_body:
+                    self.wfile.write(body)
+
+            def _deny(self) -> None:
+                self.send_error(405)
+
+            do_POST = do_PUT = do_DELETE = do_PATCH = _deny
+
+        return _Handler
+
+
+def _matches(header: Optional[str], etag: str) -> bool:
+    # If-None-Match: "a", W/"b" o * — la comparación débil basta para un GET
+    if not header:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag in tags or "*" in tags
@@ -0,0 +1,194 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\timeline.py
+from __future__ import annotations
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+# Los bins se acumulan en µs enteros (guardados en float64, exactos hasta 2**53): la suma
+# no depende del orden y fusionar tramos da lo mismo que un solo plegado.
+US = 1_000_000
+
+
+def epoch_seconds(timestamps: List[str]) -> np.ndarray:
+    """
+    Convierte timestamps ISO-8601 de aw-server a segundos epoch (float64) en bloque.
+    aw-server los entrega en UTC ("+00:00" o "Z"); se quita el sufijo y numpy los parsea
+    en C. Cualquier otro desfase se resuelve con fromisoformat.
+    """
+    naive: List[str] = []
+    for ts in timestamps:
+        if ts.endswith("+00:00"):
+            naive.append(ts[:-6])
+        elif ts.endswith("Z"):
+            naive.append(ts[:-1])
+        else:
+            dt = datetime.fromisoformat(ts)
+            if dt.tzinfo is not None:
+                dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+            naive.append(dt.isoformat())
+    if not naive:
+        return np.zeros(0, dtype=np.float64)
+    return np.array(naive, dtype="datetime64[us]").astype(np.int64) / 1e6
+
+
+def bin_intervals(
+    starts: np.ndarray,
+    ends: np.ndarray,
+    keys: np.ndarray,
+    n_keys: int,
+    origin: float,
+    bin_sec: float,
+    n_bins: int,
+    unit: float = 1.0,
+) -> np.ndarray:
+    """
+    Reparte la duración de cada intervalo [start, end) en bins fijos, partiendo los que
+    cruzan un borde. Todo vectorizado: cada intervalo se repite tantas veces como bins
+    toca (np.repeat) y los pesos se suman con un único np.bincount.
+    Devuelve una matriz (n_keys, n_bins) de segundos × unit; con unit > 1 cada trozo se
+    redondea a entero antes de sumar.
+    """
+    out_len = n_keys * n_bins
+    if len(starts) == 0 or n_keys == 0:
+        return np.zeros((n_keys, n_bins), dtype=np.float64)
+    s = np.clip((starts - origin) / bin_sec, 0, n_bins)
+    e = np.clip((ends - origin) / bin_sec, 0, n_bins)
+    keep = e > s
+    s, e, keys = s[keep], e[keep], keys[keep]
+    if len(s) == 0:
+        return np.zeros((n_keys, n_bins), dtype=np.float64)
+
+    b0 = np.floor(s).astype(np.int64)
+    b1 = np.maximum(np.ceil(e).astype(np.int64) - 1, b0)
+    span = b1 - b0 + 1
+    idx = np.repeat(np.arange(len(s)), span)
+    first = np.repeat(np.cumsum(span) - span, span)
+    bins = b0[idx] + (np.arange(len(idx)) - first)
+    lo = np.maximum(s[idx], bins)
+    hi = np.minimum(e[idx], bins + 1)
+    weights = (hi - lo) * bin_sec
+    if unit != 1.0:
+        weights = np.round(weights * unit)
+    flat = np.bincount(keys[idx] * n_bins + bins, weights=weights, minlength=out_len)
+    return flat[:out_len].reshape(n_keys, n_bins)
+
+
+class Timeline:
+    """
+    Línea de tiempo del día en bins de `bin_sec` desde `origin` (00:00 local, epoch):
+    tiempo activo/AFK por bin y por app y por dominio por bin (para el top), en µs.
+    Es aditiva: los tramos plegados por separado se suman con merge().
+    """
+
+    def __init__(self, origin: float, bin_sec: int, n_bins: int) -> None:
+        self.origin = float(origin)
+        self.bin_sec = int(bin_sec)
+        self.n_bins = int(n_bins)
+        self.active = np.zeros(self.n_bins)
+        self.afk = np.zeros(self.n_bins)
+        self.apps: Dict[str, np.ndarray] = {}
+        self.domains: Dict[str, np.ndarray] = {}
+
+    # --- plegado ---
+    @staticmethod
+    def _span(timestamps: List[str], durations: List[float]):
+        starts = epoch_seconds(timestamps)
+        return starts, starts + np.asarray(durations, dtype=np.float64)
+
+    def _bin(self, starts: np.ndarray, ends: np.ndarray, keys: List[int], n_keys: int) -> np.ndarray:
+        return bin_intervals(starts, ends, np.asarray(keys, dtype=np.int64), n_keys,
+                             self.origin, self.bin_sec, self.n_bins, unit=US)
+
+    def add_afk(self, timestamps: List[str], durations: List[float], active: List[int]) -> None:
+        self.add_afk_epoch(*self._span(timestamps, durations), active)
+
+    def add_afk_epoch(self, starts: np.ndarray, ends: np.ndarray, active: List[int]) -> None:
+        m = self._bin(starts, ends, active, 2)
+        self.afk += m[0]
+        self.active += m[1]
+
+    def _add_keyed(self, target: Dict[str, np.ndarray], starts: np.ndarray,
+                   ends: np.ndarray, names: List[str]) -> None:
+        index: Dict[str, int] = {}
+        keys = [index.setdefault(n, len(index)) for n in names]
+        m = self._bin(starts, ends, keys, len(index))
+        for name, i in index.items():
+            row = target.get(name)
+            if row is None:
+                target[name] = m[i].copy()
+            else:
+                row += m[i]
+
+    def add_apps(self, timestamps: List[str], durations: List[float], apps: List[str]) -> None:
+        self._add_keyed(self.apps, *self._span(timestamps, durations), apps)
+
+    def add_domains(self, timestamps: List[str], durations: List[float], domains: List[str]) -> None:
+        self._add_keyed(self.domains, *self._span(timestamps, durations), domains)
+
+    # Variantes con inicios/fines ya en segundos epoch (backend SQLite)
+    def add_apps_epoch(self, starts: np.ndarray, ends: np.ndarray, apps: List[str]) -> None:
+        self._add_keyed(self.apps, starts, ends, apps)
+
+    def add_domains_epoch(self, starts: np.ndarray, ends: np.ndarray, domains: List[str]) -> None:
+        self._add_keyed(self.domains, starts, ends, domains)
+
+    # --- fusión / serialización ---
+    def merge(self, other: "Timeline") -> None:
+        self.active += other.active
+        self.afk += other.afk
+        for target, src in ((self.apps, other.apps), (self.domains, other.domains)):
+            for name, row in src.items():
+                if name in target:
+                    target[name] += row
+                else:
+                    target[name] = row.copy()
+
+    def empty_like(self) -> "Timeline":
+        return Timeline(self.origin, self.bin_sec, self.n_bins)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "origin": self.origin,
+            "bin_sec": self.bin_sec,
+            "n_bins": self.n_bins,
+            "active": self.active.tolist(),
+            "afk": self.afk.tolist(),
+            "apps": {k: v.tolist() for k, v in self.apps.items()},
+            "domains": {k: v.tolist() for k, v in self.domains.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Timeline":
+        t = cls(data["origin"], data["bin_sec"], data["n_bins"])
+        t.active = np.asarray(data["active"], dtype=np.float64)
+        t.afk = np.asarray(data["afk"], dtype=np.float64)
+        t.apps = {k: np.asarray(v, dtype=np.float64) for k, v in (data.get("apps") or {}).items()}
+        t.domains = {k: np.asarray(v, dtype=np.float64) for k, v in (data.get("domains") or {}).items()}
+        return t
+
+    # --- salida para el payload ---
+    @staticmethod
+    def _top(rows: Dict[str, np.ndarray], n_bins: int):
+        if not rows:
+            return [None] * n_bins, [0.0] * n_bins
+        names = list(rows)
+        mat = np.vstack([rows[n] for n in names])
+        best = mat.argmax(axis=0)
+        secs = mat[best, np.arange(n_bins)]
+        return ([names[i] if s > 0 else None for i, s in zip(best, secs)],
+                [round(float(s) / US, 2) for s in secs])
+
+    def to_payload(self, start_iso: Optional[str] = None) -> Dict[str, Any]:
+        top_app, top_app_sec = self._top(self.apps, self.n_bins)
+        top_dom, top_dom_sec = self._top(self.domains, self.n_bins)
+        return {
+            "start": start_iso,
+            "bin_sec": self.bin_sec,
+            "active_sec": [round(float(x) / US, 2) for x in self.active],
+            "afk_sec": [round(float(x) / US, 2) for x in self.afk],
+            "top_app": top_app,
+            "top_app_sec": top_app_sec,
+            "top_domain": top_dom,
+            "top_domain_sec": top_dom_sec,
+        }
@@ -1,7 +1,7 @@
 ﻿# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\ui_tk.py
 from __future__ import annotations
-import threading
-import os, sys, uuid, tempfile, json
+import os, sys, uuid, tempfile, json, time
+from concurrent.futures import wait
 from pathlib import Path
 from typing import Optional
 from datetime import datetime
@@ -12,8 +12,16 @@ from PIL import Image, ImageTk, ImageDraw
 import customtkinter as ctk  # <<< UI moderna
 
 from .config import load_settings
-from .aggregate import build_daily_payload, build_yesterday_payload, send_payload
+from .aggregate import build_yesterday_payload, send_payload
+from .rolling import RollingSummary, build_today_payload
 from .photo_api import send_photo
+from .photo_quality import FrameRing, assess_frames
+from .metrics import MetricsExporter, CAMERA_OPEN_SECONDS
+from .summary_server import SummaryServer
+from .scheduler import ReportScheduler
+from .clockin import ClockInQueue
+from . import profiling
+from .jobs import JobRunner, Job, Cancelled
 
 # ====== Paleta (marca) ======
 COLOR_GREEN    = "#2BB673"   # éxito
@@ -50,14 +58,50 @@ class App(ctk.CTk):
         self._busy = False
         self._progress_win: Optional[ctk.CTkToplevel] = None
         self._progress_bar: Optional[ctk.CTkProgressBar] = None
+        self._progress_detail: Optional[ctk.StringVar] = None
         self._dots_job = None
 
+        # Trabajos de la UI: uno a la vez, cancelables; los hilos solo tocan widgets
+        # a través de la cola que _pump_jobs vacía en el hilo de Tk
+        self._jobs = JobRunner()
+        self._jobs.on_progress = self._on_job_progress
+
         # Config & cámara
         self.settings = load_settings()
         self._cap: Optional[cv2.VideoCapture] = None
         self._current_frame_bgr = None
+        self._frames = FrameRing(self.settings.get("photo_ring_frames", 8))
         self._running = False
 
+        # Resumen rodante del día (SALIDA solo trae los últimos minutos)
+        self._rolling: Optional[RollingSummary] = None
+        if self.settings.get("rolling_refresh_min", 0) > 0:
+            self._rolling = RollingSummary(self.settings)
+            self._rolling.start()
+
+        # Métricas locales (logs/colector_aw.prom y, si se configura, /metrics en loopback)
+        self._metrics = MetricsExporter(self.settings)
+        self._metrics.start()
+
+        # Consulta local de solo lectura del resumen rodante (summary_port > 0)
+        self._summary_server = SummaryServer(self.settings, self._rolling)
+        self._summary_server.start()
+
+        # Envíos automáticos (informe de ayer si falta, informe del día a la hora fijada)
+        self._scheduler = ReportScheduler(
+            self.settings,
+            build_today=lambda meta: build_today_payload(self.settings, self._rolling, meta_extra=meta),
+            on_result=self._on_scheduled_send,
+        )
+        self._scheduler.start()
+
+        # ENTRADA optimista: comprobante al instante; la respuesta del servidor llega después
+        self._receipts: dict = {}
+        self._clockin: Optional[ClockInQueue] = None
+        if self.settings.get("entrada_optimistic", False):
+            self._clockin = ClockInQueue(self.settings, on_result=self._on_clockin_result)
+            self._clockin.start()
+
         # ====== LAYOUT ======
         header = ctk.CTkFrame(self, corner_radius=18, fg_color="transparent")
         header.pack(fill="x", padx=16, pady=(12, 8))
@@ -142,8 +186,11 @@ class App(ctk.CTk):
                      text_color=COLOR_MUTED).pack(anchor="w", padx=22)
 
         self._start_camera()
+        self._pump_jobs()
         self.protocol("WM_DELETE_WINDOW", self._on_close)
         self.bind_all("<Control-d>", lambda e: self._toggle_theme())
+        # Atajo oculto para soporte: perfila (CPU y memoria) el próximo envío
+        self.bind_all("<Control-Shift-P>", lambda e: self._arm_profiling())
 
     # ====== Tema ======
     def _on_theme_change(self, value: str):
@@ -159,8 +206,18 @@ class App(ctk.CTk):
         cur = ctk.get_appearance_mode().lower()
         ctk.set_appearance_mode("dark" if cur == "light" else "light")
 
+    def _arm_profiling(self):
+        profiling.arm()
+        self.status.set("Perfilado activado para el próximo envío (se guarda en logs/profiles).")
+
     # ====== Cámara ======
     def _try_open_camera(self) -> Optional[cv2.VideoCapture]:
+        t0 = time.monotonic()
+        cap = self._open_first_camera()
+        CAMERA_OPEN_SECONDS.observe(time.monotonic() - t0, "ok" if cap is not None else "fail")
+        return cap
+
+    def _open_first_camera(self) -> Optional[cv2.VideoCapture]:
         candidates = [
             (0, cv2.CAP_DSHOW),
             (0, 0),
@@ -208,6 +265,7 @@ class App(ctk.CTk):
         ret, frame = self._cap.read()
         if ret:
             self._current_frame_bgr = frame
+            self._frames.push(frame)
             try:
                 rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 img = Image.fromarray(rgb).resize((self.preview_w, self.preview_h), Image.LANCZOS)
@@ -218,15 +276,16 @@ class App(ctk.CTk):
                 pass
         self.after(33, self._update_preview)  # ~30 fps
 
-    def _capture_to_tempfile(self) -> Optional[Path]:
-        if self._current_frame_bgr is None:
+    def _capture_to_tempfile(self, frame=None) -> Optional[Path]:
+        frame = frame if frame is not None else self._current_frame_bgr
+        if frame is None:
             return None
         try:
             base_tmp = Path(os.environ.get("LOCALAPPDATA", tempfile.gettempdir())) / "ColectorAW" / "tmp"
             base_tmp.mkdir(parents=True, exist_ok=True)
             ts = datetime.now().strftime("%Y%m%d-%H%M%S")
             out_path = base_tmp / f"captura_{ts}.jpg"
-            ok, buf = cv2.imencode(".jpg", self._current_frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
+            ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
             if not ok:
                 return None
             out_path.write_bytes(buf.tobytes())
@@ -268,12 +327,13 @@ class App(ctk.CTk):
         return any(s in text for s in ("ok", "success", "éxito", "exito", "enviado"))
 
     # ====== Modal simple (compacto) ======
-    def _show_compact_modal(self, photo_raw, aw_raw=None):
+    def _show_compact_modal(self, photo_raw, aw_raw=None, photo_pending=False, aw_pending=False):
         """
         Modal compacto que une ambas respuestas:
-        - Control de acceso: OK / rechazado
-        - Datos de tu equipo: ENVIADOS / NO ENVIADOS
+        - Control de acceso: OK / rechazado / EN PROCESO
+        - Datos de tu equipo: ENVIADOS / NO ENVIADOS / EN PROCESO
         - Solo: Nombre, Documento, match, registrado
+        *_pending=True: el paso no terminó dentro del plazo de SALIDA.
         """
         nombre = "—"
         documento = "—"
@@ -309,11 +369,16 @@ class App(ctk.CTk):
             outer.pack(fill="both", expand=True, padx=10, pady=10)
 
             # --- Control de acceso
-            color1 = COLOR_GREEN if acceso_ok else COLOR_RED
+            if photo_pending:
+                color1, text1 = COLOR_ORANGE, "Control de acceso: EN PROCESO"
+            elif acceso_ok:
+                color1, text1 = COLOR_GREEN, "Control de acceso: OK"
+            else:
+                color1, text1 = COLOR_RED, "Control de acceso: rechazado"
             banner1 = ctk.CTkFrame(outer, corner_radius=10, fg_color=color1)
             banner1.pack(fill="x", padx=6, pady=(4, 8))
             ctk.CTkLabel(banner1,
-                         text="Control de acceso: OK" if acceso_ok else "Control de acceso: rechazado",
+                         text=text1,
                          font=("Segoe UI", 18, "bold"),
                          text_color="white").pack(padx=12, pady=8)
 
@@ -333,12 +398,17 @@ class App(ctk.CTk):
             row("registrado:", "True" if registrado else "False")
 
             # --- Datos de tu equipo
-            if equipo_ok is not None:
-                color2 = COLOR_GREEN if equipo_ok else COLOR_RED
+            if equipo_ok is not None or aw_pending:
+                if aw_pending:
+                    color2, text2 = COLOR_ORANGE, "Datos de tu equipo: EN PROCESO"
+                elif equipo_ok:
+                    color2, text2 = COLOR_GREEN, "Datos de tu equipo: ENVIADOS"
+                else:
+                    color2, text2 = COLOR_RED, "Datos de tu equipo: NO ENVIADOS"
                 banner2 = ctk.CTkFrame(outer, corner_radius=10, fg_color=color2)
                 banner2.pack(fill="x", padx=6, pady=(6, 10))
                 ctk.CTkLabel(banner2,
-                             text="Datos de tu equipo: ENVIADOS" if equipo_ok else "Datos de tu equipo: NO ENVIADOS",
+                             text=text2,
                              font=("Segoe UI", 18, "bold"),
                              text_color="white").pack(padx=12, pady=8)
 
@@ -352,7 +422,76 @@ class App(ctk.CTk):
             y = self.winfo_rooty() + (self.winfo_height() // 2) - 160
             win.geometry(f"+{x}+{y}")
 
-        self.after(0, _open)
+        _open()
+
+    def _show_receipt_modal(self, receipt: dict):
+        """Comprobante de ENTRADA optimista; se actualiza al llegar la respuesta del servidor."""
+        win = ctk.CTkToplevel(self)
+        win.title("Comprobante")
+        win.geometry("520x260")
+        win.resizable(False, False)
+        win.grab_set()
+        win.transient(self)
+
+        outer = ctk.CTkFrame(win, corner_radius=14)
+        outer.pack(fill="both", expand=True, padx=10, pady=10)
+
+        banner = ctk.CTkFrame(outer, corner_radius=10, fg_color=COLOR_ORANGE)
+        banner.pack(fill="x", padx=6, pady=(6, 10))
+        title = ctk.CTkLabel(banner, text="ENTRADA registrada: CONFIRMANDO…",
+                             font=("Segoe UI", 18, "bold"), text_color="white")
+        title.pack(padx=12, pady=10)
+
+        for lbl, val in (("Hora:", self._hora_marcacion(receipt)),
+                         ("Comprobante:", str(receipt.get("correlation_id", ""))[:8].upper())):
+            fr = ctk.CTkFrame(outer, fg_color="transparent")
+            fr.pack(fill="x", padx=16, pady=2)
+            ctk.CTkLabel(fr, text=lbl, width=120, anchor="w", text_color=COLOR_MUTED).pack(side="left")
+            ctk.CTkLabel(fr, text=val, anchor="w", font=("Segoe UI", 14, "bold")).pack(side="left", padx=(6, 0))
+        detail = ctk.StringVar(value="La confirmación del servidor llega en segundo plano.")
+        ctk.CTkLabel(outer, textvariable=detail, text_color=COLOR_MUTED).pack(pady=(8, 4))
+
+        ctk.CTkButton(outer, text="Cerrar", width=120, command=win.destroy).pack(pady=(4, 2))
+        self._receipts[receipt.get("correlation_id")] = (win, banner, title, detail)
+
+        self.update_idletasks()
+        x = self.winfo_rootx() + (self.winfo_width() // 2) - 260
+        y = self.winfo_rooty() + (self.winfo_height() // 2) - 130
+        win.geometry(f"+{x}+{y}")
+
+    @staticmethod
+    def _hora_marcacion(receipt: dict) -> str:
+        try:
+            return datetime.fromisoformat(str(receipt.get("marcado_local"))).strftime("%H:%M:%S")
+        except Exception:
+            return "—"
+
+    def _show_ayer_modal(self, equipo_ok: bool):
+        """Modal compacto solo con "Datos de tu equipo" (informe de AYER)."""
+        win = ctk.CTkToplevel(self)
+        win.title("Resultado AYER")
+        win.geometry("520x200")
+        win.resizable(False, False)
+        win.grab_set()
+        win.transient(self)
+
+        outer = ctk.CTkFrame(win, corner_radius=14)
+        outer.pack(fill="both", expand=True, padx=10, pady=10)
+
+        color = COLOR_GREEN if equipo_ok else COLOR_RED
+        banner = ctk.CTkFrame(outer, corner_radius=10, fg_color=color)
+        banner.pack(fill="x", padx=6, pady=(6, 12))
+        ctk.CTkLabel(banner,
+                     text="Datos de tu equipo: ENVIADOS" if equipo_ok else "Datos de tu equipo: NO ENVIADOS",
+                     font=("Segoe UI", 18, "bold"),
+                     text_color="white").pack(padx=12, pady=10)
+
+        ctk.CTkButton(outer, text="Cerrar", width=120, command=win.destroy).pack(pady=(4, 2))
+
+        self.update_idletasks()
+        x = self.winfo_rootx() + (self.winfo_width() // 2) - 260
+        y = self.winfo_rooty() + (self.winfo_height() // 2) - 100
+        win.geometry(f"+{x}+{y}")
 
     # ====== Modal / bloqueo ======
     def _open_progress(self, message: str = "Procesando…"):
@@ -362,7 +501,7 @@ class App(ctk.CTk):
 
         win = ctk.CTkToplevel(self)
         win.title("Enviando…")
-        win.geometry("360x140")
+        win.geometry("360x190")
         win.resizable(False, False)
         win.grab_set()
         win.transient(self)
@@ -380,11 +519,14 @@ class App(ctk.CTk):
         bar.configure(mode="indeterminate")
         bar.start()
 
-        ctk.CTkLabel(frm, text="Por favor espera…", text_color=COLOR_MUTED).pack()
+        self._progress_detail = ctk.StringVar(value="Por favor espera…")
+        ctk.CTkLabel(frm, textvariable=self._progress_detail, text_color=COLOR_MUTED).pack()
+        ctk.CTkButton(frm, text="Cancelar", width=100, fg_color="transparent", border_width=1,
+                      text_color=COLOR_MUTED, command=self._cancel_job).pack(pady=(8, 0))
 
         self.update_idletasks()
         x = self.winfo_rootx() + (self.winfo_width() // 2) - 180
-        y = self.winfo_rooty() + (self.winfo_height() // 2) - 70
+        y = self.winfo_rooty() + (self.winfo_height() // 2) - 95
         win.geometry(f"+{x}+{y}")
 
         self._progress_win = win
@@ -419,6 +561,7 @@ class App(ctk.CTk):
                 pass
         self._progress_win = None
         self._progress_bar = None
+        self._progress_detail = None
         self._set_busy(False)
         self._disable_close(False)
         self._busy = False
@@ -429,8 +572,44 @@ class App(ctk.CTk):
         else:
             self.protocol("WM_DELETE_WINDOW", self._on_close)
 
+    # ====== Trabajos (hilo de Tk) ======
+    def _pump_jobs(self):
+        self._jobs.drain()
+        self.after(50, self._pump_jobs)
+
+    def _on_job_progress(self, job: Job, ev: dict):
+        if self._progress_detail is None or job is not self._jobs.current:
+            return
+        text = str(ev.get("phase", ""))
+        if ev.get("total"):
+            text += f" · bucket {ev.get('done')}/{ev.get('total')}"
+            if ev.get("events"):
+                text += f" · {ev['events']} eventos"
+        self._progress_detail.set(text)
+
+    def _cancel_job(self):
+        if self._jobs.cancel_current() and self._progress_detail is not None:
+            self._progress_detail.set("Cancelando…")
+
+    def _on_job_done(self, job: Job, result, error):
+        self._close_progress()
+        if isinstance(error, Cancelled):
+            self.status.set("Envío cancelado.")
+        elif error is not None:
+            self.status.set("Ocurrió un error inesperado.")
+            if hasattr(ctk, "CTkMessagebox"):
+                ctk.CTkMessagebox(title="Error", message=str(error))
+
     # ====== Acciones ======
+    def _busy_notice(self):
+        # Tras un plazo vencido el trabajo sigue en curso hasta que terminan sus pasos
+        if not self._busy:
+            self.status.set("El envío anterior aún termina en segundo plano; inténtalo en unos segundos.")
+
     def on_click_tipo(self, tipo: str):
+        if self._jobs.busy:
+            self._busy_notice()
+            return
         txt = "¿Deseas enviar ENTRADA con la captura actual?" if tipo == "entrada" else \
               "¿Deseas enviar SALIDA con la captura actual (también enviará el reporte AW)?"
         if hasattr(ctk, "CTkMessagebox"):
@@ -441,7 +620,15 @@ class App(ctk.CTk):
             if not self._legacy_confirm(txt):
                 return
 
-        photo_path = self._capture_to_tempfile()
+        # Control local (nitidez, cámara congelada/tapada, rostro) antes de tocar la red
+        check = assess_frames(self._frames.frames(), self.settings)
+        if not check.ok:
+            self.status.set(check.reason)
+            if hasattr(ctk, "CTkMessagebox"):
+                ctk.CTkMessagebox(title="Genika Control", message=check.reason, icon="warning")
+            return
+
+        photo_path = self._capture_to_tempfile(check.frame)
         if not photo_path or not photo_path.exists():
             if hasattr(ctk, "CTkMessagebox"):
                 ctk.CTkMessagebox(title="Genika Control",
@@ -449,10 +636,29 @@ class App(ctk.CTk):
                                   icon="warning")
             return
 
+        # ENTRADA optimista: la foto queda en pendientes y el comprobante sale ya; si no se
+        # pudo guardar, sigue el envío normal con espera
+        if tipo == "entrada" and self._clockin is not None:
+            receipt = self._clockin.commit(photo_path)
+            if receipt is not None:
+                try:
+                    photo_path.unlink(missing_ok=True)
+                except Exception:
+                    pass
+                self.status.set(f"ENTRADA registrada a las {self._hora_marcacion(receipt)}; "
+                                "confirmando con el servidor…")
+                self._show_receipt_modal(receipt)
+                return
+
         self._open_progress("Enviando foto y reporte")
-        threading.Thread(target=self._do_send_tipo, args=(tipo, photo_path), daemon=True).start()
+        if self._jobs.submit(f"marcacion-{tipo}", self._do_send_tipo, tipo, photo_path,
+                             on_done=self._on_job_done) is None:
+            self._close_progress()
 
     def on_click_ayer(self):
+        if self._jobs.busy:
+            self._busy_notice()
+            return
         txt = "¿Enviar informe de ActivityWatch de AYER? (sin foto)"
         if hasattr(ctk, "CTkMessagebox"):
             if ctk.CTkMessagebox(title="Confirmar", message=txt, icon="question",
@@ -462,105 +668,167 @@ class App(ctk.CTk):
             if not self._legacy_confirm(txt):
                 return
         self._open_progress("Enviando informe de AYER")
-        threading.Thread(target=self._do_send_ayer, daemon=True).start()
+        if self._jobs.submit("informe-ayer", self._do_send_ayer, on_done=self._on_job_done) is None:
+            self._close_progress()
+
+    def _on_scheduled_send(self, tipo: str, ok: bool, msg: str):
+        # Hilo del programador: Tk no es seguro entre hilos (tampoco after), así que el
+        # texto pasa por la cola que _pump_jobs vacía en el hilo de Tk
+        texto = "Informe de ayer" if tipo == "ayer" else "Informe del día"
+        estado = "enviado automáticamente." if ok else "quedó en pendientes; se reintentará."
+        self._jobs.dispatch(self.status.set, f"{texto} {estado}")
+
+    def _on_clockin_result(self, receipt: dict, result: str, data, msg: str):
+        # Hilo de la cola de ENTRADA: la UI se toca solo desde el hilo de Tk (vía _pump_jobs)
+        self._jobs.dispatch(self._apply_clockin_result, receipt, result, data, msg)
+
+    def _apply_clockin_result(self, receipt: dict, result: str, data, msg: str):
+        hora = self._hora_marcacion(receipt)
+        view = self._receipts.get(receipt.get("correlation_id"))
+        if view is not None and not view[0].winfo_exists():
+            self._receipts.pop(receipt.get("correlation_id"), None)
+            view = None
+        if result == "rejected":
+            # El servidor no la aceptó y reintentarla igual no sirve: hay que marcar de nuevo
+            self._receipts.pop(receipt.get("correlation_id"), None)
+            self.status.set(f"ENTRADA de las {hora} no registrada: {msg} Vuelve a marcar.")
+            if view is not None:
+                win, banner, title, detail = view
+                banner.configure(fg_color=COLOR_RED)
+                title.configure(text="ENTRADA no registrada")
+                detail.set(f"{msg} Vuelve a marcar la ENTRADA.")
+            return
+        if result != "ok":
+            self.status.set(f"ENTRADA de las {hora} guardada; sin confirmar aún. Se reintentará.")
+            if view is not None:
+                view[3].set("Sin respuesta del servidor; se reintentará en segundo plano.")
+            return
+
+        self._receipts.pop(receipt.get("correlation_id"), None)
+        photo_raw = data if data is not None else msg
+        acceso_ok = self._compute_photo_success(photo_raw) if isinstance(photo_raw, dict) \
+            else self._truthy(photo_raw)
+        nombre = ""
+        if isinstance(photo_raw, dict):
+            nombre = " ".join(str(photo_raw.get(k, "")).strip() for k in ("nombres", "apellidos")).strip()
+        estado = "confirmada" if acceso_ok else "rechazada"
+        self.status.set(f"ENTRADA de las {hora} {estado}" + (f": {nombre}." if nombre else "."))
+        if view is not None:
+            win, banner, title, detail = view
+            banner.configure(fg_color=COLOR_GREEN if acceso_ok else COLOR_RED)
+            title.configure(text="ENTRADA confirmada" if acceso_ok else "ENTRADA rechazada")
+            detail.set(nombre or ("" if acceso_ok else "El servidor no reconoció la foto."))
+        elif not acceso_ok:
+            # El comprobante ya se cerró: el rechazo se avisa con el modal de siempre
+            self._show_compact_modal(photo_raw)
 
     def _legacy_confirm(self, txt: str) -> bool:
         import tkinter.messagebox as mb
         return mb.askyesno("Confirmar", txt)
 
-    # ====== LÓGICA ======
-    def _do_send_tipo(self, tipo: str, photo_path: Path):
-        try:
-            cid = str(uuid.uuid4())
+    # ====== LÓGICA (hilos del JobRunner; a la UI solo vía job.ui / job.progress) ======
+    def _do_send_tipo(self, job: Job, tipo: str, photo_path: Path):
+        """
+        Foto y (en SALIDA) reporte corren en paralelo con un mismo correlation_id y un
+        plazo total compartido (salida_deadline_sec). Al vencer o al cancelar, el modal se
+        muestra con lo que haya respondido; lo que siga en curso termina en segundo plano
+        (y si falla, queda en pendientes como siempre).
+        """
+        cid = str(uuid.uuid4())
+        deadline = time.monotonic() + float(self.settings.get("salida_deadline_sec", 40))
+
+        # 1) Control de acceso (Foto)
+        job.phase("Enviando foto")
+        fut_foto = job.spawn(self._step_photo, tipo, photo_path, cid, deadline)
+
+        # 2) Datos de tu equipo (Productividad) si es salida
+        fut_aw = None
+        if tipo == "salida":
+            fut_aw = job.spawn(self._step_report, job, cid, deadline)
+
+        futs = [f for f in (fut_foto, fut_aw) if f is not None]
+        # Espera en tramos cortos para atender la cancelación
+        while not all(f.done() for f in futs) and self._remaining(deadline) > 0 and not job.cancelled:
+            wait(futs, timeout=min(0.2, self._remaining(deadline)))
+
+        photo_raw = None
+        if fut_foto.done():
+            ok_foto, msg_foto, data_foto = fut_foto.result()
+            photo_raw = data_foto if data_foto is not None else msg_foto
+
+        aw_raw = None
+        aw_pending = False
+        if fut_aw is not None:
+            if fut_aw.done() and not isinstance(fut_aw.exception(), Cancelled):
+                ok_aw, msg_aw = fut_aw.result()
+                aw_raw = msg_aw  # literal / lo que devuelva
+            else:
+                aw_pending = not fut_aw.done()
+
+        # 3) Un único modal compacto (parcial si algo sigue en curso)
+        if job.cancelled:
+            job.ui(self.status.set, "Cancelado; lo que ya salió termina en segundo plano.")
+        elif all(f.done() for f in futs):
+            job.ui(self.status.set, "Respuesta(s) recibida(s).")
+        else:
+            job.ui(self.status.set, "Plazo agotado; lo pendiente sigue en segundo plano.")
+        job.ui(self._show_compact_modal, photo_raw, aw_raw, not fut_foto.done(), aw_pending)
 
-            # 1) Control de acceso (Foto)
-            ok_foto, msg_foto, data_foto = send_photo(
-                settings=self.settings,
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    def _with_timeout(self, deadline: float) -> dict:
+        # Ningún paso puede esperar más que lo que queda del plazo total
+        timeout = min(float(self.settings["request_timeout_sec"]), max(1.0, self._remaining(deadline)))
+        return {**self.settings, "request_timeout_sec": timeout}
+
+    def _step_photo(self, tipo: str, photo_path: Path, cid: str, deadline: float):
+        try:
+            return send_photo(
+                settings=self._with_timeout(deadline),
                 photo_path=photo_path,
                 tipo=tipo,
                 correlation_id=cid,
                 umbral=None,
                 extra_fields=None
             )
-
-            # 2) Datos de tu equipo (Productividad) si es salida
-            aw_raw = None
-            if tipo == "salida":
-                self.after(0, lambda: self.status.set("Preparando reporte de productividad…"))
-                payload = build_daily_payload(self.settings, meta_extra={
-                    "correlation_id": cid,
-                    "marcacion_tipo": "salida",
-                })
-                self.after(0, lambda: self.status.set("Enviando reporte de productividad…"))
-                ok_aw, msg_aw = send_payload(self.settings, payload)
-                aw_raw = msg_aw  # literal / lo que devuelva
-
-            # 3) Un único modal compacto
-            self.after(0, lambda: self.status.set("Respuesta(s) recibida(s)."))
-            self._show_compact_modal(
-                photo_raw=(data_foto if data_foto is not None else msg_foto),
-                aw_raw=aw_raw if tipo == "salida" else None
-            )
-
-        except Exception as e:
-            self.after(0, lambda: self.status.set("Ocurrió un error inesperado."))
-            if hasattr(ctk, "CTkMessagebox"):
-                ctk.CTkMessagebox(title="Error", message=str(e))
         finally:
             try:
                 photo_path.unlink(missing_ok=True)
             except Exception:
                 pass
-            self.after(0, self._close_progress)
 
-    def _do_send_ayer(self):
-        try:
-            cid = str(uuid.uuid4())
-            self.after(0, lambda: self.status.set("Preparando reporte de AYER…"))
+    def _step_report(self, job: Job, cid: str, deadline: float):
+        with profiling.maybe_profile(self.settings, "salida") as prof:
+            job.phase("Preparando reporte de productividad")
+            payload = build_today_payload(self._with_timeout(deadline), self._rolling, meta_extra={
+                "correlation_id": cid,
+                "marcacion_tipo": "salida",
+            }, progress=job.progress)
+            job.phase("Enviando reporte de productividad")
+            result = send_payload(self._with_timeout(deadline), payload)
+        self._report_profile(job, prof)
+        return result
+
+    def _report_profile(self, job: Job, prof):
+        if prof and prof.get("path"):
+            job.ui(self.status.set, f"Perfil guardado: {prof['path']}")
+
+    def _do_send_ayer(self, job: Job):
+        cid = str(uuid.uuid4())
+        with profiling.maybe_profile(self.settings, "ayer") as prof:
+            job.phase("Preparando reporte de AYER")
             payload = build_yesterday_payload(self.settings, meta_extra={
                 "correlation_id": cid,
                 "marcacion_tipo": "salida_ayer",
-            })
-            self.after(0, lambda: self.status.set("Enviando reporte de AYER…"))
+            }, progress=job.progress)
+            job.phase("Enviando reporte de AYER")
             ok_aw, msg_aw = send_payload(self.settings, payload)
 
-            # Modal compacto solo con "Datos de tu equipo"
-            equipo_ok = self._compute_aw_success(msg_aw)
-
-            def _open():
-                win = ctk.CTkToplevel(self)
-                win.title("Resultado AYER")
-                win.geometry("520x200")
-                win.resizable(False, False)
-                win.grab_set()
-                win.transient(self)
-
-                outer = ctk.CTkFrame(win, corner_radius=14)
-                outer.pack(fill="both", expand=True, padx=10, pady=10)
-
-                color = COLOR_GREEN if equipo_ok else COLOR_RED
-                banner = ctk.CTkFrame(outer, corner_radius=10, fg_color=color)
-                banner.pack(fill="x", padx=6, pady=(6, 12))
-                ctk.CTkLabel(banner,
-                             text="Datos de tu equipo: ENVIADOS" if equipo_ok else "Datos de tu equipo: NO ENVIADOS",
-                             font=("Segoe UI", 18, "bold"),
-                             text_color="white").pack(padx=12, pady=10)
-
-                ctk.CTkButton(outer, text="Cerrar", width=120, command=win.destroy).pack(pady=(4, 2))
-
-                self.update_idletasks()
-                x = self.winfo_rootx() + (self.winfo_width() // 2) - 260
-                y = self.winfo_rooty() + (self.winfo_height() // 2) - 100
-                win.geometry(f"+{x}+{y}")
-            self.after(0, _open)
-
-            self.after(0, lambda: self.status.set("Respuesta recibida (AYER)."))
-        except Exception as e:
-            self.after(0, lambda: self.status.set("Ocurrió un error inesperado."))
-            if hasattr(ctk, "CTkMessagebox"):
-                ctk.CTkMessagebox(title="Error", message=str(e))
-        finally:
-            self.after(0, self._close_progress)
+        job.ui(self._show_ayer_modal, self._compute_aw_success(msg_aw))
+        job.ui(self.status.set, "Respuesta recibida (AYER).")
+        self._report_profile(job, prof)
 
     # ====== util ======
     def _set_busy(self, busy: bool, msg: str | None = None):
@@ -578,6 +846,14 @@ class App(ctk.CTk):
             return
         try:
             self._running = False
+            self._jobs.shutdown()
+            if self._rolling is not None:
+                self._rolling.stop()
+            self._scheduler.stop()
+            if self._clockin is not None:
+                self._clockin.stop()
+            self._metrics.stop()
+            self._summary_server.stop()
             if self._cap is not None:
                 self._cap.release()
         except Exception:
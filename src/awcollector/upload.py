@@ -0,0 +1,201 @@
+# C:\Users\gcave\Desktop\ColectorAW\src\awcollector\upload.py
+from __future__ import annotations
+import io
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, Optional, Tuple, Union
+
+import httpx
+
+from .config import CACHE_DIR
+
+# Sesiones de subida en curso: cache/uploads/<sha256>.json
+UPLOADS_DIR = CACHE_DIR / "uploads"
+
+# Endpoints que respondieron que no soportan subida por partes (se recuerda en el proceso)
+_UNSUPPORTED: set = set()
+
+Source = Union[Path, bytes]
+
+
+class UploadUnsupported(Exception):
+    """
+    La subida por partes no está disponible (el servidor no implementa /uploads, lo
+    rechazó o perdió la sesión): el llamador debe usar la subida de una sola petición.
+    """
+
+
+def should_chunk(settings: Dict[str, Any], size: int, url: str) -> bool:
+    """True si el cuerpo es lo bastante grande para subirse por partes (y el servidor lo admite)."""
+    if not settings.get("chunked_upload_enabled", True):
+        return False
+    if _uploads_url(url) in _UNSUPPORTED:
+        return False
+    min_bytes = float(settings.get("chunked_upload_min_mb", 2)) * 1024 * 1024
+    return size >= min_bytes
+
+
+def _uploads_url(url: str) -> str:
+    return url.rstrip("/") + "/uploads"
+
+
+def _describe(source: Source) -> Tuple[int, str]:
+    """Tamaño y sha256 del contenido (leyendo el archivo por bloques)."""
+    h = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray)):
+        h.update(source)
+        return len(source), h.hexdigest()
+    size = 0
+    with open(source, "rb") as fh:
+        for block in iter(lambda: fh.read(1024 * 1024), b""):
+            h.update(block)
+            size += len(block)
+    return size, h.hexdigest()
+
+
+def _open(source: Source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return open(source, "rb")
+
+
+# ====== estado local de la sesión ======
+
+def _session_path(digest: str) -> Path:
+    return UPLOADS_DIR / f"{digest}.json"
+
+
+def _load_session(digest: str, uploads_url: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(_session_path(digest).read_text(encoding="utf-8"))
+        if data.get("url") == uploads_url and data.get("upload_id"):
+            return data
+    except Exception:
+        pass
+    return None
+
+
+def _save_session(digest: str, data: Dict[str, Any]) -> None:
+    try:
+        UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+        path = _session_path(digest)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def _drop_session(digest: str) -> None:
+    try:
+        _session_path(digest).unlink(missing_ok=True)
+    except Exception:
+        pass
+
+
+# ====== protocolo ======
+
+def _remote_offset(client: httpx.Client, uploads_url: str, upload_id: str) -> Optional[int]:
+    """Offset confirmado por el servidor para una sesión existente (None si ya no existe)."""
+    r = client.get(f"{uploads_url}/{upload_id}")
+    if r.status_code in (404, 410):
+        return None
+    r.raise_for_status()
+    return int(r.json().get("offset", 0))
+
+
+def chunked_upload(
+    client: httpx.Client,
+    url: str,
+    source: Source,
+    filename: str,
+    content_type: str,
+    fields: Optional[Dict[str, str]] = None,
+    chunk_size: int = 512 * 1024,
+    headers: Optional[Dict[str, str]] = None,
+) -> httpx.Response:
+    """
+    Sube `source` por partes y devuelve la respuesta final (la misma que daría la subida
+    de una sola petición). Protocolo contra `<url>/uploads`:
+    - POST /uploads {filename, size, sha256, content_type, fields} → {upload_id, offset}
+    - PUT /uploads/<id> con Content-Range → {offset}   (acuse por parte)
+    - GET /uploads/<id> → {offset}                     (reanudar tras un fallo)
+    - POST /uploads/<id>/complete → respuesta del ingest
+    La sesión se guarda en cache/uploads/, así un reintento posterior continúa desde el
+    último offset confirmado en vez de volver a subir todo. Una parte que falla (error
+    de red o de HTTP) se reintenta una vez desde el offset que informa GET; si vuelve a
+    fallar se lanza el error. Lanza UploadUnsupported si POST /uploads no responde 2xx
+    (404/405/501 se recuerdan: sin /uploads en el resto del proceso) o si la sesión ya
+    no existe en el servidor.
+    """
+    uploads_url = _uploads_url(url)
+    size, digest = _describe(source)
+    hdrs = dict(headers or {})
+
+    offset: Optional[int] = None
+    session = _load_session(digest, uploads_url)
+    if session is not None:
+        offset = _remote_offset(client, uploads_url, session["upload_id"])
+    if offset is None:
+        r = client.post(uploads_url, headers=hdrs, json={
+            "filename": filename,
+            "size": size,
+            "sha256": digest,
+            "content_type": content_type,
+            "fields": dict(fields or {}),
+        })
+        if not 200 <= r.status_code < 300:
+            if r.status_code in (404, 405, 501):
+                _UNSUPPORTED.add(uploads_url)
+            # 401/403/5xx: esta vez por la subida de una sola petición, que da su propio estado
+            raise UploadUnsupported(f"{uploads_url} → {r.status_code}")
+        body = r.json()
+        session = {"url": uploads_url, "upload_id": str(body["upload_id"]), "size": size}
+        offset = int(body.get("offset", 0))
+        _save_session(digest, session)
+
+    upload_id = session["upload_id"]
+    resyncs = 0
+    retried = False
+    with _open(source) as fh:
+        while offset < size:
+            fh.seek(offset)
+            chunk = fh.read(chunk_size)
+            last = offset + len(chunk) - 1
+            try:
+                r = client.put(
+                    f"{uploads_url}/{upload_id}",
+                    content=chunk,
+                    headers={**hdrs,
+                             "Content-Type": "application/octet-stream",
+                             "Content-Range": f"bytes {offset}-{last}/{size}"},
+                )
+            except httpx.TransportError:
+                if retried:
+                    raise
+                r = None
+            if r is not None and r.status_code == 409 and resyncs < 3:
+                # Offset desfasado (p.ej. la parte anterior llegó pero se perdió el acuse)
+                resyncs += 1
+                offset = int(r.json().get("offset", offset))
+                continue
+            if r is None or not 200 <= r.status_code < 300:
+                if retried:
+                    r.raise_for_status()
+                # Parte fallida: un reintento, desde lo que el servidor confirma tener
+                retried = True
+                offset = _remote_offset(client, uploads_url, upload_id)
+                if offset is None:
+                    _drop_session(digest)
+                    raise UploadUnsupported(f"{uploads_url}/{upload_id} ya no existe")
+                continue
+            offset = int(r.json().get("offset", last + 1))
+            resyncs = 0
+            retried = False
+
+    r = client.post(f"{uploads_url}/{upload_id}/complete", headers=hdrs)
+    if 200 <= r.status_code < 300:
+        _drop_session(digest)
+    return r